@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Directory (inside static folder) with fingerprinted files and the manifest - see 'reminder/assets.py'
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Files served to browsers (sources, licenses etc. are skipped)
+ASSET_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.png', '.jpg', '.gif', '.ico', '.woff', '.woff2', '.ttf'}
+# Text files worth precompressing
+COMPRESSED_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.ico', '.ttf'}
+
+
+def fingerprinted_name(path, content):
+    """
+    Add digest of the file's content to the file's name, e.g. 'js/notify.js' -> 'js/notify.1a2b3c4d5e.js'.
+    """
+    digest = hashlib.md5(content).hexdigest()[:10]
+    return path.with_name(f'{path.stem}.{digest}{path.suffix}')
+
+
+def write_variants(target, content):
+    """
+    Write precompressed variants of the file (only if they are smaller than the original).
+    Return list of written encodings.
+    """
+    encodings = []
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            target.with_name(target.name + '.br').write_bytes(compressed)
+            encodings.append('br')
+    # mtime=0 - the same input gives the same output (reproducible builds)
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        target.with_name(target.name + '.gz').write_bytes(compressed)
+        encodings.append('gzip')
+    return encodings
+
+
+def build_assets(static_dir):
+    """
+    Copy static files to '<static_dir>/dist' with fingerprinted names, add precompressed variants
+    and write the manifest: {source path: {'path': fingerprinted path, 'encodings': [...]}}.
+    """
+    dist_dir = static_dir / DIST_DIR
+    if dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    manifest = {}
+    for source in sorted(static_dir.rglob('*')):
+        if not source.is_file() or source.suffix.lower() not in ASSET_EXTENSIONS:
+            continue
+        path = source.relative_to(static_dir)
+        content = source.read_bytes()
+        target = dist_dir / fingerprinted_name(path, content)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        encodings = write_variants(target, content) if source.suffix.lower() in COMPRESSED_EXTENSIONS else []
+        manifest[path.as_posix()] = {'path': target.relative_to(static_dir).as_posix(), 'encodings': encodings}
+    (dist_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Script builds fingerprinted and precompressed static assets')
+    parser.add_argument('-s', '--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               'reminder', 'static'),
+                        help='Static files directory (default: reminder/static)')
+    args = parser.parse_args()
+
+    if brotli is None:
+        print('Brotli package is not installed - only gzip variants will be built')
+    assets = build_assets(Path(args.static))
+    compressed = sum(1 for asset in assets.values() if asset['encodings'])
+    print(f'Built {len(assets)} assets ({compressed} precompressed) in {Path(args.static) / DIST_DIR}')
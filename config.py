@@ -2,34 +2,82 @@ import os
 from pathlib import Path
 
 from dotenv import load_dotenv
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 
 
 basedir = Path(__file__).resolve().parent
-load_dotenv(os.path.join(basedir, '.env'))
-# Set base dir for SQLite db
-if os.environ.get('APPLICATION_MODE') == 'development':
-    db_url = os.environ.get('DEV_DATABASE_URL')
-else:
-    db_url = os.environ.get('PROD_DATABASE_URL')
-if db_url.startswith('sqlite:///'):
-    db_url = f'sqlite:///{basedir}/{db_url.split("///")[1]}'
+
+
+def load_environment():
+    """
+    Load variables from '.env' file (variables already set in the environment are kept).
+    """
+    load_dotenv(os.path.join(basedir, '.env'))
+
+
+def database_url():
+    """
+    Return the database URL of the application mode (SQLite db path is relative to the base dir).
+    """
+    if os.environ.get('APPLICATION_MODE') == 'development':
+        db_url = os.environ.get('DEV_DATABASE_URL')
+    else:
+        db_url = os.environ.get('PROD_DATABASE_URL')
+    if db_url.startswith('sqlite:///'):
+        db_url = f'sqlite:///{basedir}/{db_url.split("///")[1]}'
+    return db_url
+
+
+def load_config():
+    """
+    Load environment and return config of the application mode. Called by 'create_app' - importing this module
+    (e.g. by commands which don't create the app) doesn't read the environment.
+    """
+    load_environment()
+    # Distinguish whether production or development database should be used
+    if os.environ.get('APPLICATION_MODE') == 'production':
+        return ProdConfig()
+    return DevConfig()
+
+
+def engine_options(url):
+    """
+    Connection pool options for the database engine (shared by the app and APScheduler job store).
+    SQLite databases use SQLAlchemy defaults.
+    """
+    if url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        # How long (in seconds) to wait for a free connection
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        # Connections older than indicated number of seconds are replaced
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        # Test connections on checkout - stale connections (e.g. after db failover) are replaced transparently
+        'pool_pre_ping': False if os.environ.get('DB_POOL_PRE_PING') == 'False' else True,
+    }
+    # Statement timeout (in milliseconds, PostgreSQL only)
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout and url.startswith('postgres'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
 
 
 class Config:
     """
-    Set base Flask configuration vars.
+    Set base Flask configuration vars. Vars read from the environment are set when the config object is created
+    (see 'load_config').
     """
     # General Config
     DEBUG = False
     TESTING = False
-    SECRET_KEY = os.environ.get('SECRET_KEY')
     JSONIFY_PRETTYPRINT_REGULAR = True
     LOGS_DIR = basedir.joinpath('logs')
-    ELASTICSEARCH_URL = os.environ.get('ELASTICSEARCH_URL')
     # Cookies lifetime is 1800 sek (30 min).
     PERMANENT_SESSION_LIFETIME = 1800
     STATIC_FOLDER = 'static'
+    # Manifest of fingerprinted static files built by 'build_assets.py' (static files are served as usual without it)
+    STATIC_ASSETS_MANIFEST = basedir.joinpath('reminder', 'static', 'dist', 'manifest.json')
     # Cache Config
     CACHE_TYPE = 'filesystem'
     CACHE_DIR = basedir.joinpath('tmp')
@@ -37,25 +85,84 @@ class Config:
     # Database Config
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # Email Config
-    MAIL_SERVER = os.environ.get('MAIL_SERVER')
-    MAIL_PORT = os.environ.get('MAIL_PORT')
     MAIL_SECURITY = 'tls'
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
-    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_USERNAME')
-    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
-    # Check (validate) user's email address domain
-    CHECK_EMAIL_DOMAIN = True if os.environ.get('CHECK_EMAIL_DOMAIN') == 'True' else False
+
+    def __init__(self):
+        self.SECRET_KEY = os.environ.get('SECRET_KEY')
+        self.ELASTICSEARCH_URL = os.environ.get('ELASTICSEARCH_URL')
+        # Max number of calendar/events list responses cached by each app process
+        self.EVENTS_CACHE_SIZE = int(os.environ.get('EVENTS_CACHE_SIZE', 256))
+        # Max number of users' calendar feeds (.ics) cached by each app process
+        self.CALENDAR_FEED_CACHE_SIZE = int(os.environ.get('CALENDAR_FEED_CACHE_SIZE', 64))
+        # How long (in seconds) API tokens are valid (30 days by default)
+        self.API_TOKEN_MAX_AGE = int(os.environ.get('API_TOKEN_MAX_AGE', 2592000))
+        # Max number of operations in one bulk API request
+        self.API_BULK_LIMIT = int(os.environ.get('API_BULK_LIMIT', 500))
+        # Run scheduled jobs in app process - set 'False' for web processes when jobs are run by 'worker.py'
+        self.SCHEDULER_ENABLED = False if os.environ.get('SCHEDULER_ENABLED') == 'False' else True
+        # How often (in seconds) the worker checks the job store for jobs added or changed by web processes
+        self.SCHEDULER_POLL_INTERVAL = int(os.environ.get('SCHEDULER_POLL_INTERVAL', 10))
+        # Logs older than indicated number of days are deleted daily by the worker (0 - logs are never deleted)
+        self.LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', 0))
+        # Database Config
+        self.SQLALCHEMY_DATABASE_URI = database_url()
+        self.SQLALCHEMY_ENGINE_OPTIONS = engine_options(self.SQLALCHEMY_DATABASE_URI)
+        # Read replicas of the db (comma separated URLs) used by read-only views
+        self.REPLICA_DATABASE_URLS = [url.strip() for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',')
+                                      if url.strip()]
+        # How long (in seconds) after user's own commit the user's reads go to the primary db (max replication lag)
+        self.REPLICA_READ_YOUR_WRITES = int(os.environ.get('REPLICA_READ_YOUR_WRITES', 5))
+        # Count queries and db time of each request (response headers) and log statements repeated by one request
+        self.SQL_STATS_ENABLED = True if os.environ.get('SQL_STATS_ENABLED') == 'True' else False
+        # Statement run by one request at least indicated number of times is logged as possible N+1 query
+        self.SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+        # How often (in seconds) buffered User.last_seen timestamps are written to the db
+        self.LAST_SEEN_RESOLUTION = int(os.environ.get('LAST_SEEN_RESOLUTION', 60))
+        # How long (in seconds) logged in user's data is cached by each app process
+        self.IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+        # Number of reverse proxies in front of the app - X-Forwarded-* headers set by them are trusted
+        # (0 - no proxy)
+        self.PROXY_TRUSTED_HOPS = int(os.environ.get('PROXY_TRUSTED_HOPS', 0))
+        # Failed logins per client IP and per account are counted within a sliding window (in seconds)
+        self.LOGIN_FAILURE_WINDOW = int(os.environ.get('LOGIN_FAILURE_WINDOW', 900))
+        # User's account is blocked after indicated number of failed logins within the window (counted by each app
+        # process - with N processes an attacker gets at most N times as many attempts before the account is blocked)
+        self.LOGIN_USER_MAX_FAILURES = int(os.environ.get('LOGIN_USER_MAX_FAILURES', 3))
+        # Login attempts from client IP are rejected after indicated number of failed logins within the window
+        self.LOGIN_IP_MAX_FAILURES = int(os.environ.get('LOGIN_IP_MAX_FAILURES', 20))
+        # Max number of client IPs and accounts tracked by each app process (keys without recent failures are
+        # dropped first)
+        self.LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get('LOGIN_THROTTLE_MAX_KEYS', 100000))
+        # How often (in seconds) failed logins are written to the auth log (one summary record per client IP)
+        self.LOGIN_AUDIT_INTERVAL = int(os.environ.get('LOGIN_AUDIT_INTERVAL', 60))
+        # Email Config
+        self.MAIL_SERVER = os.environ.get('MAIL_SERVER')
+        self.MAIL_PORT = os.environ.get('MAIL_PORT')
+        self.MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+        self.MAIL_DEFAULT_SENDER = os.environ.get('MAIL_USERNAME')
+        self.MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+        # Check (validate) user's email address domain
+        self.CHECK_EMAIL_DOMAIN = True if os.environ.get('CHECK_EMAIL_DOMAIN') == 'True' else False
+        # Max time (in seconds) of email domain's MX record lookup
+        self.MX_RESOLVE_TIMEOUT = float(os.environ.get('MX_RESOLVE_TIMEOUT', 3))
+        # Max number of email domains' MX lookup results cached by each app process
+        self.MX_CACHE_SIZE = int(os.environ.get('MX_CACHE_SIZE', 4096))
+        # Number of processes (per app process) which hash and verify passwords (0 - hash in the request's thread)
+        self.PASSWORD_POOL_PROCESSES = int(os.environ.get('PASSWORD_POOL_PROCESSES', 1))
+        # Niceness added to the password hashing processes (lower CPU priority than the app workers)
+        self.PASSWORD_POOL_NICE = int(os.environ.get('PASSWORD_POOL_NICE', 10))
+        # Max number of password operations waiting for a free hashing process
+        self.PASSWORD_POOL_QUEUE = int(os.environ.get('PASSWORD_POOL_QUEUE', 16))
+        # Max time (in seconds) of password operation - after that the request is rejected with 503
+        self.PASSWORD_POOL_TIMEOUT = float(os.environ.get('PASSWORD_POOL_TIMEOUT', 5))
+        # Password hash method, e.g. 'pbkdf2:sha256:260000' (see 'flask passwords calibrate')
+        self.PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
 
 
 class ProdConfig(Config):
     """
     Set Flask configuration vars for production.
     """
-    SQLALCHEMY_DATABASE_URI = db_url
-    # Apscheduler Config
-    SCHEDULER_JOBSTORES = {
-        'default': SQLAlchemyJobStore(url=db_url)
-    }
 
 
 class DevConfig(Config):
@@ -63,12 +170,8 @@ class DevConfig(Config):
     Set Flask configuration vars for development.
     """
     DEBUG = True
-    # SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL')
-    SQLALCHEMY_DATABASE_URI = db_url
-    # Apscheduler Config
-    SCHEDULER_JOBSTORES = {
-        'default': SQLAlchemyJobStore(url=db_url)
-    }
+    # Serve source static files - changes are visible without rebuilding assets
+    STATIC_ASSETS_MANIFEST = None
 
 
 class TestConfig(Config):
@@ -79,8 +182,3 @@ class TestConfig(Config):
     LOGIN_DISABLED = True
     DEBUG = True
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = db_url
-    # Apscheduler Config
-    SCHEDULER_JOBSTORES = {
-        'default': SQLAlchemyJobStore(url=db_url)
-    }
\ No newline at end of file
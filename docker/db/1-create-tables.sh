@@ -2,6 +2,7 @@
 set -e
 
 psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
+    DROP TABLE IF EXISTS "event_exception";
     DROP TABLE IF EXISTS "event";
     DROP TABLE IF EXISTS "log";
     DROP TABLE IF EXISTS "notification";
@@ -9,6 +10,9 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
     DROP TABLE IF EXISTS "user";
     DROP TABLE IF EXISTS "user_to_event";
     DROP TABLE IF EXISTS "apscheduler_jobs";
+    DROP TABLE IF EXISTS "schema_version";
+    DROP TABLE IF EXISTS "dashboard_counter";
+    DROP TABLE IF EXISTS "event_daily_stat";
 
     CREATE TABLE "role" (
       "id" SERIAL NOT NULL,
@@ -34,6 +38,7 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
       UNIQUE ("email"),
       FOREIGN KEY("role_id") REFERENCES "role"("id")
     );
+    CREATE INDEX "ix_user_role_lower_username" ON "user" ("role_id", lower("username"), "id");
 
     CREATE TABLE "event" (
       "id" SERIAL NOT NULL,
@@ -48,6 +53,9 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
       "author_uid" INT,
       "notification_sent" BOOLEAN,
       "is_active" BOOLEAN,
+      "recurrence" VARCHAR(255),
+      "recurrence_end" TIMESTAMP,
+      "notified_until" TIMESTAMP,
       PRIMARY KEY("id"),
       FOREIGN KEY("author_uid") REFERENCES "user"("id")
     );
@@ -55,6 +63,29 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
     CREATE INDEX "ix_event_time_event_start" ON "event" ("time_event_start");
     CREATE INDEX "ix_event_time_event_stop" ON "event" ("time_event_stop");
     CREATE INDEX "ix_event_time_notify" ON "event" ("time_notify");
+    CREATE INDEX "ix_event_active_stop_start" ON "event" ("is_active", "time_event_stop", "time_event_start");
+    CREATE INDEX "ix_event_start_id" ON "event" ("time_event_start", "id");
+    CREATE INDEX "ix_event_stop_id" ON "event" ("time_event_stop", "id");
+    CREATE INDEX "ix_event_active_start_id" ON "event" ("is_active", "time_event_start", "id");
+    CREATE INDEX "ix_event_notify_start_id" ON "event" ("to_notify", "time_event_start", "id");
+    CREATE INDEX "ix_event_lower_title_id" ON "event" (lower("title"), "id");
+    CREATE INDEX "ix_event_author_start" ON "event" ("author_uid", "time_event_start");
+    CREATE INDEX "ix_event_due_notify" ON "event" ("time_notify") WHERE "to_notify" AND "is_active" AND NOT "notification_sent";
+    CREATE INDEX "ix_event_series" ON "event" ("recurrence_end", "time_event_start") WHERE "recurrence" IS NOT NULL;
+
+    CREATE TABLE "event_exception" (
+      "id" SERIAL NOT NULL,
+      "event_id" INT NOT NULL,
+      "occurrence" TIMESTAMP NOT NULL,
+      "cancelled" BOOLEAN NOT NULL,
+      "title" VARCHAR(100),
+      "details" VARCHAR(300),
+      "time_event_start" TIMESTAMP,
+      "time_event_stop" TIMESTAMP,
+      PRIMARY KEY("id"),
+      FOREIGN KEY("event_id") REFERENCES "event"("id"),
+      UNIQUE ("event_id", "occurrence")
+    );
 
     CREATE TABLE "log" (
       "id" SERIAL NOT NULL,
@@ -64,11 +95,18 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
       "time" TIMESTAMP,
       PRIMARY KEY("id")
     );
+    CREATE INDEX "ix_log_time" ON "log" ("time");
 
     CREATE TABLE "notification" (
       "id" SERIAL NOT NULL,
       "notify_unit" VARCHAR(10),
       "notify_interval" INT,
+      "mail_server" VARCHAR(50),
+      "mail_port" VARCHAR(10),
+      "mail_security" VARCHAR(10),
+      "mail_username" VARCHAR(70),
+      "mail_password" VARCHAR(120),
+      "config_version" INT,
       PRIMARY KEY("id"),
       UNIQUE ("notify_unit")
     );
@@ -79,7 +117,37 @@ psql -v ON_ERROR_STOP=1 --username reminderuser --dbname reminderdb <<-EOSQL
       FOREIGN KEY("user_id") REFERENCES "user"("id"),
       FOREIGN KEY("event_id") REFERENCES "event"("id")
     );
+    CREATE INDEX "ix_user_to_event_user_event" ON "user_to_event" ("user_id", "event_id");
+    CREATE INDEX "ix_user_to_event_event_user" ON "user_to_event" ("event_id", "user_id");
+    
+    CREATE TABLE "schema_version" (
+      "version" INT NOT NULL,
+      "description" VARCHAR(100),
+      "applied" TIMESTAMP,
+      PRIMARY KEY("version")
+    );
+
+    -- Dashboard statistics (filled on the first dashboard load)
+    CREATE TABLE "dashboard_counter" (
+      "name" VARCHAR(40) NOT NULL,
+      "value" INT NOT NULL,
+      PRIMARY KEY("name")
+    );
+
+    CREATE TABLE "event_daily_stat" (
+      "day" DATE NOT NULL,
+      "events_created" INT NOT NULL,
+      PRIMARY KEY("day")
+    );
 
+    -- Schema includes all migrations (see 'reminder/migrations.py')
+    INSERT INTO "schema_version" ("version", "description", "applied")
+    VALUES (1, 'Hot-path indexes', NOW()::timestamp),
+        (2, 'Dashboard statistics', NOW()::timestamp),
+        (3, 'Users lookup index', NOW()::timestamp),
+        (4, 'Recurring events', NOW()::timestamp),
+        (5, 'Shared mail config', NOW()::timestamp);
+    
     -- Add user's roles
     INSERT INTO "role" ("name", "description")
     VALUES ('admin', 'Account with admin privileges'),
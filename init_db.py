@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, Table, ForeignKey
+from sqlalchemy import create_engine, Column, String, Integer, BigInteger, DateTime, Date, Boolean, Table, ForeignKey, \
+    Index, func, UniqueConstraint
 from sqlalchemy.orm import relationship, backref, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timedelta
@@ -36,7 +37,9 @@ class Role(Base):
 user_to_event = Table('user_to_event',
                       Base.metadata,
                       Column('user_id', Integer(), ForeignKey('user.id')),
-                      Column('event_id', Integer(), ForeignKey('event.id')))
+                      Column('event_id', Integer(), ForeignKey('event.id')),
+                      Index('ix_user_to_event_user_event', 'user_id', 'event_id'),
+                      Index('ix_user_to_event_event_user', 'event_id', 'user_id'))
 
 
 class User(Base):
@@ -60,11 +63,23 @@ class User(Base):
     creation_date = Column(DateTime, default=datetime.utcnow)
     failed_login_attempts = Column(Integer, default=0)
     pass_change_req = Column(Boolean, default=False)
+    feed_secret = Column(String(32))
+
+
+Index('ix_user_role_lower_username', User.role_id, func.lower(User.username), User.id)
 
 
 class Event(Base):
     """Events that will be notified"""
     __tablename__ = 'event'
+    __table_args__ = (
+        Index('ix_event_active_stop_start', 'is_active', 'time_event_stop', 'time_event_start'),
+        Index('ix_event_start_id', 'time_event_start', 'id'),
+        Index('ix_event_stop_id', 'time_event_stop', 'id'),
+        Index('ix_event_active_start_id', 'is_active', 'time_event_start', 'id'),
+        Index('ix_event_notify_start_id', 'to_notify', 'time_event_start', 'id'),
+        Index('ix_event_author_start', 'author_uid', 'time_event_start'),
+    )
     id = Column(Integer, primary_key=True)
     title = Column(String(100), nullable=False)
     details = Column(String(300))
@@ -80,6 +95,34 @@ class Event(Base):
     notified_users = relationship('User',
                                  secondary=user_to_event,
                                  back_populates='events_notified')
+    recurrence = Column(String(255))
+    recurrence_end = Column(DateTime)
+    notified_until = Column(DateTime)
+
+
+Index('ix_event_lower_title_id', func.lower(Event.title), Event.id)
+Index('ix_event_due_notify', Event.time_notify,
+      postgresql_where=Event.to_notify & Event.is_active & ~Event.notification_sent,
+      sqlite_where=Event.to_notify & Event.is_active & ~Event.notification_sent)
+Index('ix_event_series', Event.recurrence_end, Event.time_event_start,
+      postgresql_where=Event.recurrence.isnot(None),
+      sqlite_where=Event.recurrence.isnot(None))
+
+
+class EventException(Base):
+    """Cancelled or changed occurrence of recurring event."""
+    __tablename__ = 'event_exception'
+    __table_args__ = (
+        UniqueConstraint('event_id', 'occurrence'),
+    )
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, ForeignKey('event.id'), nullable=False)
+    occurrence = Column(DateTime, nullable=False)
+    cancelled = Column(Boolean, nullable=False, default=False)
+    title = Column(String(100))
+    details = Column(String(300))
+    time_event_start = Column(DateTime)
+    time_event_stop = Column(DateTime)
 
 
 class Notification(Base):
@@ -88,6 +131,12 @@ class Notification(Base):
     id = Column(Integer, primary_key=True)
     notify_unit = Column(String(10), unique=True)
     notify_interval = Column(Integer)
+    mail_server = Column(String(50))
+    mail_port = Column(String(10))
+    mail_security = Column(String(10))
+    mail_username = Column(String(70))
+    mail_password_encrypted = Column(String(255))
+    config_version = Column(Integer)
 
 
 class Log(Base):
@@ -96,7 +145,7 @@ class Log(Base):
     log_name = Column(String)
     level = Column(String)
     msg = Column(String(100))
-    time = Column(DateTime)
+    time = Column(DateTime, index=True)
 
     def __init__(self, log_name, level, time, msg):
         self.log_name = log_name
@@ -105,6 +154,35 @@ class Log(Base):
         self.msg = msg
 
 
+class DashboardCounter(Base):
+    """Admin Portal dashboard counters (filled on the first dashboard load)."""
+    __tablename__ = 'dashboard_counter'
+    name = Column(String(40), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class CacheVersion(Base):
+    """Version counters of cached data shared by all app processes."""
+    __tablename__ = 'cache_version'
+    name = Column(String(60), primary_key=True)
+    value = Column(BigInteger, nullable=False)
+
+
+class EventDailyStat(Base):
+    """Number of events created per day."""
+    __tablename__ = 'event_daily_stat'
+    day = Column(Date, primary_key=True)
+    events_created = Column(Integer, nullable=False, default=0)
+
+
+class SchemaVersion(Base):
+    """Applied schema migrations."""
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String(100))
+    applied = Column(DateTime, default=datetime.utcnow)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Script adds dummy data to the database')
     parser.add_argument('-u', '--adminuser', default='admin', help='Username for admin account (default: admin)')
@@ -143,6 +221,16 @@ if __name__ == '__main__':
 
     session.bulk_save_objects(notification_config)
 
+    # Schema created from current models already includes all migrations.
+    session.add_all([SchemaVersion(version=1, description='Hot-path indexes'),
+                     SchemaVersion(version=2, description='Dashboard statistics'),
+                     SchemaVersion(version=3, description='Users lookup index'),
+                     SchemaVersion(version=4, description='Recurring events'),
+                     SchemaVersion(version=5, description='Shared mail config'),
+                     SchemaVersion(version=6, description='Calendar feed secrets'),
+                     SchemaVersion(version=7, description='Encrypted mail password'),
+                     SchemaVersion(version=8, description='Shared cache versions')])
+
     print('event-reminder: Adding dummy users data to db...')
     users = [
         User(username=f'{admin_username}',
@@ -398,6 +486,7 @@ if __name__ == '__main__':
               to_notify=True,
               time_notify=today + timedelta(days=12, hours=4),
               author_uid=random_user_id(),
+              recurrence='FREQ=MONTHLY',
               ),
         Event(title='Sekurak Hacking Party',
               details='Nulla eget libero a nulla malesuada scelerisque sed vel dolor. '
@@ -430,6 +519,8 @@ if __name__ == '__main__':
               to_notify=True,
               time_notify=today_with_minutes + timedelta(minutes=3),
               author_uid=random_user_id(),
+              recurrence='FREQ=WEEKLY;COUNT=8',
+              recurrence_end=today + timedelta(weeks=7, hours=15),
               ),
         Event(title='Purchase materials for home improvement',
               details='Vestibulum nulla enim, tincidunt id fringilla commodo, malesuada ut tellus.',
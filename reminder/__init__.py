@@ -1,17 +1,23 @@
 # Standard library imports
+import atexit
 import logging
 import os
+import time
 from logging.handlers import RotatingFileHandler
 
+_import_started = time.perf_counter()
+
 # Third party imports
 from flask import Flask
-from elasticsearch import Elasticsearch
+from werkzeug.middleware.proxy_fix import ProxyFix
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 
 # Local app imports
-from config import DevConfig, ProdConfig
+from config import load_config
 from reminder.main import views as main_views
 from reminder.auth import views as auth_views
 from reminder.admin import views as admin_views
+from reminder.api import views as api_views
 from reminder.extensions import (
     db,
     login_manager,
@@ -20,37 +26,65 @@ from reminder.extensions import (
     cache,
 )
 from reminder.custom_handler import DatabaseHandler
+from reminder.last_seen import last_seen_tracker
+from reminder.login_throttle import login_throttle
+from reminder.mx_resolver import mx_resolver
+from reminder.query_stats import query_stats
+from reminder.passwords import password_pool, passwords_cli
+from reminder.identity_cache import identity_cache
+from reminder.events_cache import calendar_cache, events_list_cache
 from reminder.models import Event
+from reminder.migrations import schema_cli
+from reminder.event_import import events_cli
+from reminder.user_import import users_cli
+from reminder.calendar_feed import feed_cache
+from reminder.assets import static_assets
+from reminder.search import LazyElasticsearch
+from reminder.startup import StartupTimer, startup_report
+from reminder.replicas import replica_router
+
+_import_time = time.perf_counter() - _import_started
 
 
-def create_app():
+def create_app(worker=False):
     """
-    Construct the core app object.
+    Construct the core app object. The worker app (see 'worker.py') always runs scheduled jobs.
     """
-    app = Flask(__name__)
-    # Distinguish whether production or development database should be used
-    if os.environ.get('APPLICATION_MODE') == 'production':
-        # Application Config for production
-        app.config.from_object(ProdConfig)
-    else:
-        # Application Config for development
-        app.config.from_object(DevConfig)
+    timer = StartupTimer()
+    timer.add('imports', _import_time)
+    with timer.phase('config'):
+        app = Flask(__name__)
+        # Environment ('.env' file) is loaded here, not on import
+        app.config.from_object(load_config())
+        # Client's IP, scheme and host are taken from X-Forwarded-* headers set by trusted reverse proxies
+        # (e.g. the IP used to throttle failed logins)
+        if app.config['PROXY_TRUSTED_HOPS']:
+            hops = app.config['PROXY_TRUSTED_HOPS']
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+    app.startup_timer = timer
 
     with app.app_context():
         # Initialize Plugins
-        register_extensions(app)
-        register_blueprints(app)
-        configure_logger(app)
+        with timer.phase('extensions'):
+            register_extensions(app, worker)
+        with timer.phase('blueprints'):
+            register_blueprints(app)
+            register_commands(app)
+        with timer.phase('logger'):
+            configure_logger(app)
+        app.logger_general.info(f'Reminder App startup ({timer.total:.2f} s)')
         return app
 
 
-def register_extensions(app):
+def register_extensions(app, worker=False):
     """
     Register Flask extensions.
     """
     # Initialize Plugins
     # Create SQLAlchemy instance:
     db.init_app(app)
+    # Read-only views can read from db replicas
+    replica_router.init_app(app)
     # Enable CSRF protection globally for Flask app
     csrf.init_app(app)
     # Use for user log in
@@ -58,13 +92,38 @@ def register_extensions(app):
     # Tell login_manager where cane find login page (here 'login' function)
     login_manager.login_view = 'auth_bp.login'
     login_manager.login_message_category = 'info'
-    # Initialize Apscheduler obj for background task
+    # Cache logged in users (invalidated in views that change user's data)
+    identity_cache.init_app(app)
+    # Pool of processes which hash and verify passwords - forked before the scheduler starts its threads
+    password_pool.init_app(app)
+    if not worker:
+        password_pool.start()
+    # Initialize Apscheduler obj for background task. With scheduler disabled the paused scheduler only manages
+    # jobs in the shared job store (jobs are run by the worker process).
     if not scheduler.running:
+        # Job store uses the same engine (connection pool) as Flask-SQLAlchemy
+        app.config.setdefault('SCHEDULER_JOBSTORES', {'default': SQLAlchemyJobStore(engine=db.get_engine(app))})
         scheduler.init_app(app)
-        scheduler.start()
-    # Initialize ElasticSearch
-    app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) if app.config['ELASTICSEARCH_URL'] else None
+        scheduler.start(paused=not (worker or app.config['SCHEDULER_ENABLED']))
+    # Initialize ElasticSearch (client is created on first use)
+    app.elasticsearch = LazyElasticsearch(app.config['ELASTICSEARCH_URL'])
     cache.init_app(app)
+    # Buffer users' 'last seen' timestamps in memory and write them to db periodically
+    last_seen_tracker.init_app(app)
+    atexit.register(last_seen_tracker.flush_on_exit)
+    # Count failed logins in memory and write them to the auth log in batches
+    login_throttle.init_app(app)
+    atexit.register(login_throttle.flush_on_exit)
+    # Cache of e-mail domains' MX records (CHECK_EMAIL_DOMAIN)
+    mx_resolver.init_app(app)
+    # Per-request SQL statistics and N+1 queries detection (SQL_STATS_ENABLED)
+    query_stats.init_app(app)
+    # Per-process caches of calendar, events list and calendar feed responses
+    calendar_cache.init_app(app)
+    events_list_cache.init_app(app)
+    feed_cache.init_app(app)
+    # Fingerprinted and precompressed static files (built by 'build_assets.py')
+    static_assets.init_app(app)
 
 
 def register_blueprints(app):
@@ -74,6 +133,20 @@ def register_blueprints(app):
     app.register_blueprint(main_views.main_bp)
     app.register_blueprint(auth_views.auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_views.admin_bp, url_prefix='/admin')
+    # JSON API - clients are authenticated with tokens (not cookies), so CSRF protection is not needed
+    csrf.exempt(api_views.api_bp)
+    app.register_blueprint(api_views.api_bp, url_prefix='/api/v1')
+
+
+def register_commands(app):
+    """
+    Register Flask CLI commands.
+    """
+    app.cli.add_command(schema_cli)
+    app.cli.add_command(events_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(startup_report)
 
 
 def configure_logger(app):
@@ -112,5 +185,3 @@ def configure_logger(app):
     app.logger_admin.setLevel(logging.DEBUG)
     app.logger_admin.addHandler(file_handler_admin)
     app.logger_admin.addHandler((DatabaseHandler(db.session)))
-
-    app.logger_general.info('Reminder App startup')
@@ -30,6 +30,15 @@ class NewUserForm(FlaskForm):
                               validators=[EqualTo('password')])
 
 
+class ImportUserForm(NewUserForm):
+    """
+    Validators for imported user account (e-mail domains are checked for the whole batch of users at once).
+    """
+    email = StringField(validators=[InputRequired(),
+                                    Email(message='Please enter valid email address'),
+                                    Length(max=70)])
+
+
 class EditUserForm(NewUserForm):
     """
     Validators for the user being edited
@@ -61,4 +70,5 @@ class NotifyForm(FlaskForm):
                                 choices=[('tls', 'TLS'), ('ssl', 'SSL')])
     mail_username = StringField(label='Mail username',
                                 validators=[InputRequired(), Length(max=70)])
-    mail_password = PasswordField(label='Mail Password')
\ No newline at end of file
+    mail_password = PasswordField(label='Mail Password',
+                                  validators=[Length(max=120)])
\ No newline at end of file
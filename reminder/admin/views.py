@@ -2,14 +2,26 @@ import datetime
 import json
 import time
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session, jsonify
 from flask_login import current_user
-from sqlalchemy import func, desc, asc
+from sqlalchemy import func, desc, asc, or_
 import requests
 import elasticsearch.exceptions
 
-from reminder.extensions import db, scheduler, cache
-from reminder.models import Role, User, Event, Notification, Log
+from reminder.extensions import db, scheduler
+from reminder.replicas import use_replica, primary_reads
+from reminder.models import Role, User, Event, Log
+from reminder.last_seen import last_seen_tracker
+from reminder.identity_cache import identity_cache
+from reminder.login_throttle import login_throttle
+from reminder.user_import import import_users
+from reminder.events_cache import get_generation, events_list_cache
+from reminder.pagination import keyset_paginate
+from reminder.dashboard_stats import get_dashboard_stats, search_available
+from reminder.recurrence import fetch_exceptions, due_occurrence
+from reminder.notify_config import notify_config_store, MAIL_SETTINGS
+from reminder.engines import pool_status
+from reminder.query_stats import query_stats
 from reminder.main import views as main_views
 from reminder.admin import smtp_mail
 from reminder.custom_decorators import admin_required, login_required, cancel_click
@@ -21,72 +33,151 @@ admin_bp = Blueprint('admin_bp', __name__,
                      template_folder='templates',
                      static_folder='static')
 
+# Scheduler job ids (jobs are kept in the job store shared by all app processes)
+NOTIFY_JOB_ID = 'my_job_id'
+LOG_RETENTION_JOB_ID = 'log_retention'
+SEARCH_REINDEX_JOB_ID = 'search_reindex'
+
 
 @admin_bp.before_app_first_request
 def before_app_req():
     """
-    Refresh an index inside elasticsearch with all the data from the relational side and cash mail config.
+    Refresh an index inside elasticsearch with all the data from the relational side.
+    The index is refreshed in background - the first request doesn't wait for it. With scheduler disabled
+    in web processes the index is refreshed by the worker on its startup.
     """
-    # Add all the events and logs from the db to the search index.
-    Event.reindex()
-    Log.reindex()
-    # Caching mail server config - in order to allow the admin to change the configuration
-    # while the application is running (store mail config data in db is not desired)
-    cache.set_many({'mail_server': current_app.config.get('MAIL_SERVER'),
-                    'mail_port': current_app.config.get('MAIL_PORT'),
-                    'mail_security': current_app.config.get('MAIL_SECURITY'),
-                    'mail_username': current_app.config.get('MAIL_DEFAULT_SENDER'),
-                    'mail_password': current_app.config.get('MAIL_PASSWORD'),})
-    # cache.clear()
+    if current_app.config['SCHEDULER_ENABLED']:
+        schedule_search_reindex()
 
 
 @admin_bp.before_request
 def update_last_seen():
     """
     Update when the current user was last seen (User.last_seen attribute).
+    The timestamp is buffered in memory and written to the db periodically (see LAST_SEEN_RESOLUTION).
     """
     if current_user.is_authenticated:
-        current_user.user_seen()
-        db.session.commit()
+        last_seen_tracker.touch(current_user.id)
+
+
+def send_notification(users_to_notify, event, config):
+    """
+    Send reminder of the event (or occurrence of recurring event) to users.
+    """
+    users_notified = smtp_mail.send_email('Attention! Upcoming event!',
+                                          users_to_notify,
+                                          event,
+                                          config.mail_server,
+                                          config.mail_port,
+                                          config.mail_security,
+                                          config.mail_username,
+                                          config.mail_password)
+    current_app.logger_admin.info(f'Notification service: notification has been sent to: {users_notified}')
+    # only for test
+    # print(f'Mail sent to {users_notified}')
 
 
 def background_job():
     """
     Run process in background.
     """
-    with scheduler.app.app_context():
-        today = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    with scheduler.app.app_context(), query_stats.collect('background_job'):
+        now = datetime.datetime.utcnow()
+        today = now.strftime("%Y-%m-%d %H:%M")
         # only for tests
         # print(today)    # only for tests
-        events_to_notify = Event.query.filter(Event.time_notify <= today,
-                                              Event.is_active == True,
-                                              Event.to_notify == True,
-                                              Event.notification_sent == False).all()
+        # Recipients of all due events are loaded with one query
+        notify_query = Event.query.options(*Event.loading('recipients'))
+        events_to_notify = notify_query.filter(Event.time_notify <= today,
+                                               Event.is_active == True,
+                                               Event.to_notify == True,
+                                               Event.notification_sent == False,
+                                               Event.recurrence == None).all()
+        # Recurring events - occurrences are expanded only up to the current time.
+        series_to_notify = notify_query.filter(Event.time_notify <= today,
+                                               Event.is_active == True,
+                                               Event.to_notify == True,
+                                               Event.recurrence != None,
+                                               or_(Event.recurrence_end == None, Event.recurrence_end >= now)).all()
         try:
+            # Mail config is read once per run (reloaded only if it has been changed).
+            config = notify_config_store.get()
             for event in events_to_notify:
                 users_to_notify = [user for user in event.notified_users]
                 if not users_to_notify:
                     continue
-                users_notified = smtp_mail.send_email('Attention! Upcoming event!',
-                                     users_to_notify,
-                                     event,
-                                     cache.get('mail_server'),
-                                     cache.get('mail_port'),
-                                     cache.get('mail_security'),
-                                     cache.get('mail_username'),
-                                     cache.get('mail_password'))
-                current_app.logger_admin.info(f'Notification service: notification has been sent to: {users_notified}')
-                # only for test
-                # print(f'Mail sent to {users_notified}')
+                send_notification(users_to_notify, event, config)
                 event.notification_sent = True
+            exceptions = fetch_exceptions([event.id for event in series_to_notify])
+            for event in series_to_notify:
+                start, occurrence = due_occurrence(event, exceptions[event.id], now)
+                if start is None:
+                    continue
+                # Only the latest due occurrence is notified (reminders missed earlier are not sent).
+                event.notified_until = start
+                users_to_notify = [user for user in event.notified_users]
+                if occurrence is not None and users_to_notify:
+                    send_notification(users_to_notify, occurrence, config)
             db.session.commit()
         except Exception as error:
             current_app.logger_admin.error(f'Background job error: {error}')
             # Remove job when error occure.
-            scheduler.remove_job('my_job_id')
+            scheduler.remove_job(NOTIFY_JOB_ID)
+
+
+def search_reindex_job():
+    """
+    Add all the events and logs from the db to the search index.
+    """
+    with scheduler.app.app_context():
+        if not current_app.elasticsearch:
+            return
+        try:
+            Event.reindex()
+            Log.reindex()
+        except Exception as error:
+            current_app.logger_admin.error(f'Search reindex job error: {error}')
+
+
+def schedule_search_reindex():
+    """
+    Run 'search_reindex_job' once, as soon as possible.
+    """
+    scheduler.add_job(func=search_reindex_job, trigger='date', replace_existing=True, misfire_grace_time=None,
+                      id=SEARCH_REINDEX_JOB_ID)
+
+
+def log_retention_job():
+    """
+    Delete logs older than 'LOG_RETENTION_DAYS' (run daily by the worker).
+    """
+    with scheduler.app.app_context():
+        try:
+            Log.delete_expired(current_app.config['LOG_RETENTION_DAYS'])
+        except Exception as error:
+            db.session.rollback()
+            current_app.logger_admin.error(f'Log retention job error: {error}')
+
+
+# Sorting options of events in Admin Portal: (col, dir) -> (filter, sort column, descending)
+EVENTS_SORTING = {
+    ('id', 'asc'): (None, Event.id, False),
+    ('id', 'desc'): (None, Event.id, True),
+    ('start', 'asc'): (None, Event.time_event_start, False),
+    ('start', 'desc'): (None, Event.time_event_start, True),
+    ('stop', 'asc'): (None, Event.time_event_stop, False),
+    ('stop', 'desc'): (None, Event.time_event_stop, True),
+    ('title', 'asc'): (None, func.lower(Event.title), False),
+    ('title', 'desc'): (None, func.lower(Event.title), True),
+    ('notify', 'yes'): (Event.to_notify == True, Event.time_event_start, False),
+    ('notify', 'no'): (Event.to_notify == False, Event.time_event_start, False),
+    ('active', 'yes'): (Event.is_active == True, Event.time_event_start, False),
+    ('active', 'no'): (Event.is_active == False, Event.time_event_start, False),
+}
 
 
 @admin_bp.route('/events')
+@use_replica
 @login_required
 @admin_required
 def events():
@@ -96,47 +187,47 @@ def events():
     # Pagination
     events_per_page = 10
     page = request.args.get('page', 1, type=int)
-
-    if not request.args or (request.args.get('col') == 'start' and request.args.get('dir') == 'asc'):
-        events = Event.query.order_by("time_event_start").paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'id' and request.args.get('dir') == 'desc':
-        events = Event.query.order_by(desc(Event.id)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'id' and request.args.get('dir') == 'asc':
-        events = Event.query.order_by(asc(Event.id)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'start' and request.args.get('dir') == 'desc':
-        events = Event.query.order_by(desc(Event.time_event_start)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'start' and request.args.get('dir') == 'asc':
-        events = Event.query.order_by(asc(Event.time_event_start)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'stop' and request.args.get('dir') == 'desc':
-        events = Event.query.order_by(desc(Event.time_event_stop)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'stop' and request.args.get('dir') == 'asc':
-        events = Event.query.order_by(asc(Event.time_event_stop)).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'title' and request.args.get('dir') == 'asc':
-        events = Event.query.order_by(func.lower(Event.title).asc()).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'title' and request.args.get('dir') == 'desc':
-        events = Event.query.order_by(func.lower(Event.title).desc()).paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'notify' and request.args.get('dir') == 'yes':
-        events = Event.query.filter(Event.to_notify == True).order_by("time_event_start")\
-            .paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'notify' and request.args.get('dir') == 'no':
-        events = Event.query.filter(Event.to_notify == False).order_by("time_event_start")\
-            .paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'active' and request.args.get('dir') == 'no':
-        events = Event.query.filter(Event.is_active == False).order_by("time_event_start")\
-            .paginate(page, events_per_page, True)
-    elif request.args.get('col') == 'active' and request.args.get('dir') == 'yes':
-        events = Event.query.filter(Event.is_active == True).order_by("time_event_start")\
-            .paginate(page, events_per_page, True)
-    else:
+    # Keyset pagination - the page is defined by cursor ('after' or 'before'), 'page' is only page's number.
+    after, before = request.args.get('after'), request.args.get('before')
+    col, direction = request.args.get('col', 'start'), request.args.get('dir', 'asc')
+    if (col, direction) not in EVENTS_SORTING:
+        abort(404)
+    events_filter, sort_column, descending = EVENTS_SORTING[(col, direction)]
+    events_query = Event.query
+    if events_filter is not None:
+        events_query = events_query.filter(events_filter)
+    # Events are sorted by selected column and id (unique key for seeking)
+    sort_keys = [Event.id] if sort_column is Event.id else [sort_column, Event.id]
+    # Total number of events is counted lazily - once per events generation (not for each page).
+    generation = get_generation()
+    count_key = ('admin_events', col, direction, 'count')
+    total = events_list_cache.get(count_key, generation)
+    if total is None:
+        # Cached count is read from the primary db (not from possibly lagging replica)
+        with primary_reads():
+            total = events_query.order_by(None).count()
+        events_list_cache.set(count_key, generation, total)
+    try:
+        events = keyset_paginate(events_query, sort_keys, events_per_page, after=after, before=before,
+                                 descending=descending, page=page, total=total)
+    except ValueError:
         abort(404)
+    # URLs for pagination navigation
+    next_url = url_for('admin_bp.events',
+                       col=col,
+                       dir=direction,
+                       after=events.next_cursor,
+                       page=events.next_num) if events.has_next else None
+    prev_url = url_for('admin_bp.events',
+                       col=col,
+                       dir=direction,
+                       before=events.prev_cursor,
+                       page=events.prev_num) if events.has_prev else None
     # Remember additional URL in session, if last event on page - for event deleting feature
     if session.get('prev_endpoint_del'):
         del session['prev_endpoint_del']
-    if len(events.items) == 1 and not page == 1:
-        session['prev_endpoint_del'] = url_for('admin_bp.events',
-                                           col=request.args.get('col'),
-                                           dir=request.args.get('dir'),
-                                           page=page - 1)
+    if len(events.items) == 1 and prev_url:
+        session['prev_endpoint_del'] = prev_url
     # Remember current url in session (for back-redirect)
     if not request.args:
         session['prev_endpoint'] = url_for('admin_bp.events')
@@ -144,16 +235,9 @@ def events():
         session['prev_endpoint'] = url_for('admin_bp.events',
                                            col=request.args.get('col'),
                                            dir=request.args.get('dir'),
+                                           after=after,
+                                           before=before,
                                            page=page)
-    # URLs for pagination navigation
-    next_url = url_for('admin_bp.events',
-                       col=request.args.get('col', 'start'),
-                       dir=request.args.get('dir', 'asc'),
-                       page=events.next_num) if events.has_next else None
-    prev_url = url_for('admin_bp.events',
-                       col=request.args.get('col', 'start'),
-                       dir=request.args.get('dir', 'asc'),
-                       page=events.prev_num) if events.has_prev else None
     return render_template('admin/events.html',
                            events=events,
                            title='Events', next_url=next_url,
@@ -170,9 +254,7 @@ def event(event_id):
     Display particular event's details.
     The event details in Admin Portal.
     """
-    event = Event.query.filter_by(id=event_id).first_or_404()
-    # Fetch users that can be notified (only with user role)
-    users_to_notify = User.get_all_standard_users()
+    event = Event.query.options(*Event.loading('detail')).filter_by(id=event_id).first_or_404()
     today = datetime.date.today().strftime("%Y-%m-%d")
     if request.method == "POST":
         event.title = request.form.get('title')
@@ -198,14 +280,14 @@ def event(event_id):
         event.time_event_stop = time_event_stop_db
         # Set users to notify. If "to_notify = False" the list "user_form" is []
         users_form = request.form.getlist('notified_user')
-        # Overwrite current users to notify.
-        event.notified_users = [User.query.get(user_id) for user_id in users_form]
+        # Overwrite current users to notify (fetched with one query).
+        event.notified_users = User.get_standard_users_by_ids(users_form)
         db.session.commit()
         flash('Your changes have been saved!', 'success')
         if 'prev_endpoint' in session:
             return redirect(session['prev_endpoint'])
         return redirect(url_for('admin_bp.events'))
-    return render_template('admin/event.html', event=event, title='Event details', users=users_to_notify, today=today)
+    return render_template('admin/event.html', event=event, title='Event details', today=today)
 
 
 @admin_bp.route('/users')
@@ -311,6 +393,32 @@ def new_user():
     return render_template('admin/new_user.html', title='New user')
 
 
+@admin_bp.route('/import_users', methods=['GET', 'POST'])
+@cancel_click()
+@login_required
+@admin_required
+def users_import():
+    """
+    Import users from CSV file.
+    """
+    if request.method == "POST":
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Please choose a file to import!', 'danger')
+        else:
+            # Passwords are hashed on all CPU cores (PBKDF2 releases the GIL) - large files should be imported
+            # with the CLI command, so the request doesn't exceed app server's timeout.
+            result = import_users(file.stream)
+            for line, message in result.errors[:10]:
+                flash(f'Line {line}: {message}', 'danger')
+            flash(f'{result.imported} users have been imported, {result.invalid} records are invalid.',
+                  'success' if result.imported else 'warning')
+            current_app.logger_admin.info(f'{result.imported} users have been imported by "{current_user}"')
+            if result.imported:
+                return redirect(url_for('admin_bp.users'))
+    return render_template('admin/import_users.html', title='Import users')
+
+
 @admin_bp.route('/user/<int:user_id>', methods=['GET', 'POST'])
 @cancel_click()
 @login_required
@@ -335,6 +443,7 @@ def user(user_id):
             user.email = email_form
             if request.form.get('access') == 'True' and str(user.access_granted) != request.form.get('access'):
                 user.failed_login_attempts = 0
+                login_throttle.reset_user(user.id)
             user.access_granted = True if request.form.get('access') == 'True' else False
             user.pass_change_req = True if request.form.get('pass_reset') == 'True' else False
             user.role_id = str(Role.query.filter_by(name=request.form.get('role')).first().id)
@@ -342,6 +451,7 @@ def user(user_id):
             if password_form and not user.check_password(password_form):
                 user.set_password(password_form)
             db.session.commit()
+            identity_cache.invalidate(user.id)
             current_app.logger_admin.info(f'User "{user.username}" data has been changed')
             flash('Your changes have been saved!', 'success')
             return redirect(url_for('admin_bp.users'))
@@ -366,6 +476,7 @@ def del_user(user_id):
     current_app.logger_admin.warning(f'User "{user.username} has been deleted from db"')
     db.session.delete(user)
     db.session.commit()
+    identity_cache.invalidate(user_id)
     flash(f'User "{user.username}" has been deleted!', 'success')
     if 'prev_endpoint' in session:
         return redirect(session['prev_endpoint'])
@@ -425,18 +536,8 @@ def notify():
     """
     # only for test
     # print(scheduler.get_jobs(jobstore='default'))
-    # Get mail config from cache
-    mail_config_cache = cache.get_dict('mail_server',
-                                       'mail_port',
-                                       'mail_security',
-                                       'mail_username',
-                                       'mail_password')
-    # Notification config data (for interval and interval unit).
-    notification_config = Notification.query.first()
-    # Mail config data.
-    notify_config = mail_config_cache.copy()
-    notify_config['notify_unit'] = notification_config.notify_unit
-    notify_config['notify_interval'] = notification_config.notify_interval
+    # Notification config data (interval, interval unit and mail config) - shared by all app processes.
+    notify_config = notify_config_store.get()._asdict()
     if request.method == "POST":
         form = NotifyForm()
         # Validate form data on server-side
@@ -445,26 +546,21 @@ def notify():
             notify_status_form = request.form.get('notify_status')
             notify_unit_form = request.form.get('notify_unit')
             notify_interval_form = int(request.form.get('notify_interval'))
-            # Checks whether the data provided in the form differs from those stored in the cache
-            # and update the data in 'notify_config' div and config object (if required).
-            config_changed = False
-            for key, val in notify_config.items():
-                if key in form.data.keys() and key in mail_config_cache.keys():
+            # Checks whether the data provided in the form differs from the stored config.
+            config_changes = {}
+            for key in MAIL_SETTINGS:
+                if key in form.data.keys():
                     if notify_config[key] != str(form.data[key]) and str(form.data[key]) != '':
-                        cache.set(key, str(form.data[key]))
-                        notify_config[key] = str(form.data[key])
-                        config_changed = True
-                        # print(key, form.data[key])
-            # Checks whether the data provided in the form differs from those stored in the db
+                        config_changes[key] = str(form.data[key])
             if notify_unit_form != notify_config['notify_unit'] or \
                     notify_interval_form != notify_config['notify_interval']:
-                notification_config.notify_unit = notify_unit_form
-                notification_config.notify_interval = notify_interval_form
-                db.session.commit()
-                # Update the rest of the data in 'notify_config' dic.
-                notify_config['notify_unit'] = notify_unit_form
-                notify_config['notify_interval'] = notify_interval_form
-                config_changed = True
+                config_changes['notify_unit'] = notify_unit_form
+                config_changes['notify_interval'] = notify_interval_form
+            # Save changes (with new config version) and update the data in 'notify_config' dict.
+            config_changed = bool(config_changes)
+            if config_changed:
+                notify_config_store.update(**config_changes)
+                notify_config.update(config_changes)
             # Test mail configuration before running service
             if notify_status_form == 'on':
                 test_mail_config = smtp_mail.test_email(notify_config['mail_server'],
@@ -475,41 +571,42 @@ def notify():
             else:
                 test_mail_config = False
             # Notification service engine
-            if not notify_status_form and scheduler.get_jobs():
-                scheduler.remove_job('my_job_id')
+            if not notify_status_form and scheduler.get_job(NOTIFY_JOB_ID):
+                scheduler.remove_job(NOTIFY_JOB_ID)
                 current_app.logger_admin.info(f'Notification service has been turned off by "{current_user.username}"')
                 flash('The notify service has been turned off!', 'success')
-            elif scheduler.get_jobs() and not test_mail_config:
-                scheduler.remove_job('my_job_id')
+            elif scheduler.get_job(NOTIFY_JOB_ID) and not test_mail_config:
+                scheduler.remove_job(NOTIFY_JOB_ID)
             elif notify_status_form == 'on' and test_mail_config:
-                if not scheduler.get_jobs():
+                if not scheduler.get_job(NOTIFY_JOB_ID):
                     current_app.logger_admin.info(f'Notification service has been started by "{current_user.username}"')
                 else:
                     current_app.logger_admin.info(f'Notification service config has been changed by '
                                                   f'"{current_user.username}"')
                 if notify_unit_form == 'seconds':
                     scheduler.add_job(func=background_job, trigger='interval', replace_existing=True, max_instances=1,
-                                      seconds=notify_interval_form, id='my_job_id')
+                                      seconds=notify_interval_form, id=NOTIFY_JOB_ID)
                 elif notify_unit_form == 'minutes':
                     scheduler.add_job(func=background_job, trigger='interval', replace_existing=True, max_instances=1,
-                                      minutes=notify_interval_form, id='my_job_id')
+                                      minutes=notify_interval_form, id=NOTIFY_JOB_ID)
                 else:
                     scheduler.add_job(func=background_job, trigger='interval', replace_existing=True, max_instances=1,
-                                      hours=notify_interval_form, id='my_job_id')
+                                      hours=notify_interval_form, id=NOTIFY_JOB_ID)
                 flash('Connection with mail server established correctly! The notify service is running!', 'success')
             # Flash msg when config has been changed by user
-            if not scheduler.get_jobs() and config_changed:
+            if not scheduler.get_job(NOTIFY_JOB_ID) and config_changed:
                 current_app.logger_admin.info(f'Notification service config has been changed by '
                                               f'"{current_user.username}"')
                 flash('The notification service config has been changed!', 'success')
         if form.errors:
             flash_errors(form)
     # Determine weather some scheduler jobs exist - if True, notification service is running
-    service_run = True if scheduler.get_jobs() else False
+    service_run = True if scheduler.get_job(NOTIFY_JOB_ID) else False
     return render_template('admin/notify.html', service_run=service_run, **notify_config)
 
 
 @admin_bp.route('/logs')
+@use_replica
 @login_required
 @admin_required
 def logs():
@@ -617,6 +714,7 @@ def search_engine():
 
 
 @admin_bp.route('/search')
+@use_replica
 @login_required
 @admin_required
 def search():
@@ -691,43 +789,33 @@ def search():
 
 
 @admin_bp.route('/dashboard')
+@use_replica
 @login_required
 @admin_required
 def dashboard():
-    # Data fetched from db
-    users_count = User.query.count()
-    standard_users_count = User.query.filter(User.role_id == 2).count()
-    admin_users_count = User.query.filter(User.role_id == 1).count()
-    events_active = Event.query.filter(Event.is_active == True).count()
-    events_notactive = Event.query.filter(Event.is_active == False).count()
-    events_count = Event.query.count()
-    # Data for chart - 'Events created in last 30 days'
-    today = datetime.datetime.today()
-    events = Event.query.with_entities(Event.time_creation).filter(Event.time_creation <= today,
-                                Event.time_creation >= today - datetime.timedelta(days=31)).order_by('time_creation').all()
-    event_dates = [event[0].date() for event in events]
-    chart_data = {}
-    for day in event_dates:
-        new = chart_data.get(day, 0)
-        chart_data[day] = new + 1
-    events_labels = chart_data.keys()
-    events_values = chart_data.values()
-
-    if not current_app.elasticsearch or not current_app.elasticsearch.ping():
-        search_status = False
-    else:
-        search_status = True
-    notification_status = True if scheduler.get_jobs() else False
+    # Counters and data for chart - 'Events created in last 30 days' (maintained by session hooks)
+    stats = get_dashboard_stats(days=31)
+    notification_status = True if scheduler.get_job(NOTIFY_JOB_ID) else False
     data = {
-        'users_count': users_count,
-        'standard_users_count': standard_users_count,
-        'admin_users_count': admin_users_count,
-        'events_count': events_count,
-        'search_status': search_status,
+        'users_count': stats['users'],
+        'standard_users_count': stats['standard_users'],
+        'admin_users_count': stats['admin_users'],
+        'events_count': stats['events'],
+        'search_status': search_available(),
         'notification_status': notification_status,
-        'events_active': events_active,
-        'events_notactive': events_notactive,
-        'events_labels': list(events_labels),
-        'events_values': list(events_values),
+        'events_active': stats['events_active'],
+        'events_notactive': stats['events_notactive'],
+        'events_labels': stats['events_labels'],
+        'events_values': stats['events_values'],
     }
     return render_template('admin/dashboard.html', **data)
+
+
+@admin_bp.route('/db_pool')
+@login_required
+@admin_required
+def db_pool():
+    """
+    Return state of db connection pool of the app process which handles the request (saturation, checkout waits).
+    """
+    return jsonify(pool_status(db.engine))
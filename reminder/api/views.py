@@ -0,0 +1,580 @@
+import datetime
+import hashlib
+import json
+
+from flask import Blueprint, request, current_app, abort, g, url_for
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.exceptions import HTTPException, default_exceptions
+from sqlalchemy.orm import selectinload
+
+from reminder.extensions import db
+from reminder.models import User, Event, user_to_event, load_user
+from reminder.identity_cache import identity_cache
+from reminder.last_seen import last_seen_tracker
+from reminder.login_throttle import login_throttle
+from reminder.passwords import PasswordPoolBusy
+from reminder.events_cache import get_generation, body_etag, conditional_response
+from reminder.pagination import keyset_paginate
+from reminder.event_import import record_to_formdata, form_to_row, notified_usernames
+from reminder.recurrence import rule_parts
+from reminder.main.forms import NewEventForm
+from reminder.main.views import current_events_filter
+
+
+api_bp = Blueprint('api_bp', __name__)
+
+API_TOKEN_SALT = 'api-token'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Columns changed by update (the rest of 'form_to_row' columns is set only when event is created)
+EDITABLE_COLUMNS = ['title', 'details', 'all_day_event', 'time_event_start', 'time_event_stop', 'to_notify',
+                    'time_notify', 'recurrence', 'recurrence_end']
+# 'NewEventForm' fields reported as API fields in validation errors
+FORM_FIELDS = {
+    'allday': 'all_day',
+    'date_event_start': 'start',
+    'time_event_start': 'start',
+    'date_event_stop': 'stop',
+    'time_event_stop': 'stop',
+    'to_notify': 'notify',
+    'date_notify': 'notify',
+    'time_notify': 'notify',
+    'notified_user': 'notified_users',
+    'repeat_until': 'repeat',
+    'repeat_count': 'repeat',
+}
+
+
+def iso(value):
+    return value.isoformat() if value else None
+
+
+def repeat_value(rule):
+    """
+    Recurrence rule as API value, e.g. {'freq': 'WEEKLY', 'count': 10, 'until': None}.
+    """
+    if not rule:
+        return None
+    parts = rule_parts(rule)
+    until = parts.get('UNTIL')
+    return {'freq': parts.get('FREQ'),
+            'count': int(parts['COUNT']) if 'COUNT' in parts else None,
+            'until': f'{until[:4]}-{until[4:6]}-{until[6:8]}' if until else None}
+
+
+# Event's fields available to API clients: name -> (columns fetched for the field, value of the field).
+# 'notified_users' are fetched with separate query (for the whole page).
+EVENT_FIELDS = {
+    'id': ([Event.id], lambda row: row.id),
+    'title': ([Event.title], lambda row: row.title),
+    'details': ([Event.details], lambda row: row.details),
+    'all_day': ([Event.all_day_event], lambda row: row.all_day_event),
+    'start': ([Event.time_event_start], lambda row: iso(row.time_event_start)),
+    'stop': ([Event.time_event_stop], lambda row: iso(row.time_event_stop)),
+    'notify': ([Event.to_notify, Event.time_notify], lambda row: iso(row.time_notify) if row.to_notify else None),
+    'repeat': ([Event.recurrence], lambda row: repeat_value(row.recurrence)),
+    'repeat_end': ([Event.recurrence_end], lambda row: iso(row.recurrence_end)),
+    'author': ([User.username.label('author')], lambda row: row.author),
+    'notified_users': ([], None),
+    'created': ([Event.time_creation], lambda row: iso(row.time_creation)),
+    'active': ([Event.is_active], lambda row: row.is_active),
+}
+
+
+class InvalidEvent(Exception):
+    """
+    Event sent by API client is invalid ('errors' - list of messages for each invalid field).
+    """
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def json_response(data, status=200):
+    return current_app.response_class(json.dumps(data), status=status, mimetype='application/json')
+
+
+def token_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=API_TOKEN_SALT)
+
+
+def password_fingerprint(user):
+    """
+    Short digest of user's password hash - tokens issued before password change are no longer valid.
+    Upgrade of the hash on login (new PASSWORD_HASH_METHOD) invalidates the user's tokens as well.
+    """
+    return hashlib.sha256(user.password_hash.encode()).hexdigest()[:16]
+
+
+def issue_token(user):
+    return token_serializer().dumps([user.id, password_fingerprint(user)])
+
+
+def token_user(token):
+    """
+    Return user the API token has been issued for (None if token is invalid, expired or user is blocked).
+    The user is loaded from identity cache, so valid token is usually checked without any db query.
+    """
+    try:
+        user_id, fingerprint = token_serializer().loads(token, max_age=current_app.config['API_TOKEN_MAX_AGE'])
+    except (BadSignature, ValueError, TypeError):
+        return None
+    user = load_user(user_id) if isinstance(user_id, int) else None
+    if user is None or not user.access_granted or fingerprint != password_fingerprint(user):
+        return None
+    return user
+
+
+@api_bp.before_request
+def authenticate():
+    """
+    Authenticate API client with bearer token ('Authorization: Bearer <token>') - the cookie session is not used.
+    """
+    if request.endpoint == 'api_bp.create_token':
+        return
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    user = token_user(token.strip()) if scheme.lower() == 'bearer' and token else None
+    if user is None:
+        abort(401, 'Valid API token is required.')
+    g.api_user = user
+    last_seen_tracker.touch(user.id)
+
+
+def handle_error(error):
+    """
+    Errors are returned as JSON documents: {"error": "Not Found", "message": "..."}.
+    """
+    data = {'error': error.name, 'message': error.description}
+    if isinstance(error.description, dict):
+        data['message'], data['errors'] = 'Invalid event data.', error.description
+    response = json_response(data, error.code)
+    if error.code == 401:
+        scheme = 'Basic' if request.endpoint == 'api_bp.create_token' else 'Bearer'
+        response.headers['WWW-Authenticate'] = f'{scheme} realm="api"'
+    return response
+
+
+# Blueprint handlers registered for each status code - app wide handlers of 404 and 500 render HTML pages.
+for code in default_exceptions:
+    api_bp.register_error_handler(code, handle_error)
+api_bp.register_error_handler(HTTPException, handle_error)
+
+
+def requested_fields():
+    """
+    Fields selected by the client with 'fields' argument, e.g. '?fields=id,title,start' (all fields by default).
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return list(EVENT_FIELDS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in EVENT_FIELDS]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}.')
+    return fields
+
+
+def events_query(fields):
+    """
+    Query of the columns required by the selected fields only (author's username is joined only if selected).
+    """
+    # Id and sort key are always fetched (needed by cursors).
+    columns = {'id': Event.id, 'time_event_start': Event.time_event_start}
+    for field in fields:
+        columns.update((column.key, column) for column in EVENT_FIELDS[field][0])
+    query = db.session.query(*columns.values())
+    if 'author' in fields:
+        query = query.outerjoin(User, Event.author_uid == User.id)
+    return query
+
+
+def fetch_notified_users(event_ids):
+    """
+    Fetch usernames of users to notify about indicated events with one query: {event id: [usernames]}.
+    """
+    notified = {event_id: [] for event_id in event_ids}
+    if event_ids:
+        rows = db.session.query(user_to_event.c.event_id, User.username) \
+            .join(User, User.id == user_to_event.c.user_id) \
+            .filter(user_to_event.c.event_id.in_(event_ids)) \
+            .order_by(User.username)
+        for event_id, username in rows:
+            notified[event_id].append(username)
+    return notified
+
+
+def serialize_events(rows, fields):
+    notified = fetch_notified_users([row.id for row in rows]) if 'notified_users' in fields else {}
+    return [{field: notified[row.id] if field == 'notified_users' else EVENT_FIELDS[field][1](row)
+             for field in fields}
+            for row in rows]
+
+
+def fetch_events(event_ids, fields):
+    """
+    Fetch indicated events (in the order of ids) serialized with selected fields.
+    """
+    if not event_ids:
+        return []
+    rows = {row.id: row for row in events_query(fields).filter(Event.id.in_(event_ids))}
+    return serialize_events([rows[event_id] for event_id in event_ids if event_id in rows], fields)
+
+
+def request_etag(generation, *extra):
+    """
+    ETag of the response to GET request - the same request gives the same response until any event changes.
+    """
+    key = '|'.join(str(part) for part in (generation, g.api_user.id, request.full_path) + extra)
+    return body_etag(key)
+
+
+def json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, 'JSON object expected.')
+    return data
+
+
+def parse_datetime(value, name):
+    """
+    Convert ISO date or datetime to naive local datetime ('2020-04-12' or '2020-04-12T14:30').
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'"{name}" should be ISO date or datetime')
+    try:
+        value = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'"{name}" should be ISO date or datetime')
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def payload_to_record(data):
+    """
+    Convert API event to the record with 'NewEventForm' field names (see 'reminder/event_import.py').
+    Raise ValueError if values can't be converted.
+    """
+    if data.get('start') is None:
+        raise ValueError('"start" is required')
+    all_day = bool(data.get('all_day', False))
+    start = parse_datetime(data['start'], 'start')
+    stop = parse_datetime(data['stop'], 'stop') if data.get('stop') is not None else start
+    notify = parse_datetime(data['notify'], 'notify') if data.get('notify') is not None else None
+    record = {
+        'title': data.get('title'),
+        'details': data.get('details'),
+        'allday': str(all_day),
+        'date_event_start': start.date().isoformat(),
+        'date_event_stop': stop.date().isoformat(),
+        'to_notify': str(notify is not None),
+        'notified_users': data.get('notified_users') or [],
+    }
+    if not all_day:
+        record['time_event_start'] = start.strftime('%H:%M')
+        record['time_event_stop'] = stop.strftime('%H:%M')
+    if notify is not None:
+        record['date_notify'] = notify.date().isoformat()
+        record['time_notify'] = notify.strftime('%H:%M')
+    repeat = data.get('repeat')
+    if repeat:
+        if not isinstance(repeat, dict):
+            raise ValueError('"repeat" should be an object, e.g. {"freq": "WEEKLY", "count": 10}')
+        record['repeat'] = repeat.get('freq')
+        record['repeat_until'] = repeat.get('until')
+        record['repeat_count'] = repeat.get('count')
+    return record
+
+
+def event_payload(event):
+    """
+    Editable fields of existing event in API format (base for partial update).
+    """
+    return {
+        'title': event.title,
+        'details': event.details,
+        'all_day': event.all_day_event,
+        'start': iso(event.time_event_start),
+        'stop': iso(event.time_event_stop),
+        'notify': iso(event.time_notify) if event.to_notify else None,
+        'repeat': repeat_value(event.recurrence),
+        'notified_users': [user.username for user in event.notified_users],
+    }
+
+
+def notified_users_lookup(payloads, events=()):
+    """
+    Fetch users to notify named in the payloads with one query: {username: User}.
+    Users already notified about updated events are reused.
+    """
+    users = {user.username: user for event in events for user in event.notified_users}
+    usernames = {username for data in payloads if isinstance(data, dict)
+                 for username in notified_usernames(data)} - set(users)
+    if usernames:
+        users.update((user.username, user)
+                     for user in User.query.filter(User.username.in_(usernames), User.role_id == 2))
+    return users
+
+
+def validate_event(data, users, form):
+    """
+    Validate API event with 'NewEventForm' rules (the same as events added with the form or imported).
+    Return (event row, users to notify) or raise InvalidEvent.
+    """
+    if not isinstance(data, dict):
+        raise InvalidEvent({'event': ['JSON object expected']})
+    try:
+        record = payload_to_record(data)
+    except (ValueError, TypeError) as error:
+        raise InvalidEvent({'event': [str(error)]})
+    usernames = notified_usernames(record)
+    unknown = [username for username in usernames if username not in users]
+    if unknown:
+        raise InvalidEvent({'notified_users': [f'Unknown users to notify: {", ".join(unknown)}']})
+    form.process(formdata=record_to_formdata(record, {username: user.id for username, user in users.items()}))
+    form.notified_user.choices = [(str(users[username].id), username) for username in usernames]
+    if not form.validate():
+        errors = {}
+        for field, messages in form.errors.items():
+            errors.setdefault(FORM_FIELDS.get(field, field), []).extend(messages)
+        raise InvalidEvent(errors)
+    return form_to_row(form, g.api_user.id, datetime.datetime.utcnow()), [users[username] for username in usernames]
+
+
+def check_author(event):
+    if event.author_uid != g.api_user.id and not g.api_user.is_admin():
+        abort(403, "Only event's author can change the event.")
+
+
+def create_event(data, users, form):
+    row, notified_users = validate_event(data, users, form)
+    event = Event(**row)
+    event.notified_users = notified_users
+    db.session.add(event)
+    return event
+
+
+def update_event(event, data, users, form):
+    """
+    Apply partial update - fields missing in 'data' keep their current values.
+    """
+    check_author(event)
+    payload = event_payload(event)
+    payload.update(data)
+    row, notified_users = validate_event(payload, users, form)
+    if event.recurrence and (row['recurrence'], row['time_event_start']) != (event.recurrence,
+                                                                            event.time_event_start):
+        # Occurrences of the changed series are different - their exceptions are no longer valid.
+        event.exceptions.delete()
+    for column in EDITABLE_COLUMNS:
+        setattr(event, column, row[column])
+    event.notified_users = notified_users
+
+
+def delete_event(event):
+    """
+    Events are only deactivated (not deleted) - the same as in events list.
+    """
+    check_author(event)
+    event.is_active = False
+
+
+def active_event_or_404(event_id):
+    return Event.query.filter(Event.id == event_id, Event.is_active == True).first_or_404()
+
+
+def api_form():
+    # Form without CSRF - API clients are authenticated with tokens, not cookies.
+    return NewEventForm(formdata=None, meta={'csrf': False})
+
+
+@api_bp.route('/tokens', methods=['POST'])
+def create_token():
+    """
+    Issue API token for user authenticated with username and password (HTTP Basic auth).
+    Failed attempts count towards blocking the account - the same as on login page.
+    """
+    auth = request.authorization
+    if auth is None or not auth.username:
+        abort(401, 'Username and password are required.')
+    if login_throttle.ip_blocked(request.remote_addr):
+        abort(429, 'Too many failed login attempts. Please try again later.')
+    user = User.query.filter_by(username=auth.username).first()
+    if user is None or not user.access_granted or not user.check_password(auth.password or ''):
+        login_throttle.register_failure(user, request.remote_addr, auth.username)
+        abort(401, 'Invalid username or password.')
+    if user.pass_change_req:
+        abort(403, 'Password change is required.')
+    # Upgrade of outdated password hash is skipped (till next login) if the pool is busy
+    try:
+        rehashed = user.rehash_password(auth.password)
+    except PasswordPoolBusy:
+        rehashed = False
+    login_throttle.reset_user(user.id)
+    if user.failed_login_attempts or rehashed:
+        user.failed_login_attempts = 0
+        db.session.commit()
+        identity_cache.invalidate(user.id)
+    current_app.logger_auth.info(f'API token has been issued for "{user.username}"')
+    return json_response({'token': issue_token(user), 'expires_in': current_app.config['API_TOKEN_MAX_AGE']}, 201)
+
+
+@api_bp.route('/events')
+def list_events():
+    """
+    One page of events sorted by start time.
+    Arguments: 'list' (current, own or all), 'author' (author's id), 'fields', 'limit' and 'after' or 'before'
+    (cursors returned as 'next' and 'prev').
+    """
+    fields = requested_fields()
+    per_page = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    list_name = request.args.get('list', 'current')
+    if list_name not in ('current', 'own', 'all'):
+        abort(400, 'Unknown list - use current, own or all.')
+    # Current events change with time - minute resolution (the same as events list view).
+    today = datetime.datetime.today().replace(second=0, microsecond=0)
+    today_only_day = today.replace(hour=0, minute=0)
+    generation = get_generation()
+    etag = request_etag(generation, today if list_name != 'all' else '')
+    if request.if_none_match.contains(etag):
+        return conditional_response(current_app.response_class(), generation, etag, private=True)
+    query = events_query(fields)
+    if list_name == 'all':
+        query = query.filter(Event.is_active == True)
+    else:
+        query = query.filter(current_events_filter(today, today_only_day))
+    if list_name == 'own':
+        query = query.filter(Event.author_uid == g.api_user.id)
+    author_id = request.args.get('author', type=int)
+    if author_id is not None:
+        query = query.filter(Event.author_uid == author_id)
+    try:
+        page = keyset_paginate(query, [Event.time_event_start, Event.id], per_page,
+                               after=request.args.get('after'), before=request.args.get('before'))
+    except ValueError:
+        abort(400, 'Invalid cursor.')
+    response = json_response({'events': serialize_events(page.items, fields),
+                              'next': page.next_cursor,
+                              'prev': page.prev_cursor})
+    return conditional_response(response, generation, etag, private=True)
+
+
+@api_bp.route('/events', methods=['POST'])
+def new_event():
+    """
+    Add new event - returns the event with selected fields.
+    """
+    fields = requested_fields()
+    data = json_body()
+    try:
+        event = create_event(data, notified_users_lookup([data]), api_form())
+    except InvalidEvent as error:
+        abort(422, error.errors)
+    db.session.commit()
+    current_app.logger_general.info(f'New event with id={event.id} has been added by "{g.api_user}" (API)')
+    response = json_response(fetch_events([event.id], fields)[0], 201)
+    response.headers['Location'] = url_for('api_bp.get_event', event_id=event.id)
+    return response
+
+
+@api_bp.route('/events/<int:event_id>')
+def get_event(event_id):
+    """
+    One event with selected fields.
+    """
+    fields = requested_fields()
+    generation = get_generation()
+    etag = request_etag(generation)
+    if request.if_none_match.contains(etag):
+        return conditional_response(current_app.response_class(), generation, etag, private=True)
+    row = events_query(fields).filter(Event.id == event_id, Event.is_active == True).first_or_404()
+    return conditional_response(json_response(serialize_events([row], fields)[0]), generation, etag, private=True)
+
+
+@api_bp.route('/events/<int:event_id>', methods=['PATCH'])
+def patch_event(event_id):
+    """
+    Change indicated fields of the event - returns the event with selected fields.
+    """
+    fields = requested_fields()
+    data = json_body()
+    event = active_event_or_404(event_id)
+    try:
+        update_event(event, data, notified_users_lookup([data], [event]), api_form())
+    except InvalidEvent as error:
+        db.session.rollback()
+        abort(422, error.errors)
+    db.session.commit()
+    current_app.logger_general.info(f'Event with id={event.id} has been changed by "{g.api_user}" (API)')
+    return json_response(fetch_events([event.id], fields)[0])
+
+
+@api_bp.route('/events/<int:event_id>', methods=['DELETE'])
+def remove_event(event_id):
+    """
+    Deactivate the event.
+    """
+    event = active_event_or_404(event_id)
+    delete_event(event)
+    db.session.commit()
+    current_app.logger_general.info(f'Event with id={event.id} has been deactivated by "{g.api_user}" (API)')
+    return current_app.response_class(status=204)
+
+
+@api_bp.route('/events/bulk', methods=['POST'])
+def bulk_events():
+    """
+    Create, update and delete many events with one request: {"create": [event, ...],
+    "update": [{"id": 1, <changed fields>}, ...], "delete": [id, ...]}.
+    All operations are applied in one transaction - if any of them is invalid, none is applied.
+    """
+    fields = requested_fields()
+    data = json_body()
+    to_create, to_update, to_delete = data.get('create') or [], data.get('update') or [], data.get('delete') or []
+    if not all(isinstance(operations, list) for operations in (to_create, to_update, to_delete)):
+        abort(400, '"create", "update" and "delete" should be lists.')
+    if len(to_create) + len(to_update) + len(to_delete) > current_app.config['API_BULK_LIMIT']:
+        abort(413, f'Max {current_app.config["API_BULK_LIMIT"]} operations in one request.')
+    # Events to change (with their users to notify) and users to notify are fetched with one query each.
+    event_ids = {event_id for event_id in [item.get('id') for item in to_update if isinstance(item, dict)] + to_delete
+                 if isinstance(event_id, int)}
+    events = {event.id: event for event in Event.query.options(selectinload(Event.notified_users))
+              .filter(Event.id.in_(event_ids), Event.is_active == True)} if event_ids else {}
+    users = notified_users_lookup(to_create + to_update, events.values())
+    form = api_form()
+    errors = {'create': {}, 'update': {}, 'delete': {}}
+    created = []
+    for i, item in enumerate(to_create):
+        try:
+            created.append(create_event(item, users, form))
+        except InvalidEvent as error:
+            errors['create'][i] = error.errors
+    for i, item in enumerate(to_update):
+        event = events.get(item.get('id')) if isinstance(item, dict) and isinstance(item.get('id'), int) else None
+        if event is None:
+            errors['update'][i] = {'id': ['Event does not exist']}
+            continue
+        try:
+            update_event(event, {key: value for key, value in item.items() if key != 'id'}, users, form)
+        except InvalidEvent as error:
+            errors['update'][i] = error.errors
+        except HTTPException as error:
+            errors['update'][i] = {'id': [error.description]}
+    for i, event_id in enumerate(to_delete):
+        event = events.get(event_id) if isinstance(event_id, int) else None
+        if event is None:
+            errors['delete'][i] = {'id': ['Event does not exist']}
+            continue
+        try:
+            delete_event(event)
+        except HTTPException as error:
+            errors['delete'][i] = {'id': [error.description]}
+    if any(errors.values()):
+        db.session.rollback()
+        abort(422, {operation: operation_errors for operation, operation_errors in errors.items() if operation_errors})
+    db.session.commit()
+    current_app.logger_general.info(f'{len(created)} events have been added, {len(to_update)} changed and '
+                                    f'{len(to_delete)} deactivated by "{g.api_user}" (API)')
+    return json_response({'created': fetch_events([event.id for event in created], fields),
+                          'updated': fetch_events([item['id'] for item in to_update], fields),
+                          'deleted': to_delete})
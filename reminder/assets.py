@@ -0,0 +1,59 @@
+import json
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+
+# Fingerprinted files never change - browsers and proxies can keep them for a year without revalidation.
+ASSET_MAX_AGE = 365 * 24 * 3600
+# File suffixes of precompressed variants (preferred encoding first)
+ENCODING_SUFFIXES = [('br', '.br'), ('gzip', '.gz')]
+
+
+class StaticAssets:
+    """
+    Serve static files built by 'build_assets.py' - 'url_for('static', ...)' returns fingerprinted URL
+    (e.g. '/static/dist/js/notify.1a2b3c4d5e.js'), which is served with precompressed variant and far-future
+    immutable cache headers. Without the manifest static files are served as usual.
+    """
+    def __init__(self, app=None):
+        self.assets = {}
+        self.encodings = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        manifest = app.config.get('STATIC_ASSETS_MANIFEST')
+        if not manifest or not os.path.exists(manifest):
+            return
+        with open(manifest) as file:
+            assets = json.load(file)
+        self.assets = {source: asset['path'] for source, asset in assets.items()}
+        self.encodings = {asset['path']: asset['encodings'] for asset in assets.values()}
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions['static'] = self.send_static_file
+
+    def fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.assets:
+            values['filename'] = self.assets[values['filename']]
+
+    def send_static_file(self, filename):
+        encodings = self.encodings.get(filename)
+        if encodings is None:
+            return current_app.send_static_file(filename)
+        encoding, suffix = next(((encoding, suffix) for encoding, suffix in ENCODING_SUFFIXES
+                                 if encoding in encodings and encoding in request.accept_encodings), (None, ''))
+        response = send_from_directory(current_app.static_folder, filename + suffix,
+                                       mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                                       cache_timeout=ASSET_MAX_AGE)
+        if encoding:
+            response.content_encoding = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+static_assets = StaticAssets()
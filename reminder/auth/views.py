@@ -4,6 +4,10 @@ from werkzeug.urls import url_parse
 
 from reminder.extensions import db
 from reminder.models import User
+from reminder.last_seen import last_seen_tracker
+from reminder.identity_cache import identity_cache
+from reminder.login_throttle import login_throttle
+from reminder.passwords import PasswordPoolBusy
 from reminder.auth.forms import LoginForm
 from reminder.custom_decorators import login_required, cancel_click
 
@@ -17,10 +21,10 @@ auth_bp = Blueprint('auth_bp', __name__,
 def update_last_seen():
     """
     Update when the current user was last seen (User.last_seen attribute).
+    The timestamp is buffered in memory and written to the db periodically (see LAST_SEEN_RESOLUTION).
     """
     if current_user.is_authenticated:
-        current_user.user_seen()
-        db.session.commit()
+        last_seen_tracker.touch(current_user.id)
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
@@ -33,27 +37,40 @@ def login():
         return redirect(url_for('main_bp.index'))
     form = LoginForm()
     if form.validate_on_submit():
-        current_app.logger_auth.debug(f'Login attempt: {request.remote_addr}, '
-                                      f'{request.user_agent.platform}, {request.user_agent.browser} '
-                                      f'{request.user_agent.version}')
+        # Failed logins are counted in memory - the db is written only when the account gets blocked.
+        # Client IP is taken from X-Forwarded-For if the app is behind trusted proxies (PROXY_TRUSTED_HOPS).
+        if login_throttle.ip_blocked(request.remote_addr):
+            flash('Too many failed login attempts. Please try again later!', 'danger')
+            return redirect(url_for('auth_bp.login'))
         user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.access_granted or not user.check_password(form.password.data):
+        try:
+            valid_password = user is not None and user.access_granted and user.check_password(form.password.data)
+        except PasswordPoolBusy:
+            # Password hashing processes are overloaded - the attempt is not counted as failed.
+            flash('The server is busy. Please try again in a moment!', 'danger')
+            return redirect(url_for('auth_bp.login'))
+        if not valid_password:
             flash('Login Unsuccessful. Please check username and password!', 'danger')
-            current_app.logger_auth.warning(f'Failed to log in. Username data entered: "{form.username.data}"')
-            if user and user.access_granted:
-                user.failed_login_attempts += 1
-                if user.failed_login_attempts >= 3:
-                    user.access_granted = False
-                    current_app.logger_auth.warning(f'User "{user.username}" account has been blocked')
-                db.session.commit()
+            login_throttle.register_failure(user, request.remote_addr, form.username.data)
             return redirect(url_for('auth_bp.login'))
+        # Upgrade password hash made with outdated parameters - skipped (till next login) if the pool is busy
+        try:
+            rehashed = user.rehash_password(form.password.data)
+        except PasswordPoolBusy:
+            rehashed = False
         # Below function will register the user as logged in
         login_user(user, remember=form.remember_me.data)
-        current_app.logger_auth.info(f'"{user.username}" has been successfully authenticated')
+        current_app.logger_auth.info(f'"{user.username}" has been successfully authenticated '
+                                     f'({request.remote_addr})')
         session.permanent = True
-        # Reset login attempts
-        user.failed_login_attempts = 0
-        db.session.commit()
+        # Reset login attempts (and save upgraded password hash)
+        login_throttle.reset_user(user.id)
+        if user.failed_login_attempts or rehashed:
+            user.failed_login_attempts = 0
+            db.session.commit()
+            identity_cache.invalidate(user.id)
+        if login_throttle.flush_due():
+            login_throttle.flush()
         if current_user.pass_change_req:
             flash('Please change your password', 'success')
             return redirect(url_for('auth_bp.change_pass'))
@@ -96,6 +113,7 @@ def change_pass():
             if current_user.pass_change_req:
                 current_user.pass_change_req = False
             db.session.commit()
+            identity_cache.invalidate(current_user.id)
             current_app.logger_auth.info(f'User "{current_user.username}" changed the password')
             flash('Password has been successfully changed!', 'success')
             return redirect(url_for('main_bp.index'))
@@ -105,10 +123,12 @@ def change_pass():
             if current_user.failed_login_attempts >= 3:
                 current_user.access_granted = False
                 current_app.logger_auth.warning(f'User "{current_user.username}" account has been blocked')
+                identity_cache.invalidate(current_user.id)
                 logout_user()
                 flash('Password change has been unsuccessful. Your account has been blocked!', 'danger')
                 return redirect(url_for('main_bp.index'))
             db.session.commit()
+            identity_cache.invalidate(current_user.id)
             current_app.logger_auth.warning(f'Failed password change. Current password does not much for '
                                             f'"{current_user.username}"')
             flash('The current password does not match! Please check your password', 'danger')
@@ -0,0 +1,308 @@
+import datetime
+import hmac
+import secrets
+from itertools import chain
+
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import or_, select
+
+from reminder.extensions import db
+from reminder.models import User, Event, EventException, user_to_event, load_user
+from reminder.identity_cache import identity_cache
+from reminder.events_cache import GenerationCache
+from reminder.versions import get_version, bump_versions
+from reminder.recurrence import fetch_exceptions, make_occurrence, rule_parts
+
+
+FEED_VERSION_KEY = 'calendar_feed:{}'
+FEED_TOKEN_SALT = 'calendar-feed'
+# Number of events rendered (and sent to the client) in one chunk
+FEED_CHUNK_EVENTS = 200
+
+
+def feed_version(user_id):
+    """
+    Return version of user's calendar feed - bumped on every commit which changes events of the user.
+    Shared by all app processes the same as "events generation" (see 'reminder/versions.py').
+    """
+    return get_version(FEED_VERSION_KEY.format(user_id))
+
+
+def bump_feed_versions(user_ids):
+    """
+    Invalidate calendar feeds of indicated users (one transaction for all of them).
+    """
+    bump_versions(FEED_VERSION_KEY.format(user_id) for user_id in user_ids)
+
+
+def feed_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=FEED_TOKEN_SALT)
+
+
+def reset_feed_secret(user_id):
+    """
+    Set new feed secret of the user - the previous feed URL is no longer valid. Return the new secret.
+    """
+    secret = secrets.token_urlsafe(16)
+    User.query.filter_by(id=user_id).update({'feed_secret': secret}, synchronize_session=False)
+    db.session.commit()
+    identity_cache.invalidate(user_id)
+    return secret
+
+
+def feed_token(user):
+    """
+    Signed token identifying user's calendar feed (part of the feed's URL) - user's id and feed secret.
+    The secret is created on first use.
+    """
+    secret = user.feed_secret or reset_feed_secret(user.id)
+    return feed_serializer().dumps([user.id, secret])
+
+
+def feed_user(token):
+    """
+    Return user the feed token has been issued for (None if token is invalid or has been revoked).
+    Tokens without secret (issued before feed secrets were introduced) are valid until the user gets a secret.
+    """
+    try:
+        data = feed_serializer().loads(token)
+    except BadSignature:
+        return None
+    user_id, secret = data if isinstance(data, list) and len(data) == 2 else (data, None)
+    if not isinstance(user_id, int) or not isinstance(secret, (str, type(None))):
+        return None
+    user = load_user(user_id)
+    if user is not None and user.feed_secret != secret and secret is not None:
+        # Secret might have been reset by other app process - cached user is reloaded
+        identity_cache.invalidate(user_id)
+        user = load_user(user_id)
+    if user is None or not hmac.compare_digest(user.feed_secret or '', secret or ''):
+        return None
+    return user
+
+
+def ics_escape(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def ics_line(line):
+    """
+    Fold content line to 75 octets (continuation lines start with a space) and terminate it with CRLF.
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        # Don't split multi-byte UTF-8 characters
+        while limit < len(encoded) and (encoded[limit] & 0xC0) == 0x80:
+            limit -= 1
+        parts.append(encoded[:limit].decode())
+        encoded = encoded[limit:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ics_utc(value):
+    """
+    Format local (naive) datetime as iCalendar UTC time.
+    """
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def ics_time(value, all_day, name):
+    """
+    Content line with DATE (all day events) or UTC DATE-TIME value.
+    """
+    if all_day:
+        return f'{name};VALUE=DATE:{value.strftime("%Y%m%d")}'
+    return f'{name}:{ics_utc(value)}'
+
+
+def ics_rule(rule, all_day):
+    """
+    Convert recurrence rule to the feed's time format - UNTIL is stored as local time.
+    """
+    parts = rule_parts(rule)
+    if 'UNTIL' in parts:
+        until = datetime.datetime.strptime(parts['UNTIL'][:15], '%Y%m%dT%H%M%S')
+        parts['UNTIL'] = until.strftime('%Y%m%d') if all_day else ics_utc(until)
+    return ';'.join(f'{name}={value}' for name, value in parts.items())
+
+
+def ics_component(host, event, start, stop, title, details, time_notify, extra_lines):
+    """
+    Render one VEVENT component.
+    """
+    lines = ['BEGIN:VEVENT',
+             f'UID:event-{event.id}@{host}',
+             f'DTSTAMP:{(event.time_creation or event.time_event_start).strftime("%Y%m%dT%H%M%SZ")}',
+             ics_time(start, event.all_day_event, 'DTSTART'),
+             # End date of all day event is exclusive in iCalendar
+             ics_time(stop + datetime.timedelta(days=1) if event.all_day_event else stop, event.all_day_event, 'DTEND'),
+             *extra_lines,
+             f'SUMMARY:{ics_escape(title)}']
+    if details:
+        lines.append(f'DESCRIPTION:{ics_escape(details)}')
+    if time_notify:
+        lines.extend(['BEGIN:VALARM',
+                      'ACTION:DISPLAY',
+                      f'DESCRIPTION:{ics_escape(title)}',
+                      f'TRIGGER;VALUE=DATE-TIME:{ics_utc(time_notify)}',
+                      'END:VALARM'])
+    lines.append('END:VEVENT')
+    return ''.join(ics_line(line) for line in lines)
+
+
+def ics_event(host, event, exceptions):
+    """
+    Render event - recurring event is rendered as one component with RRULE (skipped occurrences as EXDATE)
+    and one component for each changed occurrence.
+    """
+    if not event.recurrence:
+        return ics_component(host, event, event.time_event_start, event.time_event_stop, event.title, event.details,
+                             event.time_notify, [])
+    rule_lines = [f'RRULE:{ics_rule(event.recurrence, event.all_day_event)}']
+    rule_lines.extend(ics_time(exception.occurrence, event.all_day_event, 'EXDATE')
+                      for exception in exceptions if exception.cancelled)
+    components = [ics_component(host, event, event.time_event_start, event.time_event_stop, event.title,
+                                event.details, event.time_notify, rule_lines)]
+    for exception in exceptions:
+        occurrence = make_occurrence(event, exception.occurrence, exception)
+        if occurrence is not None:
+            components.append(ics_component(host, event, occurrence.time_event_start, occurrence.time_event_stop,
+                                            occurrence.title, occurrence.details, occurrence.time_notify,
+                                            [ics_time(exception.occurrence, event.all_day_event, 'RECURRENCE-ID')]))
+    return ''.join(components)
+
+
+def user_events_query(user_id):
+    """
+    Active events authored by the user or the user is notified about (only columns rendered in the feed).
+    """
+    notified = select([user_to_event.c.event_id]).where(user_to_event.c.user_id == user_id)
+    return db.session.query(Event.id,
+                            Event.title,
+                            Event.details,
+                            Event.time_creation,
+                            Event.time_event_start,
+                            Event.time_event_stop,
+                            Event.all_day_event,
+                            Event.time_notify,
+                            Event.recurrence) \
+        .filter(Event.is_active == True,
+                or_(Event.author_uid == user_id, Event.id.in_(notified))) \
+        .order_by(Event.id)
+
+
+def render_events(host, events):
+    """
+    Render chunk of events (exceptions of recurring events are fetched with one query).
+    """
+    exceptions = fetch_exceptions([event.id for event in events if event.recurrence])
+    return ''.join(ics_event(host, event, exceptions.get(event.id, [])) for event in events)
+
+
+def generate_feed(user, host):
+    """
+    Render user's calendar feed chunk by chunk - events are fetched from the db in batches.
+    """
+    yield ''.join(ics_line(line) for line in ['BEGIN:VCALENDAR',
+                                              'VERSION:2.0',
+                                              'PRODID:-//Event Reminder//EN',
+                                              'CALSCALE:GREGORIAN',
+                                              f'X-WR-CALNAME:{ics_escape(f"Event Reminder - {user.username}")}'])
+    chunk = []
+    for event in user_events_query(user.id).yield_per(FEED_CHUNK_EVENTS):
+        chunk.append(event)
+        if len(chunk) >= FEED_CHUNK_EVENTS:
+            yield render_events(host, chunk)
+            chunk = []
+    yield render_events(host, chunk) + ics_line('END:VCALENDAR')
+
+
+def cached_feed(user, host, version):
+    """
+    Stream user's calendar feed and keep the rendered feed in cache once it has been sent completely.
+    """
+    parts = []
+    for part in generate_feed(user, host):
+        part = part.encode()
+        parts.append(part)
+        yield part
+    feed_cache.set(user.id, version, b''.join(parts))
+
+
+def track_deleted_events(session, flush_context, instances):
+    """
+    Remember users notified about events deleted by the flush. The flush deletes the association rows and notified
+    users of deleted events needn't be loaded, so the users are read from the db before the flush.
+    """
+    event_ids = [obj.id for obj in session.deleted if isinstance(obj, Event) and obj.id is not None]
+    if not event_ids:
+        return
+    user_ids = {user_id for user_id, in session.execute(
+        select([user_to_event.c.user_id]).where(user_to_event.c.event_id.in_(event_ids)).distinct())}
+    if user_ids:
+        session.info.setdefault('feed_changes', (set(), set()))[0].update(user_ids)
+
+
+def track_feed_changes(session, flush_context):
+    """
+    Remember users whose feeds are changed by the current transaction - authors of added, changed or deleted events
+    and users notified about them.
+    """
+    user_ids = set()
+    event_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, EventException):
+            # Changed occurrence of recurring event
+            event_ids.add(obj.event_id)
+            continue
+        if not isinstance(obj, Event):
+            continue
+        state = db.inspect(obj)
+        # Include the previous author if event has been reassigned.
+        user_ids.update(chain([obj.author_uid], state.attrs.author_uid.history.deleted or ()))
+        # Loaded (or changed) users to notify - including the removed ones
+        user_ids.update(user.id for user in state.attrs.notified_users.history.sum())
+        if obj not in session.deleted and obj.id is not None:
+            event_ids.add(obj.id)
+    user_ids.discard(None)
+    if user_ids or event_ids:
+        changes = session.info.setdefault('feed_changes', (set(), set()))
+        changes[0].update(user_ids)
+        changes[1].update(event_ids)
+
+
+def feed_changes_commit(session):
+    changes = session.info.pop('feed_changes', None)
+    if not changes:
+        return
+    user_ids, event_ids = changes
+    if event_ids:
+        # Users notified about changed events whose notified users have not been loaded by the session
+        # (and authors of recurring events with changed occurrences).
+        # Separate connection - the session can't emit SQL after commit.
+        with db.engine.connect() as connection:
+            user_ids.update(user_id for user_id, in connection.execute(
+                select([user_to_event.c.user_id]).where(user_to_event.c.event_id.in_(event_ids)).distinct()))
+            user_ids.update(author_id for author_id, in connection.execute(
+                select([Event.author_uid]).where(Event.id.in_(event_ids))))
+    user_ids.discard(None)
+    bump_feed_versions(user_ids)
+
+
+def feed_changes_rollback(session):
+    session.info.pop('feed_changes', None)
+
+
+db.event.listen(db.session, 'before_flush', track_deleted_events)
+db.event.listen(db.session, 'after_flush', track_feed_changes)
+db.event.listen(db.session, 'after_commit', feed_changes_commit)
+db.event.listen(db.session, 'after_rollback', feed_changes_rollback)
+
+
+feed_cache = GenerationCache(config_key='CALENDAR_FEED_CACHE_SIZE')
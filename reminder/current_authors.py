@@ -0,0 +1,121 @@
+import datetime
+from collections import namedtuple
+from itertools import chain
+
+from sqlalchemy import select, case, func, or_, literal, DateTime
+
+from reminder.extensions import db, cache
+from reminder.models import User, Event
+from reminder.versions import get_version, bump_versions
+
+
+AUTHORS_KEY = 'current_authors:{}'
+AUTHORS_VERSION_KEY = 'current_authors_version'
+# Maps of outdated versions are left to expire (the map is rebuilt daily anyway)
+AUTHORS_TIMEOUT = 24 * 3600
+
+Author = namedtuple('Author', ['id', 'username'])
+
+# Last stop of recurring event repeated forever
+FOREVER = datetime.datetime(9999, 12, 31)
+# Event's attributes the map is built from - other changes (e.g. 'notification_sent' set by the worker) keep the map
+AUTHORS_EVENT_ATTRS = ('author_uid', 'is_active', 'all_day_event', 'time_event_start', 'time_event_stop',
+                       'recurrence', 'recurrence_end')
+
+
+def fetch_authors(day):
+    """
+    Fetch authors (users with 'user' role) of active events not finished before 'day'.
+    Return {author id: (username, the latest event's start or stop, the latest all day event's stop)}.
+    """
+    # Recurring event lasts until its last occurrence (forever if the series has no end).
+    last_stop = case([(Event.recurrence != None, func.coalesce(Event.recurrence_end, literal(FOREVER, DateTime)))],
+                     else_=Event.time_event_stop)
+    query = select([Event.author_uid,
+                    User.username,
+                    func.max(Event.time_event_start),
+                    func.max(last_stop),
+                    func.max(case([(Event.all_day_event == True, last_stop)]))]) \
+        .select_from(Event.__table__.join(User.__table__, Event.author_uid == User.id)) \
+        .where(Event.is_active == True) \
+        .where(User.role_id == 2) \
+        .where(or_(last_stop >= day, Event.time_event_start >= day)) \
+        .group_by(Event.author_uid, User.username)
+    # Separate connection - the map is always built from the primary db.
+    with db.engine.connect() as connection:
+        rows = connection.execute(query).fetchall()
+    return {author_id: (username, max(filter(None, (start, stop))), all_day_stop)
+            for author_id, username, start, stop, all_day_stop in rows}
+
+
+def authors_version():
+    """
+    Return version of the current authors map - bumped on every commit which changes events or authors.
+    Shared by all app processes the same as "events generation" (see 'reminder/versions.py').
+    """
+    return get_version(AUTHORS_VERSION_KEY)
+
+
+def invalidate_authors():
+    """
+    Invalidate cached current authors map - it is rebuilt by the next request. The map isn't updated in place,
+    so concurrent changes made by other app processes can't be lost.
+    """
+    bump_versions([AUTHORS_VERSION_KEY])
+
+
+def get_current_authors(today, today_only_day):
+    """
+    Return authors of current events (sorted by username) and set of their ids.
+    The map is rebuilt after every change and on the first request of a day, so authors with finished events are
+    dropped. Map built from data changed meanwhile is stored under outdated version, so it is never used.
+    """
+    key = AUTHORS_KEY.format(authors_version())
+    data = cache.get(key)
+    if data is None or data['day'] != today_only_day:
+        data = {'day': today_only_day, 'authors': fetch_authors(today_only_day)}
+        cache.set(key, data, timeout=AUTHORS_TIMEOUT)
+    # Event is current if not finished yet or it's all day event finishing today.
+    authors = [Author(author_id, username)
+               for author_id, (username, last_time, all_day_stop) in data['authors'].items()
+               if last_time >= today or (all_day_stop and all_day_stop >= today_only_day)]
+    authors.sort(key=lambda author: author.username.lower())
+    return authors, {author.id for author in authors}
+
+
+def track_authors_changes(session, flush_context):
+    """
+    Remember authors whose events have been added or deleted, or whose events' attributes used by the map have
+    changed (or who changed username or role).
+    """
+    author_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Event):
+            state = db.inspect(obj)
+            if obj in session.dirty and \
+                    not any(state.attrs[attr].history.has_changes() for attr in AUTHORS_EVENT_ATTRS):
+                continue
+            # Include the previous author if event has been reassigned.
+            author_ids.update(chain([obj.author_uid], state.attrs.author_uid.history.deleted or ()))
+        elif isinstance(obj, User):
+            state = db.inspect(obj)
+            if obj in session.deleted or state.attrs.username.history.has_changes() or \
+                    state.attrs.role_id.history.has_changes():
+                author_ids.add(obj.id)
+    author_ids.discard(None)
+    if author_ids:
+        session.info.setdefault('changed_authors', set()).update(author_ids)
+
+
+def authors_changes_commit(session):
+    if session.info.pop('changed_authors', None):
+        invalidate_authors()
+
+
+def authors_changes_rollback(session):
+    session.info.pop('changed_authors', None)
+
+
+db.event.listen(db.session, 'after_flush', track_authors_changes)
+db.event.listen(db.session, 'after_commit', authors_changes_commit)
+db.event.listen(db.session, 'after_rollback', authors_changes_rollback)
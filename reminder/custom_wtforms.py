@@ -1,7 +1,7 @@
 from flask import flash, current_app
 from wtforms.validators import ValidationError
-from dns import resolver
-import dns.exception
+
+from reminder.mx_resolver import mx_resolver, MX_FOUND, MX_NO_DOMAIN, MX_NO_ANSWER
 
 
 def flash_errors(form):
@@ -82,20 +82,17 @@ class MxRecordValidator:
         if current_app.config.get('CHECK_EMAIL_DOMAIN'):
             message = self.message
             email_address = field.data
-            records = False
             # Pull domain name from email address
             domain_name = email_address.split('@')[1]
-            try:
-                # get MX record for the domain
-                records = resolver.resolve(domain_name, 'MX')
-            except resolver.NXDOMAIN:
+            # Get MX record for the domain (cached, the lookup time is limited by MX_RESOLVE_TIMEOUT)
+            result = mx_resolver.lookup(domain_name)
+            if result == MX_NO_DOMAIN:
                 message = field.gettext(f'Please enter valid email address. The domain "{domain_name}" does not exist')
-            except resolver.NoAnswer:
+            elif result == MX_NO_ANSWER:
                 message = field.gettext(f'Please enter valid email address. The domain "{domain_name}" has no e-mail service')
-            except (resolver.NoResolverConfiguration, dns.exception.Timeout):
+            elif result != MX_FOUND:
                 message = field.gettext(f'Please check your network connection"')
-            if not records:
+            if result != MX_FOUND:
                 if message is None:
                     message = field.gettext(f'Please enter valid email address')
                 raise ValidationError(message)
-
@@ -0,0 +1,163 @@
+import datetime
+import time
+from collections import Counter
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+
+from reminder.extensions import db
+from reminder.models import User, Event, DashboardCounter, EventDailyStat
+
+
+COUNTERS = ['users', 'admin_users', 'standard_users', 'events', 'events_active', 'events_notactive']
+ROLE_COUNTERS = {1: 'admin_users', 2: 'standard_users'}
+ACTIVE_COUNTERS = {True: 'events_active', False: 'events_notactive'}
+# How long (sec) the result of Elasticsearch ping is valid
+SEARCH_STATUS_TTL = 30
+
+
+def count_rows(connection):
+    """
+    Count users and events in tables (full scan - used only to build counters from scratch).
+    """
+    def count(query):
+        return connection.execute(query).scalar()
+    return {
+        'users': count(db.select([func.count()]).select_from(User.__table__)),
+        'admin_users': count(db.select([func.count()]).where(User.role_id == 1)),
+        'standard_users': count(db.select([func.count()]).where(User.role_id == 2)),
+        'events': count(db.select([func.count()]).select_from(Event.__table__)),
+        'events_active': count(db.select([func.count()]).where(Event.is_active == True)),
+        'events_notactive': count(db.select([func.count()]).where(Event.is_active == False)),
+    }
+
+
+def rebuild_stats(connection=None):
+    """
+    Build dashboard counters and events daily rollup from scratch.
+    """
+    if connection is None:
+        with db.engine.begin() as connection:
+            return rebuild_stats(connection)
+    counters = count_rows(connection)
+    connection.execute(DashboardCounter.__table__.delete())
+    connection.execute(DashboardCounter.__table__.insert(),
+                       [{'name': name, 'value': value} for name, value in counters.items()])
+    days = connection.execute(db.select([func.date(Event.time_creation), func.count()])
+                              .where(Event.time_creation != None)
+                              .group_by(func.date(Event.time_creation))).fetchall()
+    connection.execute(EventDailyStat.__table__.delete())
+    if days:
+        # SQLite returns date as string
+        connection.execute(EventDailyStat.__table__.insert(),
+                           [{'day': day if isinstance(day, datetime.date) else datetime.date.fromisoformat(day),
+                             'events_created': count} for day, count in days])
+    return counters
+
+
+def insert_missing_days(connection, days):
+    """
+    Insert rollup rows (with zero count) for days that aren't in the table yet.
+    """
+    table = EventDailyStat.__table__
+    rows = [{'day': day, 'events_created': 0} for day in days]
+    if connection.dialect.name == 'postgresql':
+        connection.execute(postgresql.insert(table).on_conflict_do_nothing(), rows)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(table.insert().prefix_with('OR IGNORE'), rows)
+    else:
+        existing = {row[0] for row in connection.execute(db.select([table.c.day]).where(table.c.day.in_(days)))}
+        rows = [row for row in rows if row['day'] not in existing]
+        if rows:
+            connection.execute(table.insert(), rows)
+
+
+def apply_changes(connection, counters, days):
+    """
+    Increment (or decrement) counters and events daily rollup.
+    """
+    table = DashboardCounter.__table__
+    for name, delta in counters.items():
+        if delta:
+            connection.execute(table.update().where(table.c.name == name).values(value=table.c.value + delta))
+    days = {day: delta for day, delta in days.items() if delta}
+    if days:
+        insert_missing_days(connection, list(days))
+        table = EventDailyStat.__table__
+        for day, delta in days.items():
+            connection.execute(table.update().where(table.c.day == day)
+                               .values(events_created=table.c.events_created + delta))
+
+
+def previous_value(obj, attr):
+    """
+    Value of the changed attribute before the current flush (attribute must be mapped with 'active_history').
+    """
+    history = db.inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else None
+
+
+def track_stats_changes(session, flush_context):
+    """
+    Update dashboard counters within the flushed transaction, so they are always consistent with the tables.
+    """
+    counters = Counter()
+    days = Counter()
+    for obj in chain(session.new, session.deleted):
+        delta = 1 if obj in session.new else -1
+        if isinstance(obj, Event):
+            counters['events'] += delta
+            counters[ACTIVE_COUNTERS.get(obj.is_active)] += delta
+            if obj.time_creation:
+                days[obj.time_creation.date()] += delta
+        elif isinstance(obj, User):
+            counters['users'] += delta
+            counters[ROLE_COUNTERS.get(obj.role_id)] += delta
+    for obj in session.dirty:
+        if isinstance(obj, Event) and db.inspect(obj).attrs.is_active.history.has_changes():
+            counters[ACTIVE_COUNTERS.get(previous_value(obj, 'is_active'))] -= 1
+            counters[ACTIVE_COUNTERS.get(obj.is_active)] += 1
+        elif isinstance(obj, User) and db.inspect(obj).attrs.role_id.history.has_changes():
+            counters[ROLE_COUNTERS.get(previous_value(obj, 'role_id'))] -= 1
+            counters[ROLE_COUNTERS.get(obj.role_id)] += 1
+    counters.pop(None, None)
+    if any(counters.values()) or any(days.values()):
+        apply_changes(session.connection(), counters, days)
+
+
+db.event.listen(db.session, 'after_flush', track_stats_changes)
+
+
+def get_dashboard_stats(days=31):
+    """
+    Return dashboard counters and number of events created per day in last 'days' days.
+    """
+    counters = dict(db.session.query(DashboardCounter.name, DashboardCounter.value).all())
+    if any(name not in counters for name in COUNTERS):
+        # Counters table hasn't been filled yet (e.g. db created by SQL script)
+        counters = rebuild_stats()
+    today = datetime.date.today()
+    chart = db.session.query(EventDailyStat.day, EventDailyStat.events_created) \
+        .filter(EventDailyStat.day >= today - datetime.timedelta(days=days),
+                EventDailyStat.day <= today,
+                EventDailyStat.events_created > 0) \
+        .order_by(EventDailyStat.day).all()
+    counters['events_labels'] = [day for day, _ in chart]
+    counters['events_values'] = [count for _, count in chart]
+    return counters
+
+
+_search_status = {'value': None, 'expires': 0}
+
+
+def search_available():
+    """
+    Check whether Elasticsearch responds (result is cached for SEARCH_STATUS_TTL seconds).
+    """
+    now = time.monotonic()
+    if _search_status['expires'] <= now:
+        _search_status['value'] = bool(current_app.elasticsearch and current_app.elasticsearch.ping())
+        _search_status['expires'] = now + SEARCH_STATUS_TTL
+    return _search_status['value']
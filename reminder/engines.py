@@ -0,0 +1,116 @@
+"""
+Registry of SQLAlchemy engines shared by the whole process - one engine (and one connection pool) per database URL.
+Used by Flask-SQLAlchemy (see 'reminder/extensions.py') and by APScheduler job store.
+"""
+import threading
+import time
+
+import sqlalchemy
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    """
+    Connection checkouts counters of the pool.
+    """
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_checked_out = 0
+        self._lock = threading.Lock()
+
+    def record(self, wait, checked_out, timeout=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timeout)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def as_dict(self):
+        return {
+            'checkouts': self.checkouts,
+            'checkout_timeouts': self.timeouts,
+            'checkout_wait_avg_ms': round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0,
+            'checkout_wait_max_ms': round(self.wait_max * 1000, 2),
+            'peak_checked_out': self.peak_checked_out,
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool which records how long checkouts wait for a free connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, self.checkedout(), timeout=True)
+            raise
+        self.stats.record(time.perf_counter() - started, self.checkedout())
+        return connection
+
+    def recreate(self):
+        # Counters survive engine.dispose() (e.g. after db failover)
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_status(engine):
+    """
+    Return current state and checkout counters of the engine's connection pool (in this process).
+    """
+    pool = engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        status.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': pool.overflow(),
+            # Fraction of connections in use - at 1.0 next checkouts wait (up to pool timeout)
+            'saturation': round(pool.checkedout() / capacity, 2) if pool._max_overflow >= 0 else None,
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update(pool.stats.as_dict())
+    return status
+
+
+class EngineRegistry:
+    """
+    Create engine on first request for given URL and reuse it afterwards (also by app objects created later
+    in the same process, e.g. by tests or CLI commands).
+    """
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, **options):
+        """
+        Return engine for the URL. Options are used only when the engine is created.
+        """
+        key = str(url)
+        engine = self._engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(key)
+                if engine is None:
+                    sa_url = make_url(url)
+                    if 'poolclass' not in options and sa_url.get_dialect().get_pool_class(sa_url) is QueuePool:
+                        options['poolclass'] = InstrumentedQueuePool
+                    engine = self._engines[key] = sqlalchemy.create_engine(url, **options)
+        return engine
+
+
+engine_registry = EngineRegistry()
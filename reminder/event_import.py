@@ -0,0 +1,452 @@
+import csv
+import datetime
+import io
+import json
+import sqlite3
+from collections import Counter
+
+import click
+from elasticsearch import helpers
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import false, func
+from werkzeug.datastructures import MultiDict
+
+from reminder.extensions import db
+from reminder.models import User, Event, user_to_event
+from reminder.main.forms import NewEventForm
+from reminder.events_cache import bump_generation
+from reminder.current_authors import invalidate_authors
+from reminder.calendar_feed import bump_feed_versions
+from reminder.recurrence import RECURRENCE_FREQUENCIES, form_recurrence, rule_parts
+from reminder.dashboard_stats import apply_changes, search_available
+
+
+IMPORT_FORMATS = ['csv', 'ndjson', 'ics']
+# Columns of 'event' table filled by import (see 'form_to_row')
+EVENT_COLUMNS = ['title', 'details', 'time_creation', 'all_day_event', 'time_event_start', 'time_event_stop',
+                 'to_notify', 'time_notify', 'author_uid', 'notification_sent', 'is_active', 'recurrence',
+                 'recurrence_end']
+# Only the first errors are reported (the number of invalid rows is always counted).
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """
+    Summary of events import.
+    """
+    def __init__(self):
+        self.imported = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def import_format(filename):
+    """
+    Guess input format from file's extension.
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('json', 'jsonl', 'ndjson'):
+        return 'ndjson'
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def read_csv(stream):
+    """
+    Read events from CSV file (header row with 'NewEventForm' field names and 'notified_users').
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_ndjson(stream):
+    """
+    Read events from newline delimited JSON (one object per line).
+    """
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield line_number, f'Invalid JSON: {error.msg}'
+            continue
+        yield line_number, record if isinstance(record, dict) else 'Invalid JSON: object expected'
+
+
+def readable_records(records):
+    """
+    Pass through records of the reader. File which can't be read to the end (not UTF-8 text, malformed CSV) is
+    reported as an error record after the last record read.
+    """
+    line_number = 0
+    try:
+        for line_number, record in records:
+            yield line_number, record
+    except UnicodeDecodeError:
+        yield line_number + 1, 'The file is not UTF-8 encoded text'
+    except csv.Error as error:
+        yield line_number + 1, f'Invalid CSV: {error}'
+
+
+def ics_unescape(value):
+    return value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',').replace('\\;', ';') \
+        .replace('\\\\', '\\')
+
+
+def ics_datetime(value, params):
+    """
+    Convert iCalendar DATE or DATE-TIME value to (datetime, all day flag). UTC times are converted to local time.
+    """
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.datetime.strptime(value, '%Y%m%d'), True
+    if value.endswith('Z'):
+        utc_time = datetime.datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=datetime.timezone.utc)
+        return utc_time.astimezone().replace(tzinfo=None), False
+    return datetime.datetime.strptime(value, '%Y%m%dT%H%M%S'), False
+
+
+def ics_event_to_record(properties):
+    """
+    Convert VEVENT properties to the record with 'NewEventForm' field names.
+    """
+    start, all_day = ics_datetime(*properties['DTSTART'])
+    if 'DTEND' in properties:
+        stop = ics_datetime(*properties['DTEND'])[0]
+        # End date of all day event is exclusive in iCalendar
+        if all_day and stop > start:
+            stop -= datetime.timedelta(days=1)
+    else:
+        stop = start
+    record = {
+        'title': properties.get('SUMMARY', ('', {}))[0],
+        'details': properties.get('DESCRIPTION', ('', {}))[0],
+        'allday': str(all_day),
+        'date_event_start': start.strftime('%Y-%m-%d'),
+        'date_event_stop': stop.strftime('%Y-%m-%d'),
+        'to_notify': 'False',
+    }
+    if not all_day:
+        record['time_event_start'] = start.strftime('%H:%M')
+        record['time_event_stop'] = stop.strftime('%H:%M')
+    if 'RRULE' in properties:
+        # Only rules which can be entered with the new event form are supported.
+        rule = rule_parts(properties['RRULE'][0])
+        if set(rule) - {'FREQ', 'COUNT', 'UNTIL'} or rule.get('FREQ') not in dict(RECURRENCE_FREQUENCIES):
+            raise ValueError(f'unsupported recurrence rule "{properties["RRULE"][0]}"')
+        record['repeat'] = rule['FREQ']
+        if 'COUNT' in rule:
+            record['repeat_count'] = rule['COUNT']
+        elif 'UNTIL' in rule:
+            record['repeat_until'] = ics_datetime(rule['UNTIL'], {})[0].strftime('%Y-%m-%d')
+    return record
+
+
+def read_ics(stream):
+    """
+    Read events (VEVENT components) from iCalendar file.
+    """
+    def unfolded_lines():
+        # Long lines are folded - continuation lines start with a space or a tab.
+        current, current_number = None, 0
+        for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8'), start=1):
+            line = line.rstrip('\r\n')
+            if line[:1] in (' ', '\t') and current is not None:
+                current += line[1:]
+                continue
+            if current is not None:
+                yield current_number, current
+            current, current_number = line, line_number
+        if current is not None:
+            yield current_number, current
+
+    properties, event_line, nested = None, 0, 0
+    for line_number, line in unfolded_lines():
+        if line == 'BEGIN:VEVENT':
+            properties, event_line, nested = {}, line_number, 0
+        elif properties is None:
+            continue
+        elif line.startswith('BEGIN:'):
+            # Skip nested components (e.g. VALARM)
+            nested += 1
+        elif line.startswith('END:') and nested:
+            nested -= 1
+        elif line == 'END:VEVENT':
+            try:
+                yield event_line, ics_event_to_record(properties)
+            except (KeyError, ValueError) as error:
+                yield event_line, f'Invalid event: {error}'
+            properties = None
+        elif not nested and ':' in line:
+            name, value = line.split(':', 1)
+            name, *params = name.split(';')
+            params = dict(param.split('=', 1) for param in params if '=' in param)
+            properties[name.upper()] = (ics_unescape(value), params)
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+    'ics': read_ics,
+}
+
+
+def notified_usernames(record):
+    """
+    Usernames of users to notify - list or string separated with ';' or ','.
+    """
+    usernames = record.get('notified_users') or []
+    if isinstance(usernames, str):
+        usernames = usernames.replace(',', ';').split(';')
+    return [str(username).strip() for username in usernames if str(username).strip()]
+
+
+def record_to_formdata(record, users):
+    """
+    Convert record to form data (the same as sent by 'new_event' form).
+    """
+    formdata = MultiDict()
+    for key, value in record.items():
+        # Empty values are skipped like disabled inputs of the form.
+        if key == 'notified_users' or value is None or value == '':
+            continue
+        formdata[key] = str(value) if not isinstance(value, str) else value
+    formdata.setlist('notified_user', [str(users[username]) for username in notified_usernames(record)
+                                       if username in users])
+    return formdata
+
+
+def form_to_row(form, author_id, now):
+    """
+    Convert validated form to 'event' table row (the same way as 'new_event' view does).
+    """
+    all_day = form.allday.data == 'True'
+    if form.time_event_start.data and form.time_event_stop.data and not all_day:
+        time_event_start = datetime.datetime.combine(form.date_event_start.data, form.time_event_start.data)
+        time_event_stop = datetime.datetime.combine(form.date_event_stop.data, form.time_event_stop.data)
+    else:
+        time_event_start = datetime.datetime.combine(form.date_event_start.data, datetime.time())
+        time_event_stop = datetime.datetime.combine(form.date_event_stop.data, datetime.time())
+    to_notify = form.to_notify.data == 'True'
+    time_notify = None
+    if to_notify and form.date_notify.data:
+        time_notify = datetime.datetime.combine(form.date_notify.data, form.time_notify.data or datetime.time())
+    recurrence, recurrence_end = form_recurrence(form, time_event_start, time_event_stop)
+    return {
+        'title': form.title.data,
+        'details': form.details.data,
+        'time_creation': now,
+        'all_day_event': all_day,
+        'time_event_start': time_event_start,
+        'time_event_stop': time_event_stop,
+        'to_notify': to_notify,
+        'time_notify': time_notify,
+        'author_uid': author_id,
+        'notification_sent': False,
+        'is_active': True,
+        'recurrence': recurrence,
+        'recurrence_end': recurrence_end,
+    }
+
+
+def max_rows_per_insert(connection, columns):
+    """
+    Number of rows in one multi-row INSERT (SQLite limits the number of bound parameters).
+    """
+    if connection.dialect.name == 'sqlite':
+        max_variables = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+        return max_variables // columns
+    return 1000
+
+
+class MultiRowInsert:
+    """
+    Multi-row INSERT statements with bind parameters named '<column>_<row number>'.
+    Statement is built and compiled only once for the given number of rows (compiling multi-row VALUES clause
+    costs more than executing it).
+    """
+    def __init__(self, table, columns, returning=None):
+        self.table = table
+        self.columns = columns
+        self.returning = returning
+        self._statements = {}
+        self._compiled_cache = {}
+
+    def statement(self, rows_count):
+        statement = self._statements.get(rows_count)
+        if statement is None:
+            statement = self.table.insert().values([
+                {column: db.bindparam(f'{column}_{i}', type_=self.table.c[column].type) for column in self.columns}
+                for i in range(rows_count)])
+            if self.returning is not None:
+                statement = statement.returning(self.returning)
+            self._statements[rows_count] = statement
+        return statement
+
+    def execute(self, connection, rows):
+        params = {f'{column}_{i}': row[column] for i, row in enumerate(rows) for column in self.columns}
+        return connection.execution_options(compiled_cache=self._compiled_cache) \
+            .execute(self.statement(len(rows)), params)
+
+
+def events_inserter(dialect_name):
+    """
+    Return multi-row INSERT of imported events - ids are returned by PostgreSQL and assigned explicitly on SQLite.
+    """
+    table = Event.__table__
+    if dialect_name == 'postgresql':
+        return MultiRowInsert(table, EVENT_COLUMNS, returning=table.c.id)
+    if dialect_name == 'sqlite':
+        return MultiRowInsert(table, ['id'] + EVENT_COLUMNS)
+    return MultiRowInsert(table, EVENT_COLUMNS)
+
+
+def insert_events(connection, rows, inserter):
+    """
+    Insert events with multi-row INSERT statements and return their ids (in the order of rows).
+    """
+    table = Event.__table__
+    ids = []
+    next_id = None
+    chunk = max_rows_per_insert(connection, len(inserter.columns))
+    for i in range(0, len(rows), chunk):
+        chunk_rows = rows[i:i + chunk]
+        if connection.dialect.name == 'postgresql':
+            # Rows of multi-row VALUES are inserted (and returned) in order.
+            ids.extend(row[0] for row in inserter.execute(connection, chunk_rows))
+        elif connection.dialect.name == 'sqlite':
+            # No RETURNING - ids are assigned explicitly. The db is locked for writing first (no-op UPDATE),
+            # so no other connection inserts events until the transaction ends.
+            if next_id is None:
+                connection.execute(table.update().where(false()).values(id=table.c.id))
+                next_id = (connection.execute(db.select([func.max(table.c.id)])).scalar() or 0) + 1
+            chunk_ids = list(range(next_id, next_id + len(chunk_rows)))
+            next_id += len(chunk_rows)
+            inserter.execute(connection, [dict(row, id=event_id) for event_id, row in zip(chunk_ids, chunk_rows)])
+            ids.extend(chunk_ids)
+        else:
+            for row in chunk_rows:
+                ids.append(connection.execute(Event.__table__.insert(), row).inserted_primary_key[0])
+    return ids
+
+
+def save_batch(batch, inserter):
+    """
+    Save batch of validated events (rows with ids of users to notify) in one transaction.
+    """
+    rows = [row for row, _ in batch]
+    with db.engine.begin() as connection:
+        ids = insert_events(connection, rows, inserter)
+        notified = [{'event_id': event_id, 'user_id': user_id}
+                    for event_id, (_, user_ids) in zip(ids, batch) for user_id in user_ids]
+        if notified:
+            connection.execute(user_to_event.insert(), notified)
+        # Bulk inserts bypass session hooks - update dashboard counters explicitly.
+        days = Counter(row['time_creation'].date() for row in rows)
+        apply_changes(connection, Counter(events=len(rows), events_active=len(rows)), days)
+    return ids
+
+
+def search_document(row):
+    return {field: row[field] for field in Event.__searchable__}
+
+
+def sync_search_index(events):
+    """
+    Add imported events (ids with search documents) to the search index with one bulk request.
+    """
+    if not events or not search_available():
+        return
+    actions = ({'_index': Event.__tablename__, '_id': event_id, '_source': document} for event_id, document in events)
+    helpers.bulk(current_app.elasticsearch, actions, raise_on_error=False)
+
+
+def import_events(stream, import_format, author, batch_size=1000):
+    """
+    Import events from the stream (CSV, NDJSON or iCalendar) with 'author' as events' author.
+    Every record is validated with 'NewEventForm' rules. Invalid records are skipped and reported.
+    """
+    result = ImportResult()
+    # One form (without CSRF) is reused for all records.
+    form = NewEventForm(formdata=MultiDict(), meta={'csrf': False})
+    inserter = events_inserter(db.engine.dialect.name)
+    records = []
+    # Users whose calendar feeds get new events
+    feed_users = {author.id}
+    # Imported events are added to the search index after the last batch (only searchable fields are kept)
+    search_documents = [] if current_app.elasticsearch else None
+
+    def flush():
+        # Resolve users to notify for the whole batch with one query.
+        usernames = {username for _, record in records for username in notified_usernames(record)}
+        users = dict(User.query.with_entities(User.username, User.id)
+                     .filter(User.username.in_(usernames), User.role_id == 2).all()) if usernames else {}
+        batch = []
+        now = datetime.datetime.utcnow()
+        for line_number, record in records:
+            unknown = [username for username in notified_usernames(record) if username not in users]
+            if unknown:
+                result.add_error(line_number, f'Unknown users to notify: {", ".join(unknown)}')
+                continue
+            form.process(formdata=record_to_formdata(record, users))
+            form.notified_user.choices = [(str(users[username]), username) for username in notified_usernames(record)]
+            if not form.validate():
+                result.add_error(line_number, '; '.join(f'{getattr(form, field).label.text}: {", ".join(errors)}'
+                                                        for field, errors in form.errors.items()))
+                continue
+            batch.append((form_to_row(form, author.id, now), [int(user_id) for user_id in form.notified_user.data]))
+        records.clear()
+        if batch:
+            ids = save_batch(batch, inserter)
+            feed_users.update(user_id for _, user_ids in batch for user_id in user_ids)
+            result.imported += len(ids)
+            if search_documents is not None:
+                search_documents.extend(zip(ids, (search_document(row) for row, _ in batch)))
+
+    for line_number, record in readable_records(READERS[import_format](stream)):
+        if isinstance(record, str):
+            result.add_error(line_number, record)
+            continue
+        records.append((line_number, record))
+        if len(records) >= batch_size:
+            flush()
+    flush()
+    if search_documents:
+        sync_search_index(search_documents)
+    if result.imported:
+        # Derived data normally maintained by session hooks
+        bump_generation()
+        invalidate_authors()
+        bump_feed_versions(feed_users)
+    return result
+
+
+events_cli = AppGroup('events', help='Events management.')
+
+
+@events_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--author', required=True, help='Username of imported events\' author.')
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS),
+              help='Input format (default: guessed from file extension).')
+@click.option('--batch-size', default=1000, show_default=True, help='Number of events saved in one transaction.')
+def import_command(file, author, file_format, batch_size):
+    """
+    Import events from CSV, NDJSON or iCalendar file.
+    """
+    file_format = file_format or import_format(file.name)
+    if not file_format:
+        raise click.UsageError('Unknown file format - use --format option.')
+    user = User.query.filter_by(username=author).first()
+    if user is None:
+        raise click.UsageError(f'User "{author}" does not exist.')
+    result = import_events(file, file_format, user, batch_size)
+    for line, message in result.errors:
+        click.echo(f'Line {line}: {message}', err=True)
+    click.echo(f'Imported events: {result.imported}, invalid records: {result.invalid}')
@@ -0,0 +1,104 @@
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from reminder.versions import get_version, bump_versions
+
+
+GENERATION_KEY = 'events_generation'
+
+
+def get_generation():
+    """
+    Return current "events generation" - the counter shared by all app processes (stored in the db) and bumped
+    on every commit which changes events.
+    The counter starts from the current time in ms, so it's also a timestamp of the last change.
+    """
+    return get_version(GENERATION_KEY)
+
+
+def bump_generation():
+    """
+    Invalidate all responses built from events data.
+    """
+    bump_versions([GENERATION_KEY])
+
+
+def generation_time(generation):
+    """
+    Time of the last events change (used as 'Last-Modified' header).
+    """
+    return datetime.datetime.utcfromtimestamp(generation // 1000)
+
+
+class GenerationCache:
+    """
+    Per-process LRU cache with entries valid only for the events generation they have been built for.
+    Optionally entry can also expire at given time (datetime).
+    """
+    def __init__(self, max_entries=256, config_key='EVENTS_CACHE_SIZE'):
+        self.max_entries = max_entries
+        self.config_key = config_key
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get(self.config_key, self.max_entries)
+
+    def get(self, key, generation, now=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_generation, expires, value = entry
+            if entry_generation != generation or (expires and (now or datetime.datetime.today()) >= expires):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, generation, value, expires=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (generation, expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def body_etag(body):
+    """
+    Strong ETag for response body.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+    return hashlib.md5(body).hexdigest()
+
+
+def conditional_response(response, generation, etag=None, private=False):
+    """
+    Add validators ('ETag', 'Last-Modified') to the response and turn it into '304 Not Modified' if the client
+    already has the current version.
+    """
+    if etag:
+        response.set_etag(etag)
+    else:
+        response.add_etag()
+    response.last_modified = generation_time(generation)
+    # Let clients keep the response, but always revalidate it.
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    return response.make_conditional(request)
+
+
+calendar_cache = GenerationCache()
+events_list_cache = GenerationCache()
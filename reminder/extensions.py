@@ -1,10 +1,38 @@
 """Extensions module. Each extension is initialized in the app factory located in __init__.py."""
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
 from flask_login import LoginManager
 from flask_apscheduler import APScheduler
 from flask_wtf.csrf import CSRFProtect
 from flask_caching import Cache
 
+from reminder.engines import engine_registry
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session which sends reads to a read replica engine when it is set in 'session.info['replica']'
+    (see 'reminder/replicas.py'). Writes (flushes and bulk updates/deletes) always go to the primary db.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get('replica')
+        if replica is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return replica
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(_SQLAlchemy):
+    """
+    Flask-SQLAlchemy with engines taken from the process-wide registry (shared with APScheduler job store)
+    and sessions able to read from replicas.
+    """
+    def create_engine(self, sa_url, engine_opts):
+        return engine_registry.get(sa_url, **engine_opts)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
 
 db = SQLAlchemy()
 login_manager = LoginManager()
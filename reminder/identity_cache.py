@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class IdentityCache:
+    """
+    Per-process cache of logged in users (User objects detached from the db session).
+    Entries expire after 'ttl' seconds and should be invalidated explicitly whenever user's data is changed.
+    """
+    def __init__(self, app=None):
+        self.ttl = 60
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+
+    def get(self, user_id):
+        """
+        Return cached user or None if there is no valid entry.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        user, expires = entry
+        if time.monotonic() >= expires:
+            self.invalidate(user_id)
+            return None
+        return user
+
+    def set(self, user_id, user):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,93 @@
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, or_
+
+from reminder.extensions import db
+from reminder.models import User
+
+
+class LastSeenTracker:
+    """
+    Write-behind buffer for the User.last_seen attribute.
+    Timestamps are kept in memory and written to the db in one bulk UPDATE at most once per 'resolution' seconds.
+    """
+    def __init__(self, app=None):
+        self.app = None
+        self.resolution = 60
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.resolution = app.config.get('LAST_SEEN_RESOLUTION', 60)
+
+    def record(self, user_id, seen=None):
+        """
+        Remember when the user was last seen (in memory only).
+        """
+        with self._lock:
+            self._pending[user_id] = seen or datetime.utcnow()
+
+    def flush_due(self):
+        """
+        Check whether buffered timestamps should be written to the db.
+        """
+        return time.monotonic() - self._last_flush >= self.resolution
+
+    def flush(self):
+        """
+        Write all buffered timestamps to the db in one bulk UPDATE. Newer timestamps written by other app processes
+        are not overwritten.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        user_table = User.__table__
+        stmt = user_table.update() \
+            .where(user_table.c.id == bindparam('user_id')) \
+            .where(or_(user_table.c.last_seen.is_(None), user_table.c.last_seen < bindparam('seen'))) \
+            .values(last_seen=bindparam('seen'))
+        try:
+            # Use a separate connection - do not commit anything pending in the request session.
+            with db.engine.begin() as connection:
+                connection.execute(stmt, [{'user_id': user_id, 'seen': seen} for user_id, seen in pending.items()])
+        except Exception:
+            # Put timestamps back (unless newer ones have been recorded in the meantime) and try on next flush.
+            with self._lock:
+                for user_id, seen in pending.items():
+                    self._pending.setdefault(user_id, seen)
+            raise
+        return len(pending)
+
+    def touch(self, user_id):
+        """
+        Record user activity and flush the buffer if the resolution interval has elapsed.
+        Failed flush doesn't fail the request - timestamps are kept and written on next flush.
+        """
+        self.record(user_id)
+        if self.flush_due():
+            try:
+                self.flush()
+            except Exception:
+                # App logger only - the general logger writes to the db (which may be the cause of the failure)
+                current_app.logger.exception('Failed to write users\' last seen timestamps')
+
+    def flush_on_exit(self):
+        """
+        Flush remaining timestamps when the process is shutting down.
+        """
+        if self.app is None:
+            return
+        with self.app.app_context():
+            self.flush()
+
+
+last_seen_tracker = LastSeenTracker()
@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import current_app
+
+from reminder.extensions import db
+from reminder.models import User
+from reminder.identity_cache import identity_cache
+
+
+class LoginThrottle:
+    """
+    Throttling of failed logins.
+    Failures per client IP and per existing account are counted in memory (sliding window, per app process).
+    The db is written only when the account's limit is crossed - the account is blocked with one conditional
+    UPDATE. Failed logins are written to the auth log as one summary record per client IP at most once per
+    'audit_interval' seconds.
+    """
+    def __init__(self, app=None):
+        self.app = None
+        self.window = 900
+        self.user_limit = 3
+        self.ip_limit = 20
+        self.audit_interval = 60
+        self.max_keys = 100000
+        self._failures = defaultdict(deque)
+        self._audit = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_sweep = time.monotonic()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.window = app.config.get('LOGIN_FAILURE_WINDOW', 900)
+        self.user_limit = app.config.get('LOGIN_USER_MAX_FAILURES', 3)
+        self.ip_limit = app.config.get('LOGIN_IP_MAX_FAILURES', 20)
+        self.audit_interval = app.config.get('LOGIN_AUDIT_INTERVAL', 60)
+        self.max_keys = app.config.get('LOGIN_THROTTLE_MAX_KEYS', 100000)
+
+    def _count(self, key, now):
+        """
+        Drop failures older than the window and return number of the remaining ones (lock must be held).
+        """
+        failures = self._failures.get(key)
+        if failures is None:
+            return 0
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return 0
+        return len(failures)
+
+    def _sweep(self, now):
+        """
+        Drop client IPs and accounts without failures within the window - at most once per minute or when there are
+        too many of them (lock must be held). If still too many, the keys with the oldest failures are dropped.
+        """
+        if len(self._failures) < self.max_keys and now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        self._failures = defaultdict(deque, {key: failures for key, failures in self._failures.items()
+                                             if failures and failures[-1] > now - self.window})
+        if len(self._failures) >= self.max_keys:
+            keep = sorted(self._failures, key=lambda key: self._failures[key][-1])[-(self.max_keys // 2):]
+            self._failures = defaultdict(deque, {key: self._failures[key] for key in keep})
+
+    def ip_blocked(self, ip):
+        """
+        Check whether login attempts from the IP are rejected (too many failed logins within the window).
+        """
+        with self._lock:
+            return self._count(ip, time.monotonic()) >= self.ip_limit
+
+    def failure(self, ip, username):
+        """
+        Record failed login from the IP (in memory).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._count(ip, now)
+            self._failures[ip].append(now)
+            ip_failures = len(self._failures[ip])
+            # Summary of too many client IPs is logged as one record
+            audit_key = ip if ip in self._audit or len(self._audit) < self.max_keys else 'other IPs'
+            count, usernames = self._audit.get(audit_key, (0, set()))
+            # Only number of distinct usernames is logged - the set is limited as well
+            if len(usernames) < self.max_keys:
+                usernames.add(username)
+            self._audit[audit_key] = (count + 1, usernames)
+        if ip_failures == self.ip_limit:
+            current_app.logger_auth.warning(f'Login attempts from {ip} have been throttled')
+        if self.flush_due():
+            self.flush()
+
+    def register_failure(self, user, ip, username):
+        """
+        Record failed login. The account is blocked (in the db) when its failures within the window reach the limit.
+        """
+        self.failure(ip, username)
+        if user is None or not user.access_granted:
+            return
+        now = time.monotonic()
+        key = ('user', user.id)
+        with self._lock:
+            self._count(key, now)
+            self._failures[key].append(now)
+            user_failures = len(self._failures[key])
+        if user_failures < self.user_limit:
+            return
+        table = User.__table__
+        blocked = db.session.execute(table.update()
+                                     .where(table.c.id == user.id)
+                                     .where(table.c.access_granted == True)
+                                     .values(access_granted=False, failed_login_attempts=user_failures)).rowcount
+        db.session.commit()
+        db.session.expire(user)
+        self.reset_user(user.id)
+        if blocked:
+            identity_cache.invalidate(user.id)
+            current_app.logger_auth.warning(f'User "{username}" account has been blocked')
+
+    def reset_user(self, user_id):
+        """
+        Forget failed logins of the account (e.g. after successful login or when admin has unblocked it).
+        """
+        with self._lock:
+            self._failures.pop(('user', user_id), None)
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= self.audit_interval
+
+    def flush(self):
+        """
+        Write summary of failed logins (one record per client IP) to the auth log.
+        """
+        with self._lock:
+            audit, self._audit = self._audit, {}
+            self._last_flush = time.monotonic()
+        for ip, (count, usernames) in audit.items():
+            current_app.logger_auth.warning(f'Failed to log in: {count} attempt(s) from {ip}, '
+                                            f'{len(usernames)} username(s)')
+        return len(audit)
+
+    def flush_on_exit(self):
+        """
+        Write remaining failed logins summary when the process is shutting down.
+        """
+        if self.app is None:
+            return
+        with self.app.app_context():
+            self.flush()
+
+
+login_throttle = LoginThrottle()
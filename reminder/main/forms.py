@@ -1,8 +1,11 @@
+import datetime
+
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, DateField, TimeField, SelectMultipleField
-from wtforms.validators import InputRequired, Length
+from wtforms import StringField, SelectField, DateField, TimeField, SelectMultipleField, IntegerField
+from wtforms.validators import InputRequired, Length, Optional, NumberRange, ValidationError
 
 from reminder.custom_wtforms import DateOrTimeChecker
+from reminder.recurrence import RECURRENCE_FREQUENCIES, MAX_OCCURRENCES, build_rule, exceeds_max_occurrences
 
 
 class NewEventForm(FlaskForm):
@@ -33,4 +36,47 @@ class NewEventForm(FlaskForm):
                             validators=[DateOrTimeChecker(other_field='date_event_start',
                                                           earlier_than=True)])
     time_notify = TimeField(label='Reminder time')
-    notified_user = SelectMultipleField(label='Users to notify')
\ No newline at end of file
+    notified_user = SelectMultipleField(label='Users to notify')
+    # Recurring event - repeated until the date or the number of occurrences (forever if none of them is set).
+    repeat = SelectField(label='Repeat',
+                         choices=RECURRENCE_FREQUENCIES,
+                         default='')
+    repeat_until = DateField(label='Repeat until',
+                             validators=[Optional(),
+                                         DateOrTimeChecker(other_field='date_event_start',
+                                                           later_than=True)])
+    repeat_count = IntegerField(label='Occurrences',
+                                validators=[Optional(),
+                                            NumberRange(min=1, max=MAX_OCCURRENCES)])
+
+    def validate_repeat_until(self, field):
+        """
+        Series repeated until the date can't have more occurrences than series with COUNT limit.
+        """
+        if not field.data or not self.repeat.data or not self.date_event_start.data:
+            return
+        start = datetime.datetime.combine(self.date_event_start.data, self.time_event_start.data or datetime.time())
+        if exceeds_max_occurrences(build_rule(self.repeat.data, until=field.data), start):
+            raise ValidationError(f'The event can be repeated at most {MAX_OCCURRENCES} times.')
+
+
+class OccurrenceForm(FlaskForm):
+    """
+    Validators for changed occurrence of recurring event.
+    """
+    title = StringField(label='Title',
+                        validators=[InputRequired(),
+                                    Length(max=80)])
+    details = StringField(label='Details',
+                          validators=[Length(max=300)])
+    date_event_start = DateField(label='Event start',
+                                 validators=[InputRequired()])
+    time_event_start = TimeField(label='Event start time')
+    date_event_stop = DateField(label='Event stop',
+                                validators=[InputRequired(),
+                                            DateOrTimeChecker(other_field='date_event_start',
+                                                              later_than=True)])
+    time_event_stop = TimeField(label='Event stop time',
+                                validators=[DateOrTimeChecker(other_field='time_event_start',
+                                                              later_than=True,
+                                                              time_check=True)])
@@ -1,17 +1,28 @@
 import datetime
+import json
 import time
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort, current_app, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, session, \
+    make_response, stream_with_context
 from flask_login import current_user
 from werkzeug.exceptions import HTTPException
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, case
 import elasticsearch.exceptions
 
 from reminder.extensions import db
-from reminder.models import User, Event
+from reminder.replicas import use_replica, primary_reads
+from reminder.models import User, Event, EventException
+from reminder.last_seen import last_seen_tracker
+from reminder.events_cache import get_generation, calendar_cache, events_list_cache, body_etag, conditional_response
+from reminder.pagination import keyset_paginate
+from reminder.current_authors import get_current_authors
+from reminder.event_import import import_events, import_format, IMPORT_FORMATS
+from reminder.recurrence import SERIES_COLUMNS, RECURRENCE_FREQUENCIES, series_filter, window_occurrences, \
+    fetch_exceptions, next_occurrence, make_occurrence, is_occurrence, form_recurrence, recurrence_label, rule_parts
+from reminder.calendar_feed import feed_version, feed_token, feed_user, reset_feed_secret, feed_cache, cached_feed
 from reminder.custom_decorators import admin_required, login_required, cancel_click
 from reminder.custom_wtforms import flash_errors
-from reminder.main.forms import NewEventForm
+from reminder.main.forms import NewEventForm, OccurrenceForm
 
 
 main_bp = Blueprint('main_bp', __name__,
@@ -32,10 +43,10 @@ def str_to_datetime(date_str, time_str=None):
 def update_last_seen():
     """
     Update when the current user was last seen (User.last_seen attribute).
+    The timestamp is buffered in memory and written to the db periodically (see LAST_SEEN_RESOLUTION).
     """
     if current_user.is_authenticated:
-        current_user.user_seen()
-        db.session.commit()
+        last_seen_tracker.touch(current_user.id)
 
 
 @main_bp.route('/')
@@ -58,86 +69,112 @@ def admin_portal():
     return redirect(url_for('admin_bp.dashboard'))
 
 
-def events_authors_func(today, today_only_day):
+def current_events_filter(today, today_only_day):
     """
-    Fetch all current event's authors from db
+    Filter for current events (not finished yet or all day events finishing today).
+    Recurring event is current until its last occurrence day.
     """
-    author_ids = set([_.author_uid for _ in Event.query.filter(and_(or_(Event.time_event_start >= today,
-                                                                        Event.time_event_stop >= today,
-                                                                        and_(Event.all_day_event == True,
-                                                                             Event.time_event_stop == today_only_day))),
-                                                               Event.is_active == True, ).all()])
-    users = User.get_all_standard_users()
-    # Check whether user is author (prepare list of authors)
-    event_authors = [user for user in users if user.id in author_ids]
-    return event_authors, author_ids
+    return and_(or_(Event.time_event_start >= today,
+                    Event.time_event_stop >= today,
+                    and_(Event.all_day_event == True,
+                         Event.time_event_stop == today_only_day),
+                    and_(Event.recurrence != None,
+                         or_(Event.recurrence_end == None, Event.recurrence_end >= today_only_day))),
+                Event.is_active == True)
 
 
 @main_bp.route('/events_list')
+@use_replica
 def events_list():
     """
     Display all events in list format.
     """
-    today = datetime.datetime.today()
+    # The list is built with minute resolution - the same page can be served from cache within a minute.
+    today = datetime.datetime.today().replace(second=0, microsecond=0)
     today_only_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
     page = request.args.get('page', 1, type=int)
     events_per_page = 10
-    # Fetch all current event's authors from db.
-    event_authors, author_ids = events_authors_func(today, today_only_day)
+    # Current event's authors (from cache).
+    event_authors, author_ids = get_current_authors(today, today_only_day)
     # Get 'author_id' from query param
     author_id = request.args.get('id', type=int)
+    # Only columns displayed on the list are fetched (with author's username instead of User object).
+    events_query = db.session.query(Event.id,
+                                    Event.title,
+                                    Event.details,
+                                    Event.time_event_start,
+                                    Event.time_event_stop,
+                                    Event.all_day_event,
+                                    Event.time_notify,
+                                    Event.recurrence,
+                                    User.username.label('author')).outerjoin(User, Event.author_uid == User.id)
     if not request.args or request.args.get('list') == 'current':
         # Show only active events:
-        events = Event.query.filter(
-            and_(or_(Event.time_event_start >= today,
-                     Event.time_event_stop >= today,
-                     and_(Event.all_day_event == True,
-                          Event.time_event_stop == today_only_day))),
-            Event.is_active == True).order_by("time_event_start").paginate(page, events_per_page, True)
+        list_key = ('current', None)
+        events_query = events_query.filter(current_events_filter(today, today_only_day))
     elif request.args.get('list') == 'own':
         if not current_user.is_authenticated:
             abort(404)
-        events = Event.query.filter(
-            and_(or_(Event.time_event_start >= today,
-                     Event.time_event_stop >= today,
-                     and_(Event.all_day_event == True, Event.time_event_stop == today_only_day))),
-            Event.is_active == True, Event.author == current_user).order_by("time_event_start") \
-            .paginate(page, events_per_page, True)
+        list_key = ('own', current_user.id)
+        events_query = events_query.filter(current_events_filter(today, today_only_day),
+                                           Event.author_uid == current_user.id)
     elif request.args.get('list') == 'all':
         # Show ALL events (current and old events)
-        events = Event.query.filter(Event.is_active == True).order_by("time_event_start") \
-            .paginate(page, events_per_page, True)
+        list_key = ('all', None)
+        events_query = events_query.filter(Event.is_active == True)
     elif request.args.get('list') == 'author' and author_id in author_ids:
         # Show current events by user.
-        events = Event.query.filter(
-            and_(or_(Event.time_event_start >= today,
-                     Event.time_event_stop >= today,
-                     and_(Event.all_day_event == True,
-                          Event.time_event_stop == today_only_day))),
-            Event.is_active == True,
-            Event.author_uid == str(author_id)).order_by("time_event_start").paginate(page, events_per_page, True)
+        list_key = ('author', author_id)
+        events_query = events_query.filter(current_events_filter(today, today_only_day),
+                                           Event.author_uid == author_id)
     elif request.args.get('list') == 'author' and author_id not in author_ids:
         return redirect(url_for('main_bp.events_list'))
     else:
         abort(404)
+    # Keyset pagination - the page is defined by cursor ('after' or 'before'), 'page' is only page's number.
+    after, before = request.args.get('after'), request.args.get('before')
+    # Serve page from cache if no event has changed since it was fetched.
+    generation = get_generation()
+    cache_key = list_key + (after, before, today)
+    events = events_list_cache.get(cache_key, generation)
+    if events is None:
+        # Cached page is read from the primary db (not from possibly lagging replica)
+        with primary_reads():
+            # Total number of events is counted lazily - once per events generation (not for each page).
+            count_key = list_key + ('count', today)
+            total = events_list_cache.get(count_key, generation)
+            if total is None:
+                total = events_query.order_by(None).count()
+                events_list_cache.set(count_key, generation, total)
+            try:
+                events = keyset_paginate(events_query, [Event.time_event_start, Event.id], events_per_page,
+                                         after=after, before=before, page=page, total=total)
+            except ValueError:
+                abort(404)
+        events_list_cache.set(cache_key, generation, events)
+    # Recurring events are shown with their next occurrence - expanded only for the events on the page.
+    series = [event for event in events.items if event.recurrence]
+    exceptions = fetch_exceptions([event.id for event in series])
+    occurrences = {event.id: next_occurrence(event, exceptions[event.id], today) for event in series}
+    occurrences = {event_id: occurrence for event_id, occurrence in occurrences.items() if occurrence}
+    repeats = {event.id: recurrence_label(event.recurrence) for event in series}
     # URLs for pagination navigation
     next_url = url_for('main_bp.events_list',
                        list=request.args.get('list', 'current'),
                        id=request.args.get('id'),
+                       after=events.next_cursor,
                        page=events.next_num) if events.has_next else None
     prev_url = url_for('main_bp.events_list',
                        list=request.args.get('list', 'current'),
                        id=request.args.get('id'),
+                       before=events.prev_cursor,
                        page=events.prev_num) if events.has_prev else None
     # Remember additional URL in session, if last event on page - for event deactivation feature
     if session.get('prev_endpoint_dea'):
          del session['prev_endpoint_dea']
     events_on_current_page = len(events.items)
-    if events_on_current_page == 1 and not page == 1:
-        session['prev_endpoint_dea'] = url_for('main_bp.events_list',
-                                           list=request.args.get('list'),
-                                           id=request.args.get('id'),
-                                           page=page - 1)
+    if events_on_current_page == 1 and prev_url:
+        session['prev_endpoint_dea'] = prev_url
     # Remember current url in session (for back-redirect)
     if not request.args:
         session['prev_endpoint'] = url_for('main_bp.events_list')
@@ -145,15 +182,76 @@ def events_list():
         session['prev_endpoint'] = url_for('main_bp.events_list',
                                             list=request.args.get('list'),
                                             id=request.args.get('id'),
+                                            after=after,
+                                            before=before,
                                             page=page)
-    return render_template('events_list.html',
-                           events=events,
-                           title='List',
-                           today=today,
-                           today_only_day=today_only_day,
-                           event_authors=event_authors,
-                           next_url=next_url,
-                           prev_url=prev_url)
+    response = make_response(render_template('events_list.html',
+                                             events=events,
+                                             occurrences=occurrences,
+                                             repeats=repeats,
+                                             title='List',
+                                             today=today,
+                                             today_only_day=today_only_day,
+                                             event_authors=event_authors,
+                                             next_url=next_url,
+                                             prev_url=prev_url))
+    return conditional_response(response, generation, private=True)
+
+
+def event_color_expr(today, today_only_day):
+    """
+    SQL expression classifying event's color on calendar: blue - upcoming, green - in progress, red - finished.
+    """
+    return case([(Event.time_event_start >= today, 'blue'),
+                 (or_(Event.time_event_stop >= today,
+                      and_(Event.all_day_event == True, Event.time_event_stop >= today_only_day)), 'green')],
+                else_='red')
+
+
+def occurrence_color(occurrence, today, today_only_day):
+    """
+    Color of recurring event's occurrence on calendar (the same rules as in 'event_color_expr').
+    """
+    if occurrence.time_event_start >= today:
+        return 'blue'
+    if occurrence.time_event_stop >= today or \
+            (occurrence.all_day_event and occurrence.time_event_stop >= today_only_day):
+        return 'green'
+    return 'red'
+
+
+def calendar_events_to_json(rows):
+    """
+    Serialize calendar rows (id, title, start, stop, all_day, details, color) to compact FullCalendar JSON.
+    Only the free-text fields go through the JSON encoder - the rest of the document is pre-encoded.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    template = '{"id":%d,"title":%s,"start":"%s","end":"%s","allDay":%s,' \
+               '"backgroundColor":"%s","borderColor":"%s","extendedProps":{"details":%s}}'
+    return '[' + ','.join(template % (event_id,
+                                      encode(title),
+                                      start.isoformat(),  # ISO format '2020-04-12T14:30:00'
+                                      stop.isoformat(),
+                                      'true' if all_day else 'false',
+                                      color,
+                                      color,
+                                      encode(details))
+                          for event_id, title, start, stop, all_day, details, color in rows) + ']'
+
+
+def calendar_colors_expire(rows, today):
+    """
+    Return the nearest time at which color of any of calendar rows changes (None if colors never change).
+    """
+    transitions = []
+    for _, _, start, stop, all_day, _, _ in rows:
+        transitions.append(start)
+        transitions.append(stop)
+        if all_day:
+            # All day events stay 'in progress' until the end of the stop day.
+            transitions.append(stop.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1))
+    upcoming = [transition for transition in transitions if transition >= today]
+    return min(upcoming) + datetime.timedelta(microseconds=1) if upcoming else None
 
 
 @main_bp.route('/api/events')
@@ -162,43 +260,111 @@ def get_events():
     API for FullCalendar.
     """
     today = datetime.datetime.today()
+    today_only_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
     date_start, date_end = request.args['start'], request.args['end']
     # Create datetime objects for calendar view date limits.
     try:
         date_start_dt = datetime.datetime(int(date_start[:4]), int(date_start[5:7]), int(date_start[8:10]))
         date_end_dt = datetime.datetime(int(date_end[:4]), int(date_end[5:7]), int(date_end[8:10]))
-        # Fetch all events for current calendar view (with 'is_active=True').
-        events = Event.query.filter(Event.time_event_start >= date_start_dt,
-                                    Event.time_event_start <= date_end_dt,
-                                    Event.is_active == True).all()
     except ValueError:
         abort(404)
-    events_api = []
-    for event in events:
-        if event.time_event_start >= today:
-            background_color = 'blue'
-            border_color = 'blue'
-        elif event.time_event_stop >= today or (event.all_day_event and event.time_event_stop.date() == today.date()):
-            background_color = 'green'
-            border_color = 'green'
-        else:
-            background_color = 'red'
-            border_color = 'red'
-
-        event_dic = {
-            'id': event.id,
-            'title': event.title,
-            'start': event.time_event_start.isoformat(), # ISO format '2020-04-12T14:30:00'
-            'end': event.time_event_stop.isoformat(),
-            'allDay': event.all_day_event,
-            'backgroundColor': background_color,
-            'borderColor': border_color,
-            'extendedProps': {
-                "details": event.details,
-            },
-        }
-        events_api.append(event_dic)
-    return jsonify(events_api)
+    # Serve calendar from cache if no event has changed (and no event's color has changed) since it was built.
+    generation = get_generation()
+    cache_key = (date_start_dt, date_end_dt)
+    cached = calendar_cache.get(cache_key, generation, now=today)
+    if cached:
+        body, etag = cached
+        return conditional_response(current_app.response_class(body, mimetype='application/json'), generation, etag)
+    # Calendar is cached - it's read from the primary db (not from possibly lagging replica).
+    with primary_reads():
+        # Fetch all events (with 'is_active=True') overlapping calendar view - only columns required by calendar.
+        events = db.session.query(Event.id,
+                                  Event.title,
+                                  Event.time_event_start,
+                                  Event.time_event_stop,
+                                  Event.all_day_event,
+                                  Event.details,
+                                  event_color_expr(today, today_only_day)) \
+            .filter(Event.is_active == True,
+                    Event.recurrence == None,
+                    Event.time_event_stop >= date_start_dt,
+                    Event.time_event_start <= date_end_dt) \
+            .order_by(Event.time_event_start).all()
+        # Recurring events - only occurrences within calendar view are expanded.
+        series = db.session.query(*SERIES_COLUMNS).filter(Event.is_active == True,
+                                                          series_filter(date_start_dt, date_end_dt)).all()
+        if series:
+            events.extend((occurrence.id, occurrence.title, occurrence.time_event_start, occurrence.time_event_stop,
+                           occurrence.all_day_event, occurrence.details,
+                           occurrence_color(occurrence, today, today_only_day))
+                          for occurrence in window_occurrences(series, date_start_dt, date_end_dt))
+            events.sort(key=lambda row: row[2])
+    body = calendar_events_to_json(events).encode()
+    etag = body_etag(body)
+    calendar_cache.set(cache_key, generation, (body, etag), expires=calendar_colors_expire(events, today))
+    return conditional_response(current_app.response_class(body, mimetype='application/json'), generation, etag)
+
+
+@main_bp.route('/calendar/<token>.ics')
+def calendar_feed(token):
+    """
+    User's calendar feed (iCalendar) - events authored by the user or the user is notified about.
+    Feed is identified by signed token, so calendar clients can subscribe to it without logging in.
+    """
+    user = feed_user(token)
+    if user is None or not user.access_granted:
+        abort(404)
+    # Client's copy is up to date if no event of the user has changed since - no db query needed.
+    version = feed_version(user.id)
+    etag = f'{user.id}-{version}'
+    if request.if_none_match.contains(etag):
+        return conditional_response(current_app.response_class(), version, etag, private=True)
+    body = feed_cache.get(user.id, version)
+    if body is None:
+        body = stream_with_context(cached_feed(user, request.host, version))
+    response = current_app.response_class(body, mimetype='text/calendar')
+    response.headers['Content-Disposition'] = 'inline; filename="events.ics"'
+    return conditional_response(response, version, etag, private=True)
+
+
+@main_bp.route('/calendar_feed')
+@login_required
+def calendar_feed_info():
+    """
+    Display URL of the current user's calendar feed.
+    """
+    feed_url = url_for('main_bp.calendar_feed', token=feed_token(current_user), _external=True)
+    return render_template('calendar_feed.html', title='Calendar feed', feed_url=feed_url)
+
+
+@main_bp.route('/calendar_feed/regenerate', methods=['POST'])
+@login_required
+def regenerate_calendar_feed():
+    """
+    Replace URL of the current user's calendar feed - the previous URL stops working.
+    """
+    reset_feed_secret(current_user.id)
+    current_app.logger_general.info(f'Calendar feed URL has been regenerated by "{current_user}"')
+    flash('New calendar feed URL has been generated - update your calendar subscriptions!', 'success')
+    return redirect(url_for('main_bp.calendar_feed_info'))
+
+
+@main_bp.route('/api/users')
+@login_required
+def get_users():
+    """
+    API for users to notify picker - users with 'user' role whose username starts with 'q' (one page).
+    """
+    per_page = min(request.args.get('limit', 20, type=int), 50)
+    try:
+        users = User.search_standard_users(request.args.get('q', ''), max(per_page, 1),
+                                           after=request.args.get('after'))
+    except ValueError:
+        abort(400)
+    return current_app.response_class(json.dumps({'users': [{'id': user.id, 'username': user.username}
+                                                            for user in users.items],
+                                                  'next': users.next_cursor}),
+                                      mimetype='application/json')
 
 
 @main_bp.route('/new_event', methods=['GET', 'POST'])
@@ -208,11 +374,12 @@ def new_event():
     """
     Add new event to db.
     """
-    users_to_notify = User.get_all_standard_users()
     today = datetime.date.today().strftime("%Y-%m-%d")
+    users_to_notify = []
     if request.method == "POST":
         form = NewEventForm()
-        # Add list of valid choices to 'notified_user' field (adding from an app context)
+        # Only chosen users are fetched (one query) - valid choices of 'notified_user' field
+        users_to_notify = User.get_standard_users_by_ids(request.form.getlist('notified_user'))
         form.notified_user.choices = [(str(user.id), user.username) for user in users_to_notify]
         # Form validation - sever-side
         if form.validate_on_submit():
@@ -227,7 +394,6 @@ def new_event():
             time_event_stop_form = request.form.get('time_event_stop')
             date_notify_form = request.form.get('date_notify')
             time_notify_form = request.form.get('time_notify')
-            users_form = request.form.getlist('notified_user')
             # Data to db
             to_notify_db = True if to_notify_form == 'True' else False
             time_notify_db = str_to_datetime(date_notify_form, time_notify_form) if date_notify_form else None
@@ -245,21 +411,47 @@ def new_event():
                           time_event_stop=time_event_stop_db,
                           to_notify=to_notify_db,
                           author_uid=current_user.id)
+            # Recurring event is stored as one row - occurrences are computed from the rule.
+            event.recurrence, event.recurrence_end = form_recurrence(form, time_event_start_db, time_event_stop_db)
             if to_notify_db:
                 event.time_notify = time_notify_db
+            # Assign users
+            event.notified_users = users_to_notify
             db.session.add(event)
-            # Assign user
-            for user_id in users_form:
-                user = User.query.get(user_id)
-                user.events_notified.append(event)
-                db.session.add(user)
             db.session.commit()
             flash('New event has been added!', 'success')
             current_app.logger_general.info(f'New event with id={event.id} has been added by "{current_user}"')
             return redirect(url_for('main_bp.index'))
         if form.errors:
             flash_errors(form)
-    return render_template('new_event.html', title='New event', users=users_to_notify, today=today)
+    return render_template('new_event.html', title='New event', users=users_to_notify, today=today,
+                           repeat={}, repeat_until='', frequencies=RECURRENCE_FREQUENCIES)
+
+
+@main_bp.route('/import_events', methods=['GET', 'POST'])
+@cancel_click()
+@login_required
+def events_import():
+    """
+    Import events from file (CSV, NDJSON or iCalendar).
+    """
+    if request.method == "POST":
+        file = request.files.get('file')
+        file_format = request.form.get('format') or (import_format(file.filename) if file else None)
+        if not file or not file.filename:
+            flash('Please choose a file to import!', 'danger')
+        elif file_format not in IMPORT_FORMATS:
+            flash('Unknown file format!', 'danger')
+        else:
+            result = import_events(file.stream, file_format, current_user)
+            for line, message in result.errors[:10]:
+                flash(f'Line {line}: {message}', 'danger')
+            flash(f'{result.imported} events have been imported, {result.invalid} records are invalid.',
+                  'success' if result.imported else 'warning')
+            current_app.logger_general.info(f'{result.imported} events have been imported by "{current_user}"')
+            if result.imported:
+                return redirect(url_for('main_bp.events_list'))
+    return render_template('import_events.html', title='Import events', formats=IMPORT_FORMATS)
 
 
 @main_bp.route('/event/<int:event_id>', methods=['GET', 'POST'])
@@ -269,14 +461,13 @@ def event(event_id):
     """
     Editing an event already existing in the db.
     """
-    event = Event.query.filter_by(id=event_id).first_or_404()
-    # Fetch users that can be notified (only with user role)
-    users_to_notify = User.get_all_standard_users()
+    event = Event.query.options(*Event.loading('recipients')).filter_by(id=event_id).first_or_404()
     today = datetime.date.today().strftime("%Y-%m-%d")
     if request.method == "POST":
         # Form validation - sever-side
         form = NewEventForm()
-        # Add list of valid choices to 'notified_user' field (adding from an app context)
+        # Only chosen users are fetched (one query) - valid choices of 'notified_user' field
+        users_to_notify = User.get_standard_users_by_ids(request.form.getlist('notified_user'))
         form.notified_user.choices = [(str(user.id), user.username) for user in users_to_notify]
         # Form validation - sever-side
         if form.validate_on_submit():
@@ -291,7 +482,6 @@ def event(event_id):
             time_event_stop_form = request.form.get('time_event_stop')
             date_notify_form = request.form.get('date_notify')
             time_notify_form = request.form.get('time_notify')
-            users_form = request.form.getlist('notified_user')
             # Data to db
             event.title = title_form
             event.details = details_form
@@ -305,11 +495,16 @@ def event(event_id):
             else:
                 time_event_start_db = str_to_datetime(date_event_start_form)
                 time_event_stop_db = str_to_datetime(date_event_stop_form)
+            recurrence, recurrence_end = form_recurrence(form, time_event_start_db, time_event_stop_db)
+            if event.recurrence and (recurrence, time_event_start_db) != (event.recurrence, event.time_event_start):
+                # Occurrences of the changed series are different - their exceptions are no longer valid.
+                event.exceptions.delete()
+            event.recurrence, event.recurrence_end = recurrence, recurrence_end
             event.time_event_start = time_event_start_db
             event.time_event_stop = time_event_stop_db
             # Set users to notify. If "to_notify = False" the list "user_form" is []
             # Overwrite current users to notify.
-            event.notified_users = [User.query.get(user_id) for user_id in users_form]
+            event.notified_users = users_to_notify
             db.session.commit()
             flash('Your changes have been saved!', 'success')
             current_app.logger_general.info(f'Event with id={event.id} has been changed by "{current_user}"')
@@ -319,7 +514,74 @@ def event(event_id):
             return redirect(url_for('main_bp.events_list'))
         if form.errors:
             flash_errors(form)
-    return render_template('event.html', event=event, title='Edit event', users=users_to_notify, today=today)
+    repeat = rule_parts(event.recurrence)
+    repeat_until = datetime.datetime.strptime(repeat['UNTIL'][:8], '%Y%m%d').strftime('%Y-%m-%d') \
+        if 'UNTIL' in repeat else ''
+    return render_template('event.html', event=event, title='Edit event', today=today,
+                           repeat=repeat, repeat_until=repeat_until, frequencies=RECURRENCE_FREQUENCIES)
+
+
+@main_bp.route('/event/<int:event_id>/occurrence/<occurrence>', methods=['GET', 'POST'])
+@cancel_click()
+@login_required
+def event_occurrence(event_id, occurrence):
+    """
+    Change, skip or restore one occurrence of recurring event.
+    """
+    event = Event.query.filter(Event.id == event_id, Event.recurrence != None).first_or_404()
+    try:
+        occurrence = datetime.datetime.fromisoformat(occurrence)
+    except ValueError:
+        abort(404)
+    if not is_occurrence(event, occurrence):
+        abort(404)
+    exception = event.exceptions.filter_by(occurrence=occurrence).first()
+    if request.method == "POST":
+        if request.form.get('restore-btn'):
+            # The occurrence gets the series' values again
+            if exception is not None:
+                db.session.delete(exception)
+                db.session.commit()
+            flash('The occurrence has been restored!', 'success')
+            current_app.logger_general.info(f'Occurrence {occurrence} of event with id={event.id} has been restored '
+                                            f'by "{current_user}"')
+            return redirect(session.get('prev_endpoint') or url_for('main_bp.events_list'))
+        if exception is None:
+            exception = EventException(event_id=event.id, occurrence=occurrence)
+            db.session.add(exception)
+        if request.form.get('skip-btn'):
+            exception.cancelled = True
+            db.session.commit()
+            flash('The occurrence has been skipped!', 'success')
+            current_app.logger_general.info(f'Occurrence {occurrence} of event with id={event.id} has been skipped '
+                                            f'by "{current_user}"')
+            return redirect(session.get('prev_endpoint') or url_for('main_bp.events_list'))
+        form = OccurrenceForm()
+        if form.validate_on_submit():
+            if form.time_event_start.data and form.time_event_stop.data and not event.all_day_event:
+                time_event_start = datetime.datetime.combine(form.date_event_start.data, form.time_event_start.data)
+                time_event_stop = datetime.datetime.combine(form.date_event_stop.data, form.time_event_stop.data)
+            else:
+                time_event_start = datetime.datetime.combine(form.date_event_start.data, datetime.time())
+                time_event_stop = datetime.datetime.combine(form.date_event_stop.data, datetime.time())
+            duration = event.time_event_stop - event.time_event_start
+            # Only values different from the series' values are stored.
+            exception.cancelled = False
+            exception.title = form.title.data if form.title.data != event.title else None
+            exception.details = form.details.data if form.details.data != event.details else None
+            exception.time_event_start = time_event_start if time_event_start != occurrence else None
+            exception.time_event_stop = time_event_stop if time_event_stop != time_event_start + duration else None
+            db.session.commit()
+            flash('Your changes have been saved!', 'success')
+            current_app.logger_general.info(f'Occurrence {occurrence} of event with id={event.id} has been changed '
+                                            f'by "{current_user}"')
+            return redirect(session.get('prev_endpoint') or url_for('main_bp.events_list'))
+        db.session.rollback()
+        flash_errors(form)
+    # Skipped occurrence is shown with the series' values (it can be restored or changed)
+    skipped = exception is not None and exception.cancelled
+    return render_template('occurrence.html', event=event, title='Edit occurrence', skipped=skipped,
+                           occurrence=make_occurrence(event, occurrence, None if skipped else exception))
 
 
 @main_bp.route('/dea_event/<int:event_id>')
@@ -329,7 +591,7 @@ def deactive_event(event_id):
     Remove event from 'events_list' - only deactivate event (not delete).
     """
     event = Event.query.filter_by(id=event_id).first()
-    if (current_user.id != event.author.id) and (not current_user.is_admin()):
+    if (current_user.id != event.author_uid) and (not current_user.is_admin()):
         flash("Sorry! You can't delete someone's event!", 'danger')
         if session.get('prev_endpoint'):
             return redirect(session['prev_endpoint'])
@@ -350,6 +612,7 @@ def deactive_event(event_id):
 
 
 @main_bp.route('/events_list/search')
+@use_replica
 def search():
     """
     Search engine for main blueprint
@@ -359,14 +622,15 @@ def search():
         return redirect(session.get('prev_endpoint'))
     today = datetime.datetime.today()
     today_only_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
-    # Fetch all current event's authors from db.
-    event_authors = events_authors_func(today, today_only_day)[0]
+    # Current event's authors (from cache).
+    event_authors = get_current_authors(today, today_only_day)[0]
     page = request.args.get('page', 1, type=int)
     events_per_page = 3
     # Return only 'is_active' events using elasticsearch query filter
     filter_data = {'is_active': True}
     try:
-        events, total = Event.search(request.args.get('q'), page, events_per_page, filter_data)
+        events, total = Event.search(request.args.get('q'), page, events_per_page, filter_data,
+                                     options=Event.loading('list'))
     except (elasticsearch.exceptions.RequestError, TypeError):
         abort(404)
     next_url = url_for('main_bp.search', q=request.args.get('q'), page=page + 1) \
@@ -421,6 +685,12 @@ def page_not_found(error):
     return render_template('404.html'), 404
 
 
+@main_bp.app_errorhandler(503)
+def service_unavailable(error):
+    # E.g. password hashing pool is busy - the client should retry
+    return render_template('503.html', error=error), 503, {'Retry-After': '5'}
+
+
 @main_bp.app_errorhandler(HTTPException)
 def handle_bad_request(error):
     return render_template('404.html'), 400
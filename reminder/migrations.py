@@ -0,0 +1,329 @@
+"""
+Versioned schema migrations.
+Each migration is applied once (its version is stored in 'schema_version' table). Indexes are created online
+(CREATE INDEX CONCURRENTLY on PostgreSQL), so migrations can be applied to production tables in use.
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text, MetaData, Table, Column, String
+
+from reminder.extensions import db
+from reminder.models import SchemaVersion, DashboardCounter, EventDailyStat, Event, EventException, Notification, \
+    User
+from reminder.dashboard_stats import rebuild_stats
+from reminder.notify_config import encrypt_setting
+from reminder.versions import cache_version
+
+
+# Columns dropped from the models - still added by older migrations (data is moved by the later ones)
+LEGACY_COLUMNS = Table('notification', MetaData(), Column('mail_password', String(120))).c
+
+
+class AddIndex:
+    """
+    Migration step - create index (if it doesn't exist yet).
+
+    :param columns:
+        List of column names or SQL expressions, e.g. ['lower(title)', 'id']
+    :param where:
+        Condition of partial index (SQL expression).
+    """
+    def __init__(self, name, table, columns, where=None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+
+    def __str__(self):
+        return f'add index {self.name} on {self.table}'
+
+    def sql(self, dialect):
+        quote = dialect.identifier_preparer.quote
+        columns = ', '.join(column if '(' in column else quote(column) for column in self.columns)
+        concurrently = ' CONCURRENTLY' if dialect.name == 'postgresql' else ''
+        statement = f'CREATE INDEX{concurrently} {quote(self.name)} ON {quote(self.table)} ({columns})'
+        if self.where:
+            statement += f' WHERE {self.where}'
+        return statement
+
+    def apply(self, connection):
+        dialect = connection.dialect
+        if dialect.name == 'postgresql':
+            # Index build with CONCURRENTLY that failed leaves an invalid index behind - drop it and try again.
+            valid = connection.execute(text('SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+                                            'WHERE c.relname = :name'), name=self.name).scalar()
+            if valid:
+                return False
+            if valid is not None:
+                connection.execute(f'DROP INDEX CONCURRENTLY {dialect.identifier_preparer.quote(self.name)}')
+        elif (self.table, self.name) in existing_indexes(connection):
+            return False
+        connection.execute(self.sql(dialect))
+        return True
+
+
+class CreateTable:
+    """
+    Migration step - create table (if it doesn't exist yet) with its indexes.
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def __str__(self):
+        return f'create table {self.table.name}'
+
+    def apply(self, connection):
+        if self.table.exists(connection):
+            return False
+        self.table.create(connection)
+        return True
+
+
+class AddColumn:
+    """
+    Migration step - add nullable column (if it doesn't exist yet). Adding a column without default value doesn't
+    rewrite the table.
+    """
+    def __init__(self, column):
+        self.column = column
+
+    def __str__(self):
+        return f'add column {self.column.name} to {self.column.table.name}'
+
+    def apply(self, connection):
+        table = self.column.table.name
+        if self.column.name in {column['name'] for column in inspect(connection).get_columns(table)}:
+            return False
+        quote = connection.dialect.identifier_preparer.quote
+        column_type = self.column.type.compile(dialect=connection.dialect)
+        connection.execute(f'ALTER TABLE {quote(table)} ADD COLUMN {quote(self.column.name)} {column_type}')
+        return True
+
+
+class RunFunction:
+    """
+    Migration step - run function with db connection as an argument (e.g. data migration).
+    """
+    def __init__(self, function, description):
+        self.function = function
+        self.description = description
+
+    def __str__(self):
+        return self.description
+
+    def apply(self, connection):
+        self.function(connection)
+        return True
+
+
+def encrypt_mail_password(connection):
+    """
+    Move plain text mail password to the encrypted column.
+    """
+    rows = connection.execute(text('SELECT id, mail_password FROM notification '
+                                   'WHERE mail_password IS NOT NULL')).fetchall()
+    for config_id, password in rows:
+        connection.execute(text('UPDATE notification SET mail_password_encrypted = :encrypted, mail_password = NULL, '
+                                'config_version = coalesce(config_version, 0) + 1 WHERE id = :id'),
+                           encrypted=encrypt_setting(password), id=config_id)
+
+
+def existing_indexes(connection):
+    """
+    Return indexes existing in the db: {(table, index name)}.
+    Read from db catalog, because reflection skips expression-based indexes (e.g. lower(title)) on SQLite.
+    """
+    if connection.dialect.name == 'sqlite':
+        rows = connection.execute(text("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'"))
+    elif connection.dialect.name == 'postgresql':
+        rows = connection.execute(text('SELECT tablename, indexname FROM pg_indexes '
+                                       'WHERE schemaname = current_schema()'))
+    else:
+        inspector = inspect(connection)
+        rows = [(table, index['name']) for table in inspector.get_table_names()
+                for index in inspector.get_indexes(table)]
+    return {(table, name) for table, name in rows}
+
+
+class Migration:
+    """
+    Set of schema changes with version number.
+    """
+    def __init__(self, version, description, steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+MIGRATIONS = [
+    Migration(1, 'Hot-path indexes', [
+        # Notification service - events due to be notified (partial index)
+        AddIndex('ix_event_due_notify', 'event', ['time_notify'],
+                 where='to_notify AND is_active AND NOT notification_sent'),
+        # Calendar view
+        AddIndex('ix_event_active_stop_start', 'event', ['is_active', 'time_event_stop', 'time_event_start']),
+        # Events lists (keyset pagination)
+        AddIndex('ix_event_start_id', 'event', ['time_event_start', 'id']),
+        AddIndex('ix_event_stop_id', 'event', ['time_event_stop', 'id']),
+        AddIndex('ix_event_active_start_id', 'event', ['is_active', 'time_event_start', 'id']),
+        AddIndex('ix_event_notify_start_id', 'event', ['to_notify', 'time_event_start', 'id']),
+        AddIndex('ix_event_lower_title_id', 'event', ['lower(title)', 'id']),
+        # Author's events
+        AddIndex('ix_event_author_start', 'event', ['author_uid', 'time_event_start']),
+        # Users to notify (both directions of many-to-many relationship)
+        AddIndex('ix_user_to_event_user_event', 'user_to_event', ['user_id', 'event_id']),
+        AddIndex('ix_user_to_event_event_user', 'user_to_event', ['event_id', 'user_id']),
+        # Logs list and logs expiration
+        AddIndex('ix_log_time', 'log', ['time']),
+    ]),
+    Migration(2, 'Dashboard statistics', [
+        CreateTable(DashboardCounter.__table__),
+        CreateTable(EventDailyStat.__table__),
+        RunFunction(rebuild_stats, 'fill dashboard counters and events daily rollup'),
+    ]),
+    Migration(3, 'Users lookup index', [
+        AddIndex('ix_user_role_lower_username', 'user', ['role_id', 'lower(username)', 'id']),
+    ]),
+    Migration(4, 'Recurring events', [
+        AddColumn(Event.__table__.c.recurrence),
+        AddColumn(Event.__table__.c.recurrence_end),
+        AddColumn(Event.__table__.c.notified_until),
+        CreateTable(EventException.__table__),
+        # Recurring events (series) overlapping requested time window (partial index)
+        AddIndex('ix_event_series', 'event', ['recurrence_end', 'time_event_start'],
+                 where='recurrence IS NOT NULL'),
+    ]),
+    Migration(5, 'Shared mail config', [
+        AddColumn(Notification.__table__.c.mail_server),
+        AddColumn(Notification.__table__.c.mail_port),
+        AddColumn(Notification.__table__.c.mail_security),
+        AddColumn(Notification.__table__.c.mail_username),
+        AddColumn(LEGACY_COLUMNS.mail_password),
+        AddColumn(Notification.__table__.c.config_version),
+    ]),
+    Migration(6, 'Calendar feed secrets', [
+        AddColumn(User.__table__.c.feed_secret),
+    ]),
+    Migration(7, 'Encrypted mail password', [
+        AddColumn(Notification.__table__.c.mail_password_encrypted),
+        RunFunction(encrypt_mail_password, 'encrypt stored mail password'),
+    ]),
+    Migration(8, 'Shared cache versions', [
+        CreateTable(cache_version),
+    ]),
+]
+
+
+def current_version(connection):
+    """
+    Return the latest applied migration version (0 if no migration has been applied).
+    """
+    SchemaVersion.__table__.create(connection, checkfirst=True)
+    return connection.execute(db.select([db.func.max(SchemaVersion.version)])).scalar() or 0
+
+
+def upgrade(target=None, echo=print):
+    """
+    Apply all pending migrations (up to 'target' version).
+    """
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Indexes are created concurrently, which can't be done inside a transaction.
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        version = current_version(connection)
+        applied = []
+        for migration in MIGRATIONS:
+            if migration.version <= version or (target is not None and migration.version > target):
+                continue
+            echo(f'Applying migration {migration.version}: {migration.description}')
+            for step in migration.steps:
+                changed = step.apply(connection)
+                echo(f'  {step}{"" if changed else " - already exists"}')
+            connection.execute(SchemaVersion.__table__.insert(),
+                               version=migration.version,
+                               description=migration.description,
+                               applied=datetime.utcnow())
+            applied.append(migration.version)
+    return applied
+
+
+def declared_indexes():
+    """
+    Indexes the app relies on - declared on models and created by migrations: {(table, index name)}.
+    """
+    indexes = {(table.name, index.name) for table in db.metadata.tables.values() for index in table.indexes}
+    for migration in MIGRATIONS:
+        indexes.update((step.table, step.name) for step in migration.steps if isinstance(step, AddIndex))
+    return indexes
+
+
+def index_report(connection):
+    """
+    Report indexes missing in the db and (on PostgreSQL) unused indexes and tables read mostly by sequential scans.
+    """
+    report = {
+        'missing': sorted(declared_indexes() - existing_indexes(connection)),
+        'unused': [],
+        'seq_scanned': [],
+    }
+    if connection.dialect.name == 'postgresql':
+        # Statistics collected since the last stats reset.
+        report['unused'] = connection.execute(text(
+            'SELECT s.relname, s.indexrelname, s.idx_scan, pg_size_pretty(pg_relation_size(s.indexrelid)) '
+            'FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid '
+            'WHERE s.idx_scan = 0 AND NOT i.indisunique AND NOT i.indisprimary '
+            'ORDER BY pg_relation_size(s.indexrelid) DESC')).fetchall()
+        report['seq_scanned'] = connection.execute(text(
+            'SELECT relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup '
+            'FROM pg_stat_user_tables '
+            'WHERE seq_scan > coalesce(idx_scan, 0) AND n_live_tup > :min_rows '
+            'ORDER BY seq_tup_read DESC'), min_rows=1000).fetchall()
+    return report
+
+
+schema_cli = AppGroup('schema', help='Database schema migrations.')
+
+
+@schema_cli.command('upgrade')
+@click.option('--target', type=int, help='Upgrade to given version (default: latest).')
+def upgrade_command(target):
+    """
+    Apply pending migrations.
+    """
+    applied = upgrade(target, echo=click.echo)
+    if not applied:
+        click.echo('Schema is up to date.')
+
+
+@schema_cli.command('version')
+def version_command():
+    """
+    Show current schema version.
+    """
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo(f'Current version: {version}, latest version: {MIGRATIONS[-1].version}')
+
+
+@schema_cli.command('index-report')
+def index_report_command():
+    """
+    Report missing and unused indexes.
+    """
+    with db.engine.connect() as connection:
+        report = index_report(connection)
+        dialect_name = connection.dialect.name
+    click.echo('Missing indexes:')
+    for table, name in report['missing']:
+        click.echo(f'  {table}.{name}')
+    if dialect_name != 'postgresql':
+        click.echo(f'Index usage statistics are not available for {dialect_name} db.')
+        return
+    click.echo('Unused indexes (no scans since stats reset):')
+    for table, name, scans, size in report['unused']:
+        click.echo(f'  {table}.{name} ({size})')
+    click.echo('Tables read mostly by sequential scans (index candidates):')
+    for table, seq_scan, seq_tup_read, idx_scan, rows in report['seq_scanned']:
+        click.echo(f'  {table}: {seq_scan} seq scans ({seq_tup_read} rows read), {idx_scan} index scans, {rows} rows')
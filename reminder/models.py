@@ -1,19 +1,38 @@
 from datetime import datetime, timedelta
+from itertools import chain
 
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin, AnonymousUserMixin
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload, configure_mappers
 
 from reminder.extensions import db, login_manager
 from reminder.search import add_to_index, remove_from_index, query_index
+from reminder.identity_cache import identity_cache
+from reminder.events_cache import bump_generation
+from reminder.pagination import keyset_paginate
+from reminder.passwords import password_pool
 
 
 @login_manager.user_loader
 def load_user(user_id):
     """
-    Load user to login
+    Load user to login.
+    The user (together with the user's role) is cached per process, so on cache hit no query is issued.
     """
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user = identity_cache.get(user_id)
+    if user is None:
+        # Load user and user's role in the same query
+        user = User.query.options(joinedload(User.role)).get(user_id)
+        if user is None:
+            return None
+        # Keep detached (session independent) objects in cache
+        db.session.expunge(user)
+        if user.role is not None:
+            db.session.expunge(user.role)
+        identity_cache.set(user_id, user)
+    # Attach a copy of cached user to the current session without querying the db
+    return db.session.merge(user, load=False)
 
 
 class SearchableMixin:
@@ -22,14 +41,14 @@ class SearchableMixin:
     an associated full-text index.
     """
     @classmethod
-    def search(cls, expression, page, per_page, filter_data=None):
+    def search(cls, expression, page, per_page, filter_data=None, options=()):
         ids, total = query_index(cls.__tablename__, expression, page, per_page, filter_data)
         if total == 0:
             return cls.query.filter_by(id=0), 0
         when = []
         for i in range(len(ids)):
             when.append((ids[i], i))
-        return cls.query.filter(cls.id.in_(ids)).order_by(
+        return cls.query.options(*options).filter(cls.id.in_(ids)).order_by(
             db.case(when, value=cls.id)), total
 
     @classmethod
@@ -63,10 +82,38 @@ db.event.listen(db.session, 'before_commit', SearchableMixin.before_commit)
 db.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
 
 
+def track_events_changes(session, flush_context):
+    """
+    Remember whether any event has been added, changed or deleted in the current transaction.
+    """
+    if any(isinstance(obj, (Event, EventException)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['events_changed'] = True
+
+
+def events_changes_commit(session):
+    """
+    Bump "events generation" (invalidate cached events responses) when committed transaction changed events.
+    """
+    if session.info.pop('events_changed', False):
+        bump_generation()
+
+
+def events_changes_rollback(session):
+    session.info.pop('events_changed', None)
+
+
+db.event.listen(db.session, 'after_flush', track_events_changes)
+db.event.listen(db.session, 'after_commit', events_changes_commit)
+db.event.listen(db.session, 'after_rollback', events_changes_rollback)
+
+
 # Association Table
 user_to_event = db.Table('user_to_event',
                          db.Column('user_id', db.Integer(), db.ForeignKey('user.id')),
-                         db.Column('event_id', db.Integer(), db.ForeignKey('event.id')))
+                         db.Column('event_id', db.Integer(), db.ForeignKey('event.id')),
+                         # Both directions of many-to-many relationship
+                         db.Index('ix_user_to_event_user_event', 'user_id', 'event_id'),
+                         db.Index('ix_user_to_event_event_user', 'event_id', 'user_id'))
 
 
 class Role(db.Model):
@@ -100,20 +147,34 @@ class User(UserMixin, db.Model):
                                       back_populates='notified_users')
     # Weather user can login by login page and add new notify records.
     access_granted = db.Column(db.Boolean, nullable=False)
-    role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
+    # Previous value is loaded on change - needed by dashboard counters (see 'reminder/dashboard_stats.py').
+    role_id = db.column_property(db.Column(db.Integer, db.ForeignKey('role.id')), active_history=True)
     last_seen = db.Column(db.DateTime)
     creation_date = db.Column(db.DateTime, default=datetime.utcnow)
     failed_login_attempts = db.Column(db.Integer, default=0)
     pass_change_req = db.Column(db.Boolean, default=False)
+    # Part of the calendar feed URL - a new secret revokes the previous URL (see 'reminder/calendar_feed.py')
+    feed_secret = db.Column(db.String(32))
 
     def __repr__(self):
         return f'{self.username}'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        # Passwords are hashed and verified by the pool of processes (see 'reminder/passwords.py')
+        self.password_hash = password_pool.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_pool.verify(self.password_hash, password)
+
+    def rehash_password(self, password):
+        """
+        Hash (already verified) password again if it has been hashed with other than current parameters
+        (PASSWORD_HASH_METHOD). Return True if the hash has been changed.
+        """
+        if not password_pool.needs_rehash(self.password_hash):
+            return False
+        self.set_password(password)
+        return True
 
     def is_admin(self):
         if self.role.name == 'admin':
@@ -130,20 +191,75 @@ class User(UserMixin, db.Model):
             users = cls.query.filter(cls.role_id == 2).all()
         return users
 
+    @classmethod
+    def get_standard_users_by_ids(cls, user_ids):
+        """
+        Method provides users with 'user' role from the list of ids (with one query). Invalid ids are skipped.
+        """
+        user_ids = {int(user_id) for user_id in user_ids if str(user_id).isdigit()}
+        if not user_ids:
+            return []
+        return cls.query.filter(cls.id.in_(user_ids), cls.role_id == 2).all()
+
+    @classmethod
+    def search_standard_users(cls, prefix, limit, after=None):
+        """
+        Method provides one page of users with 'user' role whose username starts with 'prefix' (case insensitive),
+        sorted by username. Next page starts after the 'after' cursor.
+        """
+        username = func.lower(cls.username)
+        query = cls.query.with_entities(cls.id, cls.username).filter(cls.role_id == 2)
+        prefix = prefix.lower()
+        if prefix:
+            # Range condition can be served by 'ix_user_role_lower_username' index, LIKE makes the match exact.
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(username >= prefix,
+                                 username < prefix[:-1] + chr(ord(prefix[-1]) + 1),
+                                 username.like(f'{escaped}%', escape='\\'))
+        return keyset_paginate(query, [username, cls.id], limit, after=after)
+
     def user_seen(self):
         self.last_seen = datetime.utcnow()
 
 
+# Recipients picker - standard users looked up by username prefix
+db.Index('ix_user_role_lower_username', User.role_id, func.lower(User.username), User.id)
+
+
 class AnonymousUser(AnonymousUserMixin):
     def is_admin(self):
         return False
 
 
+# Event's relationships used by views which render many events - loaded for the whole page (or batch) of events
+# with a fixed number of queries instead of one lazy load per event: the author is joined (one row per event),
+# notified users are loaded with one additional 'IN' query (many rows per event).
+EVENT_LOADING_PROFILES = {
+    # Events list with author's name (e.g. search results)
+    'list': {'author': joinedload},
+    # Events with recipients (e.g. notification service)
+    'recipients': {'notified_users': selectinload},
+    # Event with author and recipients
+    'detail': {'author': joinedload, 'notified_users': selectinload},
+}
+
+
 class Event(SearchableMixin, db.Model):
     """
     Events that will be notified.
     """
     __searchable__ = ['is_active', 'title', 'details']
+    __table_args__ = (
+        # Calendar view - events overlapping the requested time window
+        db.Index('ix_event_active_stop_start', 'is_active', 'time_event_stop', 'time_event_start'),
+        # Keyset pagination of events lists - sort column + id
+        db.Index('ix_event_start_id', 'time_event_start', 'id'),
+        db.Index('ix_event_stop_id', 'time_event_stop', 'id'),
+        db.Index('ix_event_active_start_id', 'is_active', 'time_event_start', 'id'),
+        db.Index('ix_event_notify_start_id', 'to_notify', 'time_event_start', 'id'),
+        # Author's events
+        db.Index('ix_event_author_start', 'author_uid', 'time_event_start'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     details = db.Column(db.String(300))
@@ -158,15 +274,67 @@ class Event(SearchableMixin, db.Model):
     author_uid = db.Column(db.Integer, db.ForeignKey('user.id'))
     # Weather the notification has already been sent.
     notification_sent = db.Column(db.Boolean, default=False)
-    is_active = db.Column(db.Boolean, default=True)
+    # Previous value is loaded on change - needed by dashboard counters (see 'reminder/dashboard_stats.py').
+    is_active = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
     # Who should be notified.
     notified_users = db.relationship('User',
                                      secondary=user_to_event,
                                      back_populates='events_notified')
+    # Recurrence rule (RRULE value, e.g. 'FREQ=WEEKLY;COUNT=10') - the event is the first occurrence of the series.
+    recurrence = db.Column(db.String(255))
+    # Stop time of the last occurrence (None - series repeats forever).
+    recurrence_end = db.Column(db.DateTime)
+    # Start time of the last occurrence of the series whose notification has been sent.
+    notified_until = db.Column(db.DateTime)
+    # Cancelled or changed occurrences of the series.
+    exceptions = db.relationship('EventException',
+                                 backref='event',
+                                 lazy='dynamic',
+                                 cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'Event {self.title}'
 
+    @classmethod
+    def loading(cls, profile):
+        """
+        Return loader options of the profile (see EVENT_LOADING_PROFILES), e.g. 'query.options(*Event.loading('list'))'.
+        """
+        # 'author' attribute is created by backref when mappers are configured
+        configure_mappers()
+        return [strategy(getattr(cls, name)) for name, strategy in EVENT_LOADING_PROFILES[profile].items()]
+
+
+# Keyset pagination of events sorted by title (case insensitive)
+db.Index('ix_event_lower_title_id', func.lower(Event.title), Event.id)
+# Notification service - events due to be notified
+db.Index('ix_event_due_notify', Event.time_notify,
+         postgresql_where=Event.to_notify & Event.is_active & ~Event.notification_sent,
+         sqlite_where=Event.to_notify & Event.is_active & ~Event.notification_sent)
+# Recurring events (series) overlapping requested time window
+db.Index('ix_event_series', Event.recurrence_end, Event.time_event_start,
+         postgresql_where=Event.recurrence.isnot(None),
+         sqlite_where=Event.recurrence.isnot(None))
+
+
+class EventException(db.Model):
+    """
+    Cancelled or changed occurrence of recurring event (identified by the original start time of the occurrence).
+    """
+    __tablename__ = 'event_exception'
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'occurrence'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    occurrence = db.Column(db.DateTime, nullable=False)
+    cancelled = db.Column(db.Boolean, nullable=False, default=False)
+    # Changed values of the occurrence (None - the same as series' value).
+    title = db.Column(db.String(100))
+    details = db.Column(db.String(300))
+    time_event_start = db.Column(db.DateTime)
+    time_event_stop = db.Column(db.DateTime)
+
 
 class Notification(db.Model):
     """
@@ -175,6 +343,15 @@ class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     notify_unit = db.Column(db.String(10), unique=True)
     notify_interval = db.Column(db.Integer)
+    # Mail server config changed by admin (None - value from app config, see 'reminder/notify_config.py').
+    mail_server = db.Column(db.String(50))
+    mail_port = db.Column(db.String(10))
+    mail_security = db.Column(db.String(10))
+    mail_username = db.Column(db.String(70))
+    # Encrypted with key derived from SECRET_KEY
+    mail_password_encrypted = db.Column(db.String(255))
+    # Bumped on every config change - app processes reload their config snapshot when it changes.
+    config_version = db.Column(db.Integer)
 
 
 class Log(SearchableMixin, db.Model):
@@ -183,7 +360,7 @@ class Log(SearchableMixin, db.Model):
     log_name = db.Column(db.String(20))
     level = db.Column(db.String(20))
     msg = db.Column(db.String(100))
-    time = db.Column(db.DateTime)
+    time = db.Column(db.DateTime, index=True)
 
     def __init__(self, log_name, level, time, msg):
         self.log_name = log_name
@@ -201,3 +378,31 @@ class Log(SearchableMixin, db.Model):
         db.session.commit()
 
 
+class DashboardCounter(db.Model):
+    """
+    Counters displayed on Admin Portal dashboard (kept up to date by session hooks - see 'reminder/dashboard_stats.py').
+    """
+    __tablename__ = 'dashboard_counter'
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class EventDailyStat(db.Model):
+    """
+    Number of events created per day (rollup for dashboard chart).
+    """
+    __tablename__ = 'event_daily_stat'
+    day = db.Column(db.Date, primary_key=True)
+    events_created = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaVersion(db.Model):
+    """
+    Applied schema migrations (see 'reminder/migrations.py').
+    """
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(100))
+    applied = db.Column(db.DateTime, default=datetime.utcnow)
+
+
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from dns import resolver
+import dns.exception
+import dns.rdatatype
+
+
+# Results of MX record lookup
+MX_FOUND = 'found'
+MX_NO_DOMAIN = 'no_domain'
+MX_NO_ANSWER = 'no_answer'
+MX_UNAVAILABLE = 'unavailable'
+# Cached results are kept for the record's TTL, but not shorter/longer than indicated (in seconds)
+MIN_TTL = 60
+MAX_TTL = 24 * 3600
+# TTL of negative results when the response has no SOA record
+NEGATIVE_TTL = 300
+
+
+def negative_ttl(response):
+    """
+    Return TTL of negative answer - minimum of SOA record's TTL and 'minimum' field (RFC 2308).
+    """
+    if response is not None:
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return NEGATIVE_TTL
+
+
+class MxResolver:
+    """
+    Per-process cache of e-mail domains' MX record lookups (positive and negative answers, expired
+    according to records' TTL). Concurrent lookups of the same domain are coalesced into one DNS query
+    and a lookup never takes longer than 'timeout' seconds.
+    """
+    def __init__(self, app=None):
+        self.timeout = 3.0
+        self.max_size = 4096
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.timeout = app.config.get('MX_RESOLVE_TIMEOUT', 3.0)
+        self.max_size = app.config.get('MX_CACHE_SIZE', 4096)
+
+    def lookup(self, domain):
+        """
+        Return result of MX record lookup for the domain (one of MX_* values).
+        """
+        domain = domain.lower().rstrip('.')
+        entry = self._entries.get(domain)
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        with self._lock:
+            in_flight = self._in_flight.get(domain)
+            leader = in_flight is None
+            if leader:
+                in_flight = self._in_flight[domain] = [threading.Event(), MX_UNAVAILABLE]
+        if not leader:
+            # The same domain is being resolved by another thread - wait for its result.
+            in_flight[0].wait(self.timeout)
+            return in_flight[1]
+        try:
+            result, ttl = self._resolve(domain)
+            if ttl:
+                self._store(domain, result, ttl)
+            in_flight[1] = result
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[domain]
+            in_flight[0].set()
+
+    def _resolve(self, domain):
+        """
+        Query DNS for MX record. Return result and how long (in seconds) it can be cached.
+        """
+        try:
+            answer = resolver.resolve(domain, 'MX', lifetime=self.timeout)
+        except resolver.NXDOMAIN as error:
+            responses = list(error.responses().values())
+            return MX_NO_DOMAIN, negative_ttl(responses[0] if responses else None)
+        except resolver.NoAnswer as error:
+            return MX_NO_ANSWER, negative_ttl(error.kwargs.get('response'))
+        except (resolver.NoResolverConfiguration, resolver.NoNameservers, dns.exception.Timeout):
+            # Temporary failure - not cached
+            return MX_UNAVAILABLE, 0
+        except dns.exception.DNSException:
+            # Other failure (e.g. malformed response or invalid domain name) - treated as temporary, but cached
+            # for a while so that repeated lookups don't hit DNS
+            return MX_UNAVAILABLE, NEGATIVE_TTL
+        return MX_FOUND, answer.rrset.ttl
+
+    def _store(self, domain, result, ttl):
+        ttl = min(max(ttl, MIN_TTL), MAX_TTL)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                # Drop expired entries, then the oldest ones
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+                while len(self._entries) >= self.max_size:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[domain] = (result, now + ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+mx_resolver = MxResolver()
@@ -0,0 +1,112 @@
+"""
+Notification service config (interval and mail server) shared by all app processes on all hosts.
+The config is stored in 'notification' table with version stamp bumped on every change. Each process keeps
+a snapshot of the config and reloads it only when the stored version differs from the snapshot's version.
+Mail password is stored encrypted (Fernet) with key derived from SECRET_KEY.
+"""
+import base64
+import hashlib
+import hmac
+import threading
+from collections import namedtuple
+
+from cryptography.fernet import Fernet, InvalidToken
+from flask import current_app
+from sqlalchemy import func
+
+from reminder.extensions import db
+from reminder.models import Notification
+
+
+# Mail settings -> app config keys with default values (used until admin changes the setting)
+MAIL_SETTINGS = {
+    'mail_server': 'MAIL_SERVER',
+    'mail_port': 'MAIL_PORT',
+    'mail_security': 'MAIL_SECURITY',
+    'mail_username': 'MAIL_DEFAULT_SENDER',
+    'mail_password': 'MAIL_PASSWORD',
+}
+
+NotifyConfig = namedtuple('NotifyConfig', ['id', 'version', 'notify_unit', 'notify_interval'] + list(MAIL_SETTINGS))
+
+
+def settings_cipher(secret_key=None):
+    """
+    Cipher of secret settings - the key is derived from SECRET_KEY, so the db alone doesn't reveal the secrets.
+    """
+    secret_key = secret_key or current_app.config['SECRET_KEY']
+    key = hmac.new(secret_key.encode(), b'notification-config', hashlib.sha256).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def encrypt_setting(value, secret_key=None):
+    return settings_cipher(secret_key).encrypt(value.encode()).decode()
+
+
+def decrypt_setting(token):
+    """
+    Return decrypted setting (None if it isn't set or can't be decrypted, e.g. SECRET_KEY has been changed).
+    """
+    if token is None:
+        return None
+    try:
+        return settings_cipher().decrypt(token.encode()).decode()
+    except InvalidToken:
+        current_app.logger_general.warning('Stored mail password can\'t be decrypted (has SECRET_KEY been changed?) '
+                                           '- MAIL_PASSWORD is used')
+        return None
+
+
+def stored_setting(config, name):
+    if name == 'mail_password':
+        return decrypt_setting(config.mail_password_encrypted)
+    return getattr(config, name)
+
+
+class NotifyConfigStore:
+    """
+    Per-process snapshot of notification service config.
+    """
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return config snapshot. Only the version stamp is read from the db - the whole config is loaded only when
+        it has been changed (by any process).
+        """
+        version = db.session.query(func.coalesce(Notification.config_version, 0)) \
+            .order_by(Notification.id).limit(1).scalar()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = self.load()
+        return snapshot
+
+    def load(self):
+        config = Notification.query.order_by(Notification.id).first()
+        stored = {name: stored_setting(config, name) for name in MAIL_SETTINGS}
+        mail_settings = {name: stored[name] if stored[name] is not None else current_app.config.get(config_key)
+                         for name, config_key in MAIL_SETTINGS.items()}
+        snapshot = NotifyConfig(config.id, config.config_version or 0, config.notify_unit, config.notify_interval,
+                                **mail_settings)
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def update(self, **values):
+        """
+        Save changed settings and bump version stamp (in one UPDATE) - all processes reload the config
+        on their next read.
+        """
+        snapshot = self.get()
+        if 'mail_password' in values:
+            values['mail_password_encrypted'] = encrypt_setting(values.pop('mail_password'))
+        values['config_version'] = func.coalesce(Notification.config_version, 0) + 1
+        Notification.query.filter(Notification.id == snapshot.id).update(values, synchronize_session=False)
+        db.session.commit()
+        with self._lock:
+            self._snapshot = None
+
+
+notify_config_store = NotifyConfigStore()
@@ -0,0 +1,138 @@
+import base64
+import binascii
+import datetime
+import json
+
+from sqlalchemy import tuple_, literal, and_, or_, false
+
+
+class KeysetPage:
+    """
+    Page of query results fetched with seek method (keyset pagination).
+    Cursors point to the first and the last item on the page, so each page costs the same regardless of its position.
+    """
+    def __init__(self, items, page, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def next_num(self):
+        return self.page + 1
+
+    @property
+    def prev_num(self):
+        return max(self.page - 1, 1)
+
+    @property
+    def pages(self):
+        """
+        Number of pages - only if the total number of items is known.
+        """
+        if self.total is None:
+            return None
+        return max((self.total + self.per_page - 1) // self.per_page, 1)
+
+
+def encode_cursor(values):
+    """
+    Encode sort key values to URL-safe cursor string.
+    """
+    payload = [{'dt': value.isoformat()} if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode cursor string to sort key values. Raise ValueError if cursor is invalid.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    if not isinstance(payload, list):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return [datetime.datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in payload]
+
+
+def nullable(key):
+    """
+    Check whether sort key is a nullable column (other SQL expressions are assumed not to be NULL).
+    """
+    return getattr(getattr(key, 'expression', key), 'nullable', False)
+
+
+def seek_filter(sort_keys, cursor, greater, nulls_first):
+    """
+    Return condition selecting rows after (greater) or before the cursor in ascending order of sort keys.
+    Row value comparison is used if no sort key is nullable, otherwise it's expanded to handle NULLs (NULL can't be
+    compared) - they are placed where the db sorts them, so ORDER BY is left as it is (and can use the index).
+    """
+    cursor_values = [literal(value, key.type) for key, value in zip(sort_keys, cursor)]
+    if not any(nullable(key) for key in sort_keys):
+        if greater:
+            return tuple_(*sort_keys) > tuple_(*cursor_values)
+        return tuple_(*sort_keys) < tuple_(*cursor_values)
+    conditions = []
+    equal = []
+    for key, value, cursor_value in zip(sort_keys, cursor, cursor_values):
+        if value is None:
+            # Either all values or none of them are on the seek side of NULL
+            condition = key.isnot(None) if greater == nulls_first else false()
+        else:
+            condition = key > cursor_value if greater else key < cursor_value
+            if nullable(key) and greater != nulls_first:
+                condition = or_(condition, key.is_(None))
+        conditions.append(and_(*equal, condition))
+        equal.append(key.is_(None) if value is None else key == cursor_value)
+    return or_(*conditions)
+
+
+def keyset_paginate(query, sort_keys, per_page, after=None, before=None, descending=False, page=1, total=None):
+    """
+    Fetch one page of query results ordered by 'sort_keys' (SQL expressions, the last one must be unique e.g. id).
+    The page starts right after the 'after' cursor or ends right before the 'before' cursor.
+    Sort key values are selected along with the items, so cursors are built from exactly the same values the db
+    compares (e.g. lower(title)). Sort keys may be nullable columns (see 'seek_filter').
+    """
+    keys_count = len(sort_keys)
+    query = query.add_columns(*[key.label(f'sort_key_{i}') for i, key in enumerate(sort_keys)])
+    backwards = before is not None and after is None
+    cursor = decode_cursor(before if backwards else after) if (after or before) else None
+    if cursor is not None:
+        if len(cursor) != keys_count:
+            raise ValueError('Cursor does not match sort keys')
+        # Seek forwards after the cursor or backwards before it.
+        # NULLs are sorted before other values by SQLite and MySQL, after them by PostgreSQL.
+        nulls_first = query.session.get_bind().dialect.name in ('sqlite', 'mysql')
+        query = query.filter(seek_filter(sort_keys, cursor, greater=descending == backwards, nulls_first=nulls_first))
+    if descending != backwards:
+        query = query.order_by(*[key.desc() for key in sort_keys])
+    else:
+        query = query.order_by(*[key.asc() for key in sort_keys])
+    # One extra row tells whether there is another page in that direction.
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    items = [row[0] if len(row) == keys_count + 1 else row for row in rows]
+    first_cursor = encode_cursor(rows[0][-keys_count:]) if rows else None
+    last_cursor = encode_cursor(rows[-1][-keys_count:]) if rows else None
+    if backwards:
+        next_cursor, prev_cursor = last_cursor, first_cursor if more else None
+    else:
+        next_cursor = last_cursor if more else None
+        prev_cursor = first_cursor if cursor is not None else None
+    return KeysetPage(items, page, per_page, next_cursor, prev_cursor, total)
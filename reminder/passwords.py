@@ -0,0 +1,192 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import click
+from flask.cli import AppGroup
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+def hash_method_stamp(method):
+    """
+    Return method as it is stored in password hash (e.g. 'pbkdf2:sha256' -> 'pbkdf2:sha256:150000').
+    """
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordPoolBusy(ServiceUnavailable):
+    description = 'Too many password checks in progress. Please try again in a moment.'
+
+
+class PasswordPool:
+    """
+    Bounded pool of processes which hash and verify passwords - PBKDF2 is deliberately CPU-heavy, so at most
+    'processes' passwords are hashed at once by the app process (with lowered CPU priority - 'nice') and a burst
+    of logins cannot take all the CPU time from the app workers. At most 'queue_size' operations wait for a free
+    process and an operation which doesn't finish within 'timeout' seconds raises 'PasswordPoolBusy' (503).
+    With 'processes' set to 0 passwords are hashed in the request's thread.
+    The processes are forked by 'start' before the app starts any threads (e.g. the scheduler) - forked processes
+    don't import the app's main module again (as processes started with spawn/forkserver do).
+    """
+    def __init__(self, app=None):
+        self.processes = 0
+        self.queue_size = 16
+        self.timeout = 5.0
+        self.nice = 10
+        self.method = 'pbkdf2:sha256'
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.processes = app.config.get('PASSWORD_POOL_PROCESSES', 0)
+        self.queue_size = app.config.get('PASSWORD_POOL_QUEUE', 16)
+        self.timeout = app.config.get('PASSWORD_POOL_TIMEOUT', 5.0)
+        self.nice = app.config.get('PASSWORD_POOL_NICE', 10)
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        self._slots = threading.BoundedSemaphore(self.processes + self.queue_size)
+
+    def start(self):
+        """
+        Fork the hashing processes (no-op if the pool is disabled or already running).
+        """
+        if self.processes:
+            self._get_executor()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # All processes are forked on the first submit - the pool is ready when 'start' returns
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('fork'),
+                                                     initializer=os.nice, initargs=(self.nice,))
+                self._executor.submit(int).result()
+            return self._executor
+
+    def _discard_executor(self, executor):
+        # Pool with a killed process can't be used any more - it is replaced on next use
+        with self._lock:
+            if executor is None or self._executor is executor:
+                executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        if not self.processes:
+            return func(*args)
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordPoolBusy()
+        executor = None
+        try:
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_executor(executor)
+            raise PasswordPoolBusy()
+        except Exception:
+            self._slots.release()
+            raise
+        # Slot is released when the operation is finished (also when the caller has stopped waiting for it).
+        future.add_done_callback(lambda done: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordPoolBusy()
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise PasswordPoolBusy()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """
+        Check whether the hash has been made with other parameters than the current PASSWORD_HASH_METHOD.
+        """
+        return password_hash.split('$', 1)[0] != hash_method_stamp(self.method)
+
+
+password_pool = PasswordPool()
+
+
+class PasswordHasher:
+    """
+    Hash many passwords in parallel on all CPU cores (e.g. bulk user import) - PBKDF2 releases the GIL, so threads
+    are used (the request's process may already run other threads, so it is not forked).
+    Threads are started on first use and reused until 'close' is called.
+    """
+    def __init__(self, threads=None, method=None):
+        self.threads = threads or os.cpu_count() or 1
+        self.method = method or password_pool.method
+        self._executor = None
+
+    def hash_many(self, passwords):
+        """
+        Return hashes of the passwords (in the same order).
+        """
+        if not passwords:
+            return []
+        if self.threads == 1:
+            return [generate_password_hash(password, self.method) for password in passwords]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='password-import')
+        return list(self._executor.map(partial(generate_password_hash, method=self.method), passwords))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def timed_pbkdf2(digest, iterations):
+    started = time.perf_counter()
+    hashlib.pbkdf2_hmac(digest, b'password', b'saltsalt', iterations)
+    return time.perf_counter() - started
+
+
+passwords_cli = AppGroup('passwords', help='Password hashing.')
+
+
+@passwords_cli.command('calibrate')
+@click.option('--target-ms', default=100, show_default=True, help='Target time of one password check.')
+@click.option('--digest', default='sha256', show_default=True, help='PBKDF2 hash function.')
+def calibrate_command(target_ms, digest):
+    """
+    Benchmark PBKDF2 on this host and print PASSWORD_HASH_METHOD which meets the target time of password check.
+    """
+    # Measure iterations per second (the best of a few runs)
+    sample_iterations = 20000
+    best = min(timed_pbkdf2(digest, sample_iterations) for _ in range(5))
+    iterations = max(int(sample_iterations / best * target_ms / 1000) // 1000 * 1000, 1000)
+    measured = timed_pbkdf2(digest, iterations)
+    click.echo(f'PBKDF2-{digest.upper()}: {sample_iterations / best:,.0f} iterations/s')
+    click.echo(f'{iterations} iterations take {measured * 1000:.0f} ms '
+               f'(werkzeug default {DEFAULT_PBKDF2_ITERATIONS} iterations take '
+               f'{timed_pbkdf2(digest, DEFAULT_PBKDF2_ITERATIONS) * 1000:.0f} ms)')
+    if iterations < DEFAULT_PBKDF2_ITERATIONS:
+        click.echo('Warning: the number of iterations is lower than werkzeug default - consider a longer '
+                   'target time.', err=True)
+    click.echo(f'Password checks per second per pool process: {1 / measured:.1f}')
+    click.echo(f'PASSWORD_HASH_METHOD=pbkdf2:{digest}:{iterations}')
+
@@ -0,0 +1,156 @@
+"""
+Per-request SQL instrumentation (SQL_STATS_ENABLED) - number of queries, total db time and repeated statements
+of each request (or scheduled job). A statement run many times by one request (e.g. relationship lazy-loaded
+for each row of a list) is reported as a possible N+1 query together with the view and the line which run it.
+"""
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Lists of bound parameters (e.g. 'IN (?, ?, ?)') differ only by length - they are reported as one statement.
+PARAMS_LIST_RE = re.compile(r'\(\s*(\?|%\(\w+\)s)(\s*,\s*(\?|%\(\w+\)s))*\s*\)')
+WHITESPACE_RE = re.compile(r'\s+')
+# Column lists are left out from the log
+COLUMNS_RE = re.compile(r'^SELECT .+? FROM ')
+
+
+def statement_shape(statement):
+    """
+    Return statement without variable parts (lists of parameters, whitespace).
+    """
+    return PARAMS_LIST_RE.sub('(...)', WHITESPACE_RE.sub(' ', statement)).strip()
+
+
+def caller_location(root_path):
+    """
+    Return the innermost app source line (or template) from the current stack, e.g. 'main/views.py:120'.
+    """
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename == __file__:
+            continue
+        if frame.filename.endswith('.html') or frame.filename.startswith(root_path):
+            return f'{frame.filename.replace(root_path, "").lstrip("/")}:{frame.lineno}'
+    return None
+
+
+class QueryStats:
+    """
+    Queries run by one request or job.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.locations = {}
+
+    def record(self, statement, duration, threshold, root_path):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.duration += duration
+        self.shapes[shape] += 1
+        # Stack is inspected only once per repeated statement
+        if self.shapes[shape] == threshold:
+            self.locations[shape] = caller_location(root_path)
+
+    def repeated(self, threshold):
+        """
+        Return statements run at least 'threshold' times: [(shape, count, location)].
+        """
+        return [(shape, count, self.locations.get(shape)) for shape, count in self.shapes.most_common()
+                if count >= threshold]
+
+
+class QueryInstrumentation:
+    """
+    Collect SQL statistics with engine events (all engines - the primary db and replicas).
+    Requests get 'X-Query-Count', 'X-Query-Time' (ms) and 'Server-Timing' (shown by browsers' dev tools)
+    response headers and possible N+1 queries are written to the general log.
+    """
+    def __init__(self, app=None):
+        self.enabled = False
+        self.threshold = 5
+        self.root_path = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SQL_STATS_ENABLED', False)
+        self.threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+        self.root_path = app.root_path
+        if not self.enabled:
+            return
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Statement might have been started before the listeners were added
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        started = started.pop()
+        stats = g.get('query_stats') if has_app_context() else None
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started, self.threshold, self.root_path)
+
+    def handle_error(self, context):
+        # Failed statement doesn't reach 'after_cursor_execute' - its start time is dropped, so that it isn't
+        # used for the next statement run on the (pooled) connection.
+        connection = context.connection
+        started = connection.info.get('query_started') if connection is not None else None
+        if started:
+            started.pop()
+
+    @contextmanager
+    def collect(self, name):
+        """
+        Collect statistics of queries run inside the block (e.g. by scheduled job) and log possible N+1 queries.
+        """
+        if not self.enabled:
+            yield None
+            return
+        previous = g.pop('query_stats', None)
+        g.query_stats = stats = QueryStats(name)
+        try:
+            yield stats
+        finally:
+            g.pop('query_stats', None)
+            if previous is not None:
+                g.query_stats = previous
+            self.report(stats)
+
+    def start_request(self):
+        g.query_stats = QueryStats(request.endpoint)
+
+    def finish_request(self, response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time'] = f'{stats.duration * 1000:.1f}'
+        response.headers.add('Server-Timing', f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"')
+        self.report(stats)
+        return response
+
+    def report(self, stats):
+        for shape, count, location in stats.repeated(self.threshold):
+            source = f' ({location})' if location else ''
+            current_app.logger_general.warning(f'Possible N+1 queries in "{stats.name}"{source}: '
+                                               f'{count} x {COLUMNS_RE.sub("SELECT ... FROM ", shape)[:200]}')
+
+
+query_stats = QueryInstrumentation()
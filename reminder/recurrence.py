@@ -0,0 +1,211 @@
+"""
+Recurring events.
+The series is stored as one 'event' row (the first occurrence) with RRULE in 'recurrence' column. Occurrences are
+never stored - they are expanded on demand, only within the requested time window. Cancelled or changed
+occurrences are stored in 'event_exception' table.
+"""
+from collections import namedtuple
+from itertools import islice
+
+from dateutil.rrule import rrulestr
+from sqlalchemy import and_, or_
+
+from reminder.models import Event, EventException
+
+
+RECURRENCE_FREQUENCIES = [('', 'Does not repeat'),
+                          ('DAILY', 'Daily'),
+                          ('WEEKLY', 'Weekly'),
+                          ('MONTHLY', 'Monthly'),
+                          ('YEARLY', 'Yearly')]
+# Max number of occurrences of series with COUNT or UNTIL limit
+MAX_OCCURRENCES = 1000
+
+# Occurrence of recurring event - 'occurrence' is the original start of the occurrence (identifies the occurrence).
+Occurrence = namedtuple('Occurrence', ['id', 'occurrence', 'title', 'details', 'time_event_start', 'time_event_stop',
+                                       'all_day_event', 'time_notify'])
+
+# Columns required to expand the series
+SERIES_COLUMNS = [Event.id, Event.title, Event.details, Event.time_event_start, Event.time_event_stop,
+                  Event.all_day_event, Event.time_notify, Event.recurrence]
+
+
+def build_rule(frequency, until=None, count=None):
+    """
+    Build RRULE value from the new event form's data.
+    """
+    parts = [f'FREQ={frequency}']
+    if count:
+        parts.append(f'COUNT={count}')
+    elif until:
+        # The last day is included
+        parts.append(f'UNTIL={until.strftime("%Y%m%d")}T235959')
+    return ';'.join(parts)
+
+
+def form_recurrence(form, time_event_start, time_event_stop):
+    """
+    Return recurrence rule and series end from the new event form's data ((None, None) for one-off event).
+    """
+    if not form.repeat.data:
+        return None, None
+    rule = build_rule(form.repeat.data, until=form.repeat_until.data, count=form.repeat_count.data)
+    return rule, series_end(rule, time_event_start, time_event_stop)
+
+
+def rule_parts(rule):
+    """
+    RRULE value as dict, e.g. {'FREQ': 'WEEKLY', 'COUNT': '10'}.
+    """
+    return dict(part.split('=', 1) for part in (rule or '').split(';') if '=' in part)
+
+
+def parse_rule(rule, start):
+    """
+    Parse RRULE value. Raise ValueError if rule is invalid.
+    """
+    return rrulestr(rule, dtstart=start)
+
+
+def series_end(rule, start, stop):
+    """
+    Return stop time of the last occurrence of the series (None if series repeats forever).
+    Limited series have at most MAX_OCCURRENCES occurrences (checked by the form).
+    """
+    parts = rule_parts(rule)
+    if 'COUNT' not in parts and 'UNTIL' not in parts:
+        return None
+    last = start
+    for last in islice(parse_rule(rule, start), MAX_OCCURRENCES):
+        pass
+    return last + (stop - start)
+
+
+def exceeds_max_occurrences(rule, start):
+    """
+    Check whether the series has more than MAX_OCCURRENCES occurrences (without expanding the whole series).
+    """
+    return next(islice(parse_rule(rule, start), MAX_OCCURRENCES, None), None) is not None
+
+
+def make_occurrence(series, start, exception=None):
+    """
+    Occurrence of the series starting at 'start' with exception's changes applied (None if occurrence is cancelled).
+    """
+    if exception is not None and exception.cancelled:
+        return None
+    duration = series.time_event_stop - series.time_event_start
+    time_event_start, time_event_stop, title, details = start, start + duration, series.title, series.details
+    if exception is not None:
+        time_event_start = exception.time_event_start or time_event_start
+        time_event_stop = exception.time_event_stop or time_event_start + duration
+        title = exception.title or title
+        details = exception.details if exception.details is not None else details
+    # Reminder is sent the same time before each occurrence.
+    time_notify = time_event_start - (series.time_event_start - series.time_notify) if series.time_notify else None
+    return Occurrence(series.id, start, title, details, time_event_start, time_event_stop, series.all_day_event,
+                      time_notify)
+
+
+def expand(series, exceptions, window_start, window_end):
+    """
+    Return occurrences of the series overlapping time window (sorted by start).
+    """
+    duration = series.time_event_stop - series.time_event_start
+    changed = {exception.occurrence: exception for exception in exceptions}
+    starts = set(parse_rule(series.recurrence, series.time_event_start)
+                 .between(window_start - duration, window_end, inc=True))
+    # Occurrences moved into the window
+    starts.update(start for start, exception in changed.items()
+                  if exception.time_event_start and exception.time_event_start <= window_end)
+    occurrences = []
+    for start in sorted(starts):
+        occurrence = make_occurrence(series, start, changed.get(start))
+        if occurrence and occurrence.time_event_start <= window_end and occurrence.time_event_stop >= window_start:
+            occurrences.append(occurrence)
+    occurrences.sort(key=lambda occurrence: occurrence.time_event_start)
+    return occurrences
+
+
+def next_occurrence(series, exceptions, now):
+    """
+    Return the first occurrence of the series not finished before 'now' (None if series has finished).
+    All day occurrences last until the end of their stop day.
+    """
+    duration = series.time_event_stop - series.time_event_start
+    if series.all_day_event:
+        now = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    changed = {exception.occurrence: exception for exception in exceptions}
+    # Only cancelled (or moved) occurrences have to be skipped.
+    for start in parse_rule(series.recurrence, series.time_event_start) \
+            .xafter(now - duration, count=len(changed) + 1, inc=True):
+        occurrence = make_occurrence(series, start, changed.get(start))
+        if occurrence and occurrence.time_event_stop >= now:
+            return occurrence
+    return None
+
+
+def due_occurrence(series, exceptions, now):
+    """
+    Return (start, occurrence) of the latest occurrence of the series whose reminder is due at 'now' and has not
+    been sent yet - occurrence is None if it has been skipped. Return (None, None) if no reminder is due.
+    """
+    offset = series.time_event_start - series.time_notify
+    start = parse_rule(series.recurrence, series.time_event_start).before(now + offset, inc=True)
+    if start is None or (series.notified_until and start <= series.notified_until):
+        return None, None
+    exception = next((exception for exception in exceptions if exception.occurrence == start), None)
+    return start, make_occurrence(series, start, exception)
+
+
+def is_occurrence(series, start):
+    """
+    Check whether the series has an occurrence starting at 'start'.
+    """
+    return parse_rule(series.recurrence, series.time_event_start).after(start, inc=True) == start
+
+
+def series_filter(window_start, window_end):
+    """
+    Filter for recurring events (series) overlapping time window.
+    """
+    return and_(Event.recurrence != None,
+                Event.time_event_start <= window_end,
+                or_(Event.recurrence_end == None, Event.recurrence_end >= window_start))
+
+
+def fetch_exceptions(series_ids):
+    """
+    Fetch exceptions of indicated series with one query: {series id: [exceptions]}.
+    """
+    exceptions = {series_id: [] for series_id in series_ids}
+    if series_ids:
+        for exception in EventException.query.filter(EventException.event_id.in_(series_ids)):
+            exceptions[exception.event_id].append(exception)
+    return exceptions
+
+
+def window_occurrences(series_rows, window_start, window_end):
+    """
+    Expand series (rows with SERIES_COLUMNS) to occurrences overlapping time window.
+    """
+    exceptions = fetch_exceptions([series.id for series in series_rows])
+    occurrences = []
+    for series in series_rows:
+        occurrences.extend(expand(series, exceptions[series.id], window_start, window_end))
+    return occurrences
+
+
+def recurrence_label(rule):
+    """
+    Human readable description of the recurrence rule, e.g. 'Weekly, 10 times'.
+    """
+    parts = rule_parts(rule)
+    label = dict(RECURRENCE_FREQUENCIES).get(parts.get('FREQ'), parts.get('FREQ', ''))
+    if parts.get('INTERVAL', '1') != '1':
+        label += f' (every {parts["INTERVAL"]})'
+    if 'COUNT' in parts:
+        label += f', {parts["COUNT"]} times'
+    elif 'UNTIL' in parts:
+        label += f', until {parts["UNTIL"][:4]}-{parts["UNTIL"][4:6]}-{parts["UNTIL"][6:8]}'
+    return label
@@ -0,0 +1,115 @@
+"""
+Routing of read-only views to read replicas of the db (REPLICA_DATABASE_URLS).
+Users' own writes are visible right after commit - for REPLICA_READ_YOUR_WRITES seconds after the commit
+the user's requests read from the primary db (the replicas may not have received the changes yet).
+"""
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import session, has_request_context
+from sqlalchemy import event
+
+from config import engine_options
+from reminder.engines import engine_registry
+from reminder.extensions import db, RoutingSession
+
+
+# Session key with time until which user's reads go to the primary db
+PRIMARY_UNTIL_KEY = '_primary_until'
+
+
+class ReplicaRouter:
+    """
+    Choose replica engine for read-only work.
+    """
+    def __init__(self):
+        self.urls = []
+        self.window = 0
+
+    def init_app(self, app):
+        self.urls = app.config['REPLICA_DATABASE_URLS']
+        self.window = app.config['REPLICA_READ_YOUR_WRITES']
+
+    def engine(self):
+        """
+        Return engine of randomly chosen replica (None if there are no replicas or current user has just
+        written to the db).
+        """
+        if not self.urls:
+            return None
+        if has_request_context() and session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+            return None
+        url = random.choice(self.urls)
+        return engine_registry.get(url, **engine_options(url))
+
+
+replica_router = ReplicaRouter()
+
+
+@contextmanager
+def replica_reads():
+    """
+    Send queries run inside the block to a read replica (queries must be run, not only built, inside the block).
+    """
+    info = db.session.info
+    previous = info.get('replica')
+    engine = replica_router.engine()
+    if engine is not None:
+        info['replica'] = engine
+    try:
+        yield
+    finally:
+        info['replica'] = previous
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send queries run inside the block to the primary db (also inside 'replica_reads' block).
+    Data cached for the current events generation must be read from the primary db - a lagging replica could
+    return data older than the generation and the stale entry would be served until the next change.
+    """
+    info = db.session.info
+    previous = info.pop('replica', None)
+    try:
+        yield
+    finally:
+        info['replica'] = previous
+
+
+def use_replica(view):
+    """
+    Decorator sends queries of read-only view to a read replica.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def mark_writes(db_session, flush_context):
+    db_session.info['has_writes'] = True
+
+
+@event.listens_for(RoutingSession, 'after_bulk_update')
+@event.listens_for(RoutingSession, 'after_bulk_delete')
+def mark_bulk_writes(context):
+    context.session.info['has_writes'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def read_your_writes(db_session):
+    """
+    Route current user's reads to the primary db for a while after the user's commit.
+    """
+    if db_session.info.pop('has_writes', False) and replica_router.urls and has_request_context():
+        session[PRIMARY_UNTIL_KEY] = time.time() + replica_router.window
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def forget_writes(db_session):
+    db_session.info.pop('has_writes', None)
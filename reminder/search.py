@@ -1,7 +1,31 @@
+import threading
+
 from flask import current_app
+from elasticsearch import Elasticsearch
 import json
 
 
+class LazyElasticsearch:
+    """
+    Elasticsearch client created on first use - app startup doesn't wait for it.
+    The object is false when no ELASTICSEARCH_URL is configured (like missing client).
+    """
+    def __init__(self, url):
+        self.url = url
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.url)
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = Elasticsearch([self.url])
+        return getattr(self._client, name)
+
+
 def add_to_index(index, model):
     """
     Function add entries to the index
@@ -7,6 +7,7 @@ CREATE DATABASE reminderdb OWNER reminderuser;
 --Connect to 'reminderdb'
 \c reminderdb
 
+DROP TABLE IF EXISTS "event_exception";
 DROP TABLE IF EXISTS "event";
 DROP TABLE IF EXISTS "log";
 DROP TABLE IF EXISTS "notification";
@@ -14,6 +15,10 @@ DROP TABLE IF EXISTS "role";
 DROP TABLE IF EXISTS "user";
 DROP TABLE IF EXISTS "user_to_event";
 DROP TABLE IF EXISTS "apscheduler_jobs";
+DROP TABLE IF EXISTS "schema_version";
+DROP TABLE IF EXISTS "dashboard_counter";
+DROP TABLE IF EXISTS "event_daily_stat";
+DROP TABLE IF EXISTS "cache_version";
 
 CREATE TABLE "role" (
   "id" SERIAL NOT NULL,
@@ -34,11 +39,13 @@ CREATE TABLE "user" (
   "creation_date" TIMESTAMP,
   "failed_login_attempts" INT,
   "pass_change_req" BOOLEAN,
+  "feed_secret" VARCHAR(32),
   PRIMARY KEY("id"),
   UNIQUE ("username"),
   UNIQUE ("email"),
   FOREIGN KEY("role_id") REFERENCES "role"("id")
 );
+CREATE INDEX "ix_user_role_lower_username" ON "user" ("role_id", lower("username"), "id");
 
 CREATE TABLE "event" (
   "id" SERIAL NOT NULL,
@@ -53,6 +60,9 @@ CREATE TABLE "event" (
   "author_uid" INT,
   "notification_sent" BOOLEAN,
   "is_active" BOOLEAN,
+  "recurrence" VARCHAR(255),
+  "recurrence_end" TIMESTAMP,
+  "notified_until" TIMESTAMP,
   PRIMARY KEY("id"),
   FOREIGN KEY("author_uid") REFERENCES "user"("id")
 );
@@ -60,6 +70,29 @@ CREATE INDEX "ix_event_time_creation" ON "event" ("time_creation");
 CREATE INDEX "ix_event_time_event_start" ON "event" ("time_event_start");
 CREATE INDEX "ix_event_time_event_stop" ON "event" ("time_event_stop");
 CREATE INDEX "ix_event_time_notify" ON "event" ("time_notify");
+CREATE INDEX "ix_event_active_stop_start" ON "event" ("is_active", "time_event_stop", "time_event_start");
+CREATE INDEX "ix_event_start_id" ON "event" ("time_event_start", "id");
+CREATE INDEX "ix_event_stop_id" ON "event" ("time_event_stop", "id");
+CREATE INDEX "ix_event_active_start_id" ON "event" ("is_active", "time_event_start", "id");
+CREATE INDEX "ix_event_notify_start_id" ON "event" ("to_notify", "time_event_start", "id");
+CREATE INDEX "ix_event_lower_title_id" ON "event" (lower("title"), "id");
+CREATE INDEX "ix_event_author_start" ON "event" ("author_uid", "time_event_start");
+CREATE INDEX "ix_event_due_notify" ON "event" ("time_notify") WHERE "to_notify" AND "is_active" AND NOT "notification_sent";
+CREATE INDEX "ix_event_series" ON "event" ("recurrence_end", "time_event_start") WHERE "recurrence" IS NOT NULL;
+
+CREATE TABLE "event_exception" (
+  "id" SERIAL NOT NULL,
+  "event_id" INT NOT NULL,
+  "occurrence" TIMESTAMP NOT NULL,
+  "cancelled" BOOLEAN NOT NULL,
+  "title" VARCHAR(100),
+  "details" VARCHAR(300),
+  "time_event_start" TIMESTAMP,
+  "time_event_stop" TIMESTAMP,
+  PRIMARY KEY("id"),
+  FOREIGN KEY("event_id") REFERENCES "event"("id"),
+  UNIQUE ("event_id", "occurrence")
+);
 
 CREATE TABLE "log" (
   "id" SERIAL NOT NULL,
@@ -69,11 +102,18 @@ CREATE TABLE "log" (
   "time" TIMESTAMP,
   PRIMARY KEY("id")
 );
+CREATE INDEX "ix_log_time" ON "log" ("time");
 
 CREATE TABLE "notification" (
   "id" SERIAL NOT NULL,
   "notify_unit" VARCHAR(10),
   "notify_interval" INT,
+  "mail_server" VARCHAR(50),
+  "mail_port" VARCHAR(10),
+  "mail_security" VARCHAR(10),
+  "mail_username" VARCHAR(70),
+  "mail_password_encrypted" VARCHAR(255),
+  "config_version" INT,
   PRIMARY KEY("id"),
   UNIQUE ("notify_unit")
 );
@@ -84,6 +124,46 @@ CREATE TABLE "user_to_event" (
   FOREIGN KEY("user_id") REFERENCES "user"("id"),
   FOREIGN KEY("event_id") REFERENCES "event"("id")
 );
+CREATE INDEX "ix_user_to_event_user_event" ON "user_to_event" ("user_id", "event_id");
+CREATE INDEX "ix_user_to_event_event_user" ON "user_to_event" ("event_id", "user_id");
+
+CREATE TABLE "schema_version" (
+  "version" INT NOT NULL,
+  "description" VARCHAR(100),
+  "applied" TIMESTAMP,
+  PRIMARY KEY("version")
+);
+
+-- Dashboard statistics (filled on the first dashboard load)
+CREATE TABLE "dashboard_counter" (
+  "name" VARCHAR(40) NOT NULL,
+  "value" INT NOT NULL,
+  PRIMARY KEY("name")
+);
+
+-- Version counters of cached data (see 'reminder/versions.py')
+CREATE TABLE "cache_version" (
+  "name" VARCHAR(60) NOT NULL,
+  "value" BIGINT NOT NULL,
+  PRIMARY KEY("name")
+);
+
+CREATE TABLE "event_daily_stat" (
+  "day" DATE NOT NULL,
+  "events_created" INT NOT NULL,
+  PRIMARY KEY("day")
+);
+
+-- Schema includes all migrations (see 'reminder/migrations.py')
+INSERT INTO "schema_version" ("version", "description", "applied")
+VALUES (1, 'Hot-path indexes', NOW()::timestamp),
+    (2, 'Dashboard statistics', NOW()::timestamp),
+    (3, 'Users lookup index', NOW()::timestamp),
+    (4, 'Recurring events', NOW()::timestamp),
+    (5, 'Shared mail config', NOW()::timestamp),
+    (6, 'Calendar feed secrets', NOW()::timestamp),
+    (7, 'Encrypted mail password', NOW()::timestamp),
+    (8, 'Shared cache versions', NOW()::timestamp);
 
 -- Add user's roles
 INSERT INTO "role" ("name", "description")
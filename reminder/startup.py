@@ -0,0 +1,44 @@
+"""
+App startup time report - how long importing the app package and each phase of 'create_app' took.
+"""
+import time
+from contextlib import contextmanager
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+class StartupTimer:
+    """
+    Measure duration of app startup phases.
+    """
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        phase_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - phase_started))
+
+    def add(self, name, duration):
+        self.phases.append((name, duration))
+
+    @property
+    def total(self):
+        return sum(duration for name, duration in self.phases)
+
+
+@click.command('startup-report')
+@with_appcontext
+def startup_report():
+    """
+    Show how long startup of the app took (the app is started by this command).
+    """
+    timer = current_app.startup_timer
+    for name, duration in timer.phases:
+        click.echo(f'{name:<15}{duration * 1000:>10.1f} ms')
+    click.echo(f'{"total":<15}{timer.total * 1000:>10.1f} ms')
@@ -20,6 +20,7 @@ document.getElementById("id-allday").onchange = function () {
         let date_notify = document.getElementById("id-date_notify");
         let time_notify = document.getElementById("id-time_notify");
         let users_notified = document.getElementById("id-notified_user");
+        let users_search = document.getElementById("id-notified_user_search");
         let date_start = document.getElementById("id-date_event_start");
         let notify_sent = document.getElementById("id-notify_sent");
         let date = new Date();
@@ -36,12 +37,14 @@ document.getElementById("id-allday").onchange = function () {
             date_notify.disabled = true;
             time_notify.disabled = true;
             users_notified.disabled = true;
+            users_search.disabled = true;
             notify_sent.disabled = true;
             }
         else {
             date_notify.disabled = false;
             time_notify.disabled = false;
             users_notified.disabled = false;
+            users_search.disabled = false;
             date_notify.required = true;
             time_notify.required = true;
             users_notified.required = true;
@@ -101,4 +104,15 @@ document.getElementById("id-allday").onchange = function () {
       on: 'Yes',
       off: 'No'
     });
-  })
\ No newline at end of file
+  })
+
+document.getElementById("id-repeat").onchange = function () {
+    let repeat_until = document.getElementById("id-repeat_until");
+    let repeat_count = document.getElementById("id-repeat_count");
+    repeat_until.disabled = !this.value;
+    repeat_count.disabled = !this.value;
+    if (!this.value) {
+        repeat_until.value = null;
+        repeat_count.value = null;
+        }
+};
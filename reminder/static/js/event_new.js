@@ -21,6 +21,7 @@ document.getElementById("id-allday").onchange = function () {
         let date_notify = document.getElementById("id-date_notify");
         let time_notify = document.getElementById("id-time_notify");
         let users_notified = document.getElementById("id-notified_user");
+        let users_search = document.getElementById("id-notified_user_search");
         let date = new Date();
         let day = date.getDate();
         let month = date.getMonth() + 1;
@@ -34,11 +35,13 @@ document.getElementById("id-allday").onchange = function () {
             date_notify.disabled = true;
             time_notify.disabled = true;
             users_notified.disabled = true;
+            users_search.disabled = true;
             }
         else {
             date_notify.disabled = false;
             time_notify.disabled = false;
             users_notified.disabled = false;
+            users_search.disabled = false;
             date_notify.value = today;
             time_notify.value = "08:00";
             if (date_start.value < date_notify.value) {
@@ -92,4 +95,15 @@ document.getElementById("id-date_event_start").onchange = validateTimeEvent;
 document.getElementById("id-date_event_stop").onchange = validateTimeEvent;
 document.getElementById("id-time_event_start").onchange = validateTimeEvent;
 document.getElementById("id-time_event_stop").onchange = validateTimeEvent;
-document.getElementById("id-date_notify").onchange = validateNotifyTimeEvent;
\ No newline at end of file
+document.getElementById("id-date_notify").onchange = validateNotifyTimeEvent;
+
+document.getElementById("id-repeat").onchange = function () {
+    let repeat_until = document.getElementById("id-repeat_until");
+    let repeat_count = document.getElementById("id-repeat_count");
+    repeat_until.disabled = !this.value;
+    repeat_count.disabled = !this.value;
+    if (!this.value) {
+        repeat_until.value = null;
+        repeat_count.value = null;
+        }
+};
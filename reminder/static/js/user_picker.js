@@ -0,0 +1,55 @@
+// Users to notify picker - users are fetched from API by username prefix (page by page), selected users are kept.
+(function () {
+    let users_notified = document.getElementById("id-notified_user");
+    let users_search = document.getElementById("id-notified_user_search");
+    let next_page = null;
+    let timer = null;
+
+    function loadUsers(query, after) {
+        let url = users_notified.dataset.url + "?q=" + encodeURIComponent(query);
+        if (after) {
+            url += "&after=" + encodeURIComponent(after);
+        }
+        fetch(url, {credentials: "same-origin"})
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                if (!after) {
+                    // New search - drop users that were not selected
+                    Array.from(users_notified.options).forEach(function (option) {
+                        if (!option.selected) {
+                            option.remove();
+                        }
+                    });
+                }
+                let present = new Set(Array.from(users_notified.options).map(function (option) { return option.value; }));
+                data.users.forEach(function (user) {
+                    if (!present.has(String(user.id))) {
+                        users_notified.add(new Option(user.username, user.id));
+                    }
+                });
+                next_page = data.next;
+            });
+    }
+
+    users_search.oninput = function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () { loadUsers(users_search.value, null); }, 250);
+    };
+    // Load next page when the list is scrolled to the bottom
+    users_notified.onscroll = function () {
+        if (next_page && this.scrollTop + this.clientHeight >= this.scrollHeight - 5) {
+            let after = next_page;
+            next_page = null;
+            loadUsers(users_search.value, after);
+        }
+    };
+    // First page is loaded when the picker is used for the first time
+    users_search.onfocus = function () {
+        if (!users_notified.options.length) {
+            loadUsers(users_search.value, null);
+        }
+    };
+    if (!users_notified.disabled) {
+        loadUsers("", null);
+    }
+})();
@@ -0,0 +1,179 @@
+import csv
+import datetime
+import io
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+
+from reminder.extensions import db
+from reminder.models import User, Role
+from reminder.admin.forms import ImportUserForm
+from reminder.event_import import ImportResult, MultiRowInsert, max_rows_per_insert, readable_records
+from reminder.dashboard_stats import apply_changes, ROLE_COUNTERS
+from reminder.mx_resolver import mx_resolver, MX_FOUND, MX_NO_DOMAIN, MX_NO_ANSWER
+from reminder.passwords import PasswordHasher
+
+
+# Columns of 'user' table filled by import
+USER_COLUMNS = ['username', 'email', 'password_hash', 'access_granted', 'role_id', 'creation_date',
+                'failed_login_attempts', 'pass_change_req']
+# Default values of optional CSV columns
+RECORD_DEFAULTS = {'role': 'user', 'access': 'True', 'pass_reset': 'True'}
+# Max number of concurrent MX record lookups
+MX_LOOKUP_THREADS = 32
+MX_ERRORS = {
+    MX_NO_DOMAIN: 'The domain "{}" does not exist',
+    MX_NO_ANSWER: 'The domain "{}" has no e-mail service',
+}
+
+
+def read_users_csv(stream):
+    """
+    Read users from CSV file (header row with 'username', 'email', 'password' and optional 'role', 'access'
+    and 'pass_reset' columns - the same values as in the new user form).
+    """
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for record in reader:
+        yield reader.line_num, record
+
+
+def record_to_formdata(record):
+    """
+    Convert record to form data (the same as sent by 'new_user' form).
+    """
+    formdata = MultiDict(RECORD_DEFAULTS)
+    for key, value in record.items():
+        if key and value is not None and value.strip() != '':
+            formdata[key] = value.strip()
+    formdata['password2'] = formdata.get('password', '')
+    return formdata
+
+
+def existing_values(column, values):
+    """
+    Return the values which already exist in the 'user' table column (one query).
+    """
+    if not values:
+        return set()
+    return {value for value, in db.session.query(column).filter(column.in_(values))}
+
+
+def check_domains(domains):
+    """
+    Look up MX records of e-mail domains concurrently. Return {domain: result}.
+    """
+    if not domains:
+        return {}
+    with ThreadPoolExecutor(min(MX_LOOKUP_THREADS, len(domains))) as executor:
+        return dict(zip(domains, executor.map(mx_resolver.lookup, domains)))
+
+
+def save_users(rows, inserter):
+    """
+    Insert batch of users in one transaction (with multi-row INSERT statements).
+    """
+    with db.engine.begin() as connection:
+        chunk = max_rows_per_insert(connection, len(inserter.columns))
+        for i in range(0, len(rows), chunk):
+            inserter.execute(connection, rows[i:i + chunk])
+        # Bulk inserts bypass session hooks - update dashboard counters explicitly.
+        counters = Counter(users=len(rows))
+        counters.update(ROLE_COUNTERS[row['role_id']] for row in rows if row['role_id'] in ROLE_COUNTERS)
+        apply_changes(connection, counters, {})
+
+
+def import_users(stream, batch_size=1000, threads=None):
+    """
+    Import users from CSV stream. Every record is validated with 'NewUserForm' rules, usernames and emails
+    must be unique. Passwords are hashed in parallel on all CPU cores. Invalid records are skipped and reported.
+    """
+    result = ImportResult()
+    # One form (without CSRF) is reused for all records.
+    form = ImportUserForm(formdata=MultiDict(), meta={'csrf': False})
+    inserter = MultiRowInsert(User.__table__, USER_COLUMNS)
+    roles = dict(Role.query.with_entities(Role.name, Role.id).all())
+    check_email_domain = current_app.config.get('CHECK_EMAIL_DOMAIN')
+    # Usernames and emails of the already imported records
+    seen_usernames, seen_emails = set(), set()
+    records = []
+
+    def flush():
+        # Validate records with the form rules
+        valid = []
+        for line_number, record in records:
+            form.process(formdata=record_to_formdata(record))
+            if not form.validate():
+                result.add_error(line_number, '; '.join(f'{getattr(form, field).label.text}: {", ".join(errors)}'
+                                                        for field, errors in form.errors.items()))
+                continue
+            valid.append((line_number, form.data.copy()))
+        records.clear()
+        # Check uniqueness of usernames and emails for the whole batch (one query each)
+        usernames = existing_values(User.username, {data['username'] for _, data in valid})
+        emails = existing_values(User.email, {data['email'] for _, data in valid})
+        domains = check_domains({data['email'].split('@')[1].lower() for _, data in valid}) \
+            if check_email_domain else {}
+        batch = []
+        for line_number, data in valid:
+            domain = data['email'].split('@')[1].lower()
+            if data['username'] in usernames or data['username'] in seen_usernames:
+                result.add_error(line_number, f'Username "{data["username"]}" already exists')
+            elif data['email'] in emails or data['email'] in seen_emails:
+                result.add_error(line_number, f'Email "{data["email"]}" already exists')
+            elif check_email_domain and domains[domain] != MX_FOUND:
+                result.add_error(line_number, MX_ERRORS.get(domains[domain], 'The domain "{}" could not be checked')
+                                 .format(domain))
+            else:
+                seen_usernames.add(data['username'])
+                seen_emails.add(data['email'])
+                batch.append(data)
+        if not batch:
+            return
+        now = datetime.datetime.utcnow()
+        password_hashes = hasher.hash_many([data['password'] for data in batch])
+        rows = [{
+            'username': data['username'],
+            'email': data['email'],
+            'password_hash': password_hash,
+            'access_granted': data['access'] == 'True',
+            'role_id': roles[data['role']],
+            'creation_date': now,
+            'failed_login_attempts': 0,
+            'pass_change_req': data['pass_reset'] == 'True',
+        } for data, password_hash in zip(batch, password_hashes)]
+        save_users(rows, inserter)
+        result.imported += len(rows)
+
+    with PasswordHasher(threads) as hasher:
+        for line_number, record in readable_records(read_users_csv(stream)):
+            if isinstance(record, str):
+                result.add_error(line_number, record)
+                continue
+            records.append((line_number, record))
+            if len(records) >= batch_size:
+                flush()
+        flush()
+    # Records are checked in stages - report errors in the file's order
+    result.errors.sort()
+    return result
+
+
+users_cli = AppGroup('users', help='Users management.')
+
+
+@users_cli.command('import')
+@click.argument('file', type=click.File('rb'))
+@click.option('--batch-size', default=1000, show_default=True, help='Number of users saved in one transaction.')
+@click.option('--threads', type=int, help='Number of password hashing threads (default: number of CPUs).')
+def import_command(file, batch_size, threads):
+    """
+    Import users from CSV file (columns: username, email, password and optional role, access, pass_reset).
+    """
+    result = import_users(file, batch_size, threads)
+    for line, message in result.errors:
+        click.echo(f'Line {line}: {message}', err=True)
+    click.echo(f'Imported users: {result.imported}, invalid records: {result.invalid}')
@@ -0,0 +1,71 @@
+"""
+Version counters shared by all app processes on all hosts (e.g. "events generation" - see 'reminder/events_cache.py').
+Counters are stored in 'cache_version' table and bumped with atomic UPDATEs, so concurrent bumps are never lost.
+Each counter starts from the current time in ms and every bump sets it to at least the current time, so the value
+is also a timestamp of the last change.
+The table is defined here (not in 'reminder/models.py'), because the models' session hooks bump the counters.
+"""
+import time
+
+from sqlalchemy import case
+from sqlalchemy.dialects import postgresql
+
+from reminder.extensions import db
+
+
+cache_version = db.Table('cache_version',
+                         db.Column('name', db.String(60), primary_key=True),
+                         db.Column('value', db.BigInteger, nullable=False))
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def insert_missing(connection, names, value):
+    """
+    Insert counters that aren't in the table yet (concurrent inserts of the same counter are ignored).
+    """
+    rows = [{'name': name, 'value': value} for name in names]
+    if connection.dialect.name == 'postgresql':
+        connection.execute(postgresql.insert(cache_version).on_conflict_do_nothing(), rows)
+    elif connection.dialect.name == 'sqlite':
+        connection.execute(cache_version.insert().prefix_with('OR IGNORE'), rows)
+    else:
+        existing = {row[0] for row in connection.execute(
+            db.select([cache_version.c.name]).where(cache_version.c.name.in_(names)))}
+        rows = [row for row in rows if row['name'] not in existing]
+        if rows:
+            connection.execute(cache_version.insert(), rows)
+
+
+def get_version(name):
+    """
+    Return current value of the counter (the counter is created if it doesn't exist yet).
+    Read from the primary db with a separate connection - the request's session may read from a lagging replica.
+    """
+    query = db.select([cache_version.c.value]).where(cache_version.c.name == name)
+    with db.engine.connect() as connection:
+        value = connection.execute(query).scalar()
+        if value is None:
+            with connection.begin():
+                insert_missing(connection, [name], now_ms())
+            value = connection.execute(query).scalar()
+    return value
+
+
+def bump_versions(names):
+    """
+    Increment counters (at least to the current time) - data cached for the previous versions is no longer used.
+    Separate connection - counters are bumped after commit, when the session can't emit SQL.
+    """
+    names = sorted(set(names))
+    if not names:
+        return
+    now = now_ms()
+    with db.engine.begin() as connection:
+        insert_missing(connection, names, 0)
+        connection.execute(cache_version.update()
+                           .where(cache_version.c.name.in_(names))
+                           .values(value=case([(cache_version.c.value + 1 > now, cache_version.c.value + 1)],
+                                              else_=now)))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+# Use a throwaway SQLite db (the path is relative to the project's dir) - set before the app loads '.env' file
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_DIR = os.path.relpath(tempfile.mkdtemp(), BASE_DIR)
+os.environ.update(APPLICATION_MODE='development', DEV_DATABASE_URL=f'sqlite:///{DB_DIR}/test.db',
+                  SECRET_KEY='test', SCHEDULER_ENABLED='False', PASSWORD_POOL_PROCESSES='0')
+
+from sqlalchemy import create_engine
+
+from config import database_url
+from reminder import create_app
+from reminder.extensions import db, cache
+from reminder.models import Role, User
+from reminder.identity_cache import identity_cache
+from reminder.events_cache import calendar_cache, events_list_cache
+
+
+_app = None
+
+
+def get_app():
+    """
+    Return the app shared by all test cases (extensions are initialized once per process).
+    """
+    global _app
+    if _app is None:
+        # App logs to the db on startup - tables are created first
+        db.metadata.create_all(create_engine(database_url()))
+        _app = create_app()
+        _app.config['WTF_CSRF_ENABLED'] = False
+        # Test's app context stays pushed during requests - each request gets a fresh session (as in production)
+        _app.before_request(db.session.remove)
+    return _app
+
+
+class AppTestCase(unittest.TestCase):
+    """
+    Test case with app context and empty db (except for roles) for every test.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.app = get_app()
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # Ids of deleted rows are reused by SQLite - per-process caches are cleared as well
+        cache.clear()
+        for process_cache in (identity_cache, calendar_cache, events_list_cache):
+            process_cache.clear()
+        self.admin_role = Role(name='admin')
+        self.user_role = Role(name='user')
+        db.session.add_all([self.admin_role, self.user_role])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        self.ctx.pop()
+
+    def add_user(self, username, password=None, role=None, **kwargs):
+        user = User(username=username, email=f'{username}@example.com', access_granted=True,
+                    role=role or self.user_role, password_hash='x', **kwargs)
+        if password:
+            user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+        # Loaded attributes stay available after the session is removed by a request
+        db.session.refresh(user)
+        return user
+
+    def log_in(self, user):
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
@@ -0,0 +1,129 @@
+import base64
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import Event
+from reminder.api.views import issue_token
+
+
+class ApiTestCase(AppTestCase):
+    """
+    REST API - token authentication, field selection, cursors, conditional requests and bulk changes.
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = self.add_user('bob', password='Secret1!x')
+        self.ann = self.add_user('ann')
+        self.start = datetime.datetime(2030, 1, 7, 10, 0)
+        self.event_ids = []
+        for i in range(5):
+            start = self.start + datetime.timedelta(days=i)
+            event = Event(title=f'Event {i}', details='', all_day_event=False, to_notify=False,
+                          time_event_start=start, time_event_stop=start + datetime.timedelta(hours=1),
+                          author=self.user)
+            db.session.add(event)
+            db.session.flush()
+            self.event_ids.append(event.id)
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {issue_token(self.user)}'}
+
+    def get(self, url, **kwargs):
+        return self.client.get(f'/api/v1{url}', headers=dict(self.headers, **kwargs.pop('headers', {})), **kwargs)
+
+    def bulk(self, data):
+        return self.client.post('/api/v1/events/bulk', json=data, headers=self.headers)
+
+    def stored_events(self):
+        db.session.expire_all()
+        return {event.id: event for event in Event.query}
+
+    def test_token_is_issued_for_valid_password(self):
+        credentials = base64.b64encode(b'bob:Secret1!x').decode()
+        response = self.client.post('/api/v1/tokens', headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(response.status_code, 201)
+        self.headers = {'Authorization': f'Bearer {response.json["token"]}'}
+        self.assertEqual(self.get('/events?list=all').status_code, 200)
+
+        credentials = base64.b64encode(b'bob:wrong').decode()
+        response = self.client.post('/api/v1/tokens', headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Basic realm="api"')
+
+    def test_valid_token_is_required(self):
+        response = self.client.get('/api/v1/events')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json['error'], 'Unauthorized')
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Bearer realm="api"')
+        self.assertEqual(self.get('/events', headers={'Authorization': 'Bearer invalid'}).status_code, 401)
+
+    def test_token_is_revoked_by_password_change(self):
+        self.user.set_password('Changed1!x')
+        db.session.commit()
+        self.assertEqual(self.get('/events').status_code, 401)
+
+    def test_selected_fields_are_returned(self):
+        response = self.get(f'/events/{self.event_ids[0]}?fields=id,title,author')
+        self.assertEqual(response.json, {'id': self.event_ids[0], 'title': 'Event 0', 'author': 'bob'})
+        response = self.get('/events?fields=id,unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json['message'], 'Unknown fields: unknown.')
+
+    def test_cursors_walk_through_all_events(self):
+        ids, url = [], '/events?list=all&fields=id&limit=2'
+        pages = []
+        response = self.get(url)
+        while True:
+            pages.append(response.json)
+            ids.extend(event['id'] for event in response.json['events'])
+            if response.json['next'] is None:
+                break
+            response = self.get(f'{url}&after={response.json["next"]}')
+        self.assertEqual(ids, self.event_ids)
+        self.assertEqual(len(pages), 3)
+        response = self.get(f'{url}&before={pages[-1]["prev"]}')
+        self.assertEqual(response.json['events'], pages[-2]['events'])
+        self.assertEqual(self.get(f'{url}&after=invalid').status_code, 400)
+
+    def test_unchanged_events_are_not_modified(self):
+        response = self.get('/events?list=all')
+        etag = response.headers['ETag']
+        self.assertEqual(self.get('/events?list=all', headers={'If-None-Match': etag}).status_code, 304)
+        response = self.client.patch(f'/api/v1/events/{self.event_ids[0]}', json={'title': 'Changed'},
+                                     headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = self.get('/events?list=all', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.json['events'][0]['title'], 'Changed')
+
+    def test_bulk_changes_are_applied_together(self):
+        response = self.bulk({'create': [{'title': 'New', 'start': '2030-02-01T10:00', 'stop': '2030-02-01T11:00',
+                                          'notify': '2030-02-01T09:00', 'notified_users': ['ann']}],
+                              'update': [{'id': self.event_ids[0], 'title': 'Changed'}],
+                              'delete': [self.event_ids[1]]})
+        self.assertEqual(response.status_code, 200)
+        created_id = response.json['created'][0]['id']
+        events = self.stored_events()
+        self.assertEqual([user.username for user in events[created_id].notified_users], ['ann'])
+        self.assertEqual(events[self.event_ids[0]].title, 'Changed')
+        self.assertFalse(events[self.event_ids[1]].is_active)
+
+    def test_invalid_bulk_operation_cancels_all_changes(self):
+        response = self.bulk({'create': [{'title': 'New', 'start': '2030-02-01T10:00'}],
+                              'update': [{'id': self.event_ids[0], 'title': 'Changed'},
+                                         {'id': self.event_ids[1], 'stop': '2020-01-01T10:00'}],
+                              'delete': [self.event_ids[2], 0]})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(set(response.json['errors']), {'update', 'delete'})
+        self.assertEqual(set(response.json['errors']['update']), {'1'})
+        self.assertEqual(response.json['errors']['delete'], {'1': {'id': ['Event does not exist']}})
+        events = self.stored_events()
+        self.assertEqual(len(events), 5)
+        self.assertEqual(events[self.event_ids[0]].title, 'Event 0')
+        self.assertTrue(events[self.event_ids[2]].is_active)
+
+
+if __name__ == '__main__':
+    unittest.main()
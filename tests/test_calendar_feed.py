@@ -0,0 +1,37 @@
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import Event
+from reminder.calendar_feed import feed_version
+
+
+class CalendarFeedTestCase(AppTestCase):
+    """
+    Invalidation of users' cached calendar feeds.
+    """
+    def setUp(self):
+        super().setUp()
+        self.author = self.add_user('author', role=self.admin_role)
+        self.ann = self.add_user('ann')
+        start = datetime.datetime(2030, 1, 7, 10, 0)
+        event = Event(title='Standup', details='Daily standup', all_day_event=False, to_notify=True,
+                      time_event_start=start, time_event_stop=start + datetime.timedelta(minutes=15),
+                      time_notify=start, author=self.author, notified_users=[self.ann])
+        db.session.add(event)
+        db.session.commit()
+        self.event_id, self.user_ids = event.id, (self.author.id, self.ann.id)
+        db.session.remove()
+
+    def test_deleted_event_changes_feeds_of_notified_users(self):
+        versions = [feed_version(user_id) for user_id in self.user_ids]
+        # Notified users are not loaded by the session
+        db.session.delete(Event.query.get(self.event_id))
+        db.session.commit()
+        for user_id, version in zip(self.user_ids, versions):
+            self.assertGreater(feed_version(user_id), version)
+
+
+if __name__ == '__main__':
+    unittest.main()
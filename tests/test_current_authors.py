@@ -0,0 +1,45 @@
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import Event
+from reminder.current_authors import authors_version
+
+
+class CurrentAuthorsTestCase(AppTestCase):
+    """
+    Invalidation of cached map of current events' authors.
+    """
+    def setUp(self):
+        super().setUp()
+        start = datetime.datetime(2030, 1, 7, 10, 0)
+        self.event = Event(title='Standup', details='Daily standup', all_day_event=False, to_notify=True,
+                           time_event_start=start, time_event_stop=start + datetime.timedelta(minutes=15),
+                           time_notify=start, author=self.add_user('bob'))
+        db.session.add(self.event)
+        db.session.commit()
+
+    def test_sent_notification_keeps_the_map(self):
+        version = authors_version()
+        self.event.notification_sent = True
+        self.event.title = 'Daily standup'
+        db.session.commit()
+        self.assertEqual(authors_version(), version)
+
+    def test_changes_used_by_the_map_invalidate_it(self):
+        for attr, value in (('is_active', False), ('time_event_stop', datetime.datetime(2030, 1, 8))):
+            version = authors_version()
+            setattr(self.event, attr, value)
+            db.session.commit()
+            self.assertGreater(authors_version(), version, attr)
+
+    def test_deleted_event_invalidates_the_map(self):
+        version = authors_version()
+        db.session.delete(self.event)
+        db.session.commit()
+        self.assertGreater(authors_version(), version)
+
+
+if __name__ == '__main__':
+    unittest.main()
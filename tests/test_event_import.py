@@ -0,0 +1,55 @@
+import io
+import unittest
+from unittest import mock
+
+from tests.base import AppTestCase
+from reminder import event_import
+from reminder.event_import import import_events
+from reminder.models import Event
+
+
+HEADER = 'title,details,allday,date_event_start,date_event_stop,to_notify,date_notify,notified_users\n'
+
+
+def csv_stream(*lines):
+    return io.BytesIO((HEADER + ''.join(f'{line}\n' for line in lines)).encode())
+
+
+def event_line(number, notified):
+    return f'Event {number},Details {number},True,2030-01-0{number},2030-01-0{number},True,2030-01-01,{notified}'
+
+
+class EventImportTestCase(AppTestCase):
+    """
+    Bulk import of events.
+    """
+    def setUp(self):
+        super().setUp()
+        self.author = self.add_user('author', role=self.admin_role)
+        self.ann = self.add_user('ann')
+        self.bob = self.add_user('bob')
+
+    def test_events_are_saved_with_their_notified_users(self):
+        # Several INSERT statements per batch and several batches
+        with mock.patch.object(event_import, 'max_rows_per_insert', return_value=2):
+            result = import_events(csv_stream(event_line(1, 'ann'), event_line(2, 'bob'), event_line(3, 'ann;bob'),
+                                              event_line(4, 'bob'), event_line(5, 'ann')),
+                                   'csv', self.author, batch_size=3)
+        self.assertEqual((result.imported, result.errors), (5, []))
+        notified = {event.title: sorted(user.username for user in event.notified_users) for event in Event.query}
+        self.assertEqual(notified, {'Event 1': ['ann'], 'Event 2': ['bob'], 'Event 3': ['ann', 'bob'],
+                                    'Event 4': ['bob'], 'Event 5': ['ann']})
+
+    def test_search_index_is_synced_once(self):
+        with mock.patch.object(self.app, 'elasticsearch', True), \
+                mock.patch.object(event_import, 'sync_search_index') as sync_search_index:
+            import_events(csv_stream(event_line(1, 'ann'), event_line(2, 'bob'), event_line(3, 'ann')),
+                          'csv', self.author, batch_size=2)
+        sync_search_index.assert_called_once()
+        documents = dict(sync_search_index.call_args.args[0])
+        self.assertEqual({event.id: event.title for event in Event.query},
+                         {event_id: document['title'] for event_id, document in documents.items()})
+
+
+if __name__ == '__main__':
+    unittest.main()
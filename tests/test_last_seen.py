@@ -0,0 +1,35 @@
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import User
+from reminder.last_seen import LastSeenTracker
+
+
+class LastSeenTestCase(AppTestCase):
+    """
+    Write-behind buffer of users' 'last seen' timestamps.
+    """
+    def test_flush_writes_buffered_timestamps(self):
+        user = self.add_user('bob')
+        seen = datetime.datetime(2030, 1, 1, 12, 0)
+        tracker = LastSeenTracker(self.app)
+        tracker.record(user.id, seen)
+        self.assertEqual(tracker.flush(), 1)
+        db.session.expire_all()
+        self.assertEqual(User.query.get(user.id).last_seen, seen)
+
+    def test_older_timestamp_does_not_overwrite_newer_one(self):
+        newer = datetime.datetime(2030, 1, 1, 12, 0)
+        user = self.add_user('bob', last_seen=newer)
+        # E.g. exit flush of a process which saw the user earlier than another process
+        tracker = LastSeenTracker(self.app)
+        tracker.record(user.id, newer - datetime.timedelta(minutes=5))
+        tracker.flush()
+        db.session.expire_all()
+        self.assertEqual(User.query.get(user.id).last_seen, newer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import User
+from reminder.login_throttle import login_throttle
+
+
+class LoginThrottleTestCase(AppTestCase):
+    """
+    Throttling of failed logins per account and per client IP.
+    """
+    def setUp(self):
+        super().setUp()
+        login_throttle._failures.clear()
+        self.user = self.add_user('bob', password='Secret1!x')
+
+    def tearDown(self):
+        login_throttle.ip_limit = self.app.config['LOGIN_IP_MAX_FAILURES']
+        super().tearDown()
+
+    def log_in_as(self, password, ip='10.0.0.1', **kwargs):
+        return self.client.post('/auth/login', data={'username': 'bob', 'password': password},
+                                environ_base={'REMOTE_ADDR': ip}, **kwargs)
+
+    def stored_user(self):
+        db.session.expire_all()
+        return User.query.get(self.user.id)
+
+    def test_account_is_blocked_when_limit_is_reached(self):
+        for _ in range(self.app.config['LOGIN_USER_MAX_FAILURES'] - 1):
+            self.log_in_as('wrong')
+        # Failures below the limit are not written to the db
+        self.assertEqual((self.stored_user().access_granted, self.stored_user().failed_login_attempts), (True, 0))
+        self.log_in_as('wrong')
+        self.assertEqual((self.stored_user().access_granted, self.stored_user().failed_login_attempts),
+                         (False, self.app.config['LOGIN_USER_MAX_FAILURES']))
+
+    def test_successful_login_resets_failures(self):
+        for _ in range(self.app.config['LOGIN_USER_MAX_FAILURES'] - 1):
+            self.log_in_as('wrong')
+        self.log_in_as('Secret1!x')
+        self.client.get('/auth/logout')
+        self.log_in_as('wrong')
+        self.assertTrue(self.stored_user().access_granted)
+
+    def test_client_ip_is_throttled(self):
+        login_throttle.ip_limit = 2
+        self.client.post('/auth/login', data={'username': 'nobody', 'password': 'x'},
+                         environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.client.post('/auth/login', data={'username': 'nobody', 'password': 'x'},
+                         environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        response = self.log_in_as('Secret1!x', follow_redirects=True)
+        self.assertIn(b'Too many failed login attempts', response.data)
+        # Other clients can still log in
+        response = self.log_in_as('Secret1!x', ip='10.0.0.2')
+        self.assertEqual(response.headers['Location'], 'http://localhost/index')
+
+    def test_clients_behind_proxy_are_throttled_separately(self):
+        login_throttle.ip_limit = 2
+        wsgi_app = self.app.wsgi_app
+        self.app.wsgi_app = ProxyFix(wsgi_app, x_for=1)
+        try:
+            for _ in range(2):
+                self.client.post('/auth/login', data={'username': 'nobody', 'password': 'x'},
+                                 environ_base={'REMOTE_ADDR': '172.16.0.1'},
+                                 headers={'X-Forwarded-For': '203.0.113.1'})
+            response = self.log_in_as('Secret1!x', ip='172.16.0.1', headers={'X-Forwarded-For': '203.0.113.2'})
+        finally:
+            self.app.wsgi_app = wsgi_app
+        self.assertEqual(response.headers['Location'], 'http://localhost/index')
+        self.assertTrue(login_throttle.ip_blocked('203.0.113.1'))
+        self.assertFalse(login_throttle.ip_blocked('172.16.0.1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from unittest import mock
+
+import dns.exception
+from dns import resolver
+
+from reminder.mx_resolver import MxResolver, MX_UNAVAILABLE
+
+
+class MxResolverTestCase(unittest.TestCase):
+    """
+    Cache of e-mail domains' MX record lookups.
+    """
+    def test_temporary_failure_is_not_cached(self):
+        mx = MxResolver()
+        with mock.patch.object(resolver, 'resolve', side_effect=dns.exception.Timeout) as resolve:
+            self.assertEqual(mx.lookup('example.com'), MX_UNAVAILABLE)
+            self.assertEqual(mx.lookup('example.com'), MX_UNAVAILABLE)
+        self.assertEqual(resolve.call_count, 2)
+
+    def test_other_dns_error_is_cached(self):
+        mx = MxResolver()
+        with mock.patch.object(resolver, 'resolve', side_effect=dns.exception.SyntaxError) as resolve:
+            self.assertEqual(mx.lookup('example.com'), MX_UNAVAILABLE)
+            self.assertEqual(mx.lookup('example.com'), MX_UNAVAILABLE)
+        self.assertEqual(resolve.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
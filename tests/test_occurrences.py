@@ -0,0 +1,43 @@
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import Event, EventException
+
+
+class OccurrenceTestCase(AppTestCase):
+    """
+    Skipping and restoring occurrences of recurring event.
+    """
+    def setUp(self):
+        super().setUp()
+        user = self.add_user('bob')
+        self.start = datetime.datetime(2030, 1, 7, 10, 0)
+        self.event = Event(title='Standup', details='Daily standup', all_day_event=False, to_notify=False,
+                           time_event_start=self.start, time_event_stop=self.start + datetime.timedelta(minutes=15),
+                           author=user, recurrence='FREQ=DAILY;COUNT=10')
+        db.session.add(self.event)
+        db.session.commit()
+        self.log_in(user)
+        self.url = f'/event/{self.event.id}/occurrence/{(self.start + datetime.timedelta(days=2)).isoformat()}'
+
+    def test_skipped_occurrence_can_be_viewed_and_restored(self):
+        response = self.client.post(self.url, data={'skip-btn': 'Skip this occurrence'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(EventException.query.one().cancelled)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'The occurrence has been skipped.', response.data)
+        self.assertIn(b'Restore this occurrence', response.data)
+        self.assertIn(b'value="Standup"', response.data)
+
+        response = self.client.post(self.url, data={'restore-btn': 'Restore this occurrence'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(EventException.query.count(), 0)
+        self.assertIn(b'Skip this occurrence', self.client.get(self.url).data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import datetime
+import unittest
+
+from tests.base import AppTestCase
+from reminder.extensions import db
+from reminder.models import Event
+from reminder.pagination import keyset_paginate, encode_cursor, decode_cursor
+
+
+class KeysetPaginationTestCase(AppTestCase):
+    """
+    Keyset pagination - walking through all pages in both directions.
+    """
+    def setUp(self):
+        super().setUp()
+        author = self.add_user('bob')
+        start = datetime.datetime(2030, 1, 7, 10, 0)
+        # Equal sort key values and NULLs (events without notification)
+        notify_times = [None, start, None, start + datetime.timedelta(days=1), start, None, None]
+        for i, time_notify in enumerate(notify_times):
+            db.session.add(Event(title=f'Event {i}', all_day_event=False, to_notify=time_notify is not None,
+                                 time_event_start=start + datetime.timedelta(days=i), time_event_stop=start,
+                                 time_notify=time_notify, author=author))
+        db.session.commit()
+
+    def walk(self, sort_keys, descending=False):
+        """
+        Return ids of events on all pages - walking forwards, then backwards from the last page.
+        """
+        forwards, pages = [], []
+        page = keyset_paginate(Event.query, sort_keys, 2, descending=descending)
+        while True:
+            pages.append(page)
+            forwards.extend(event.id for event in page.items)
+            if not page.has_next:
+                break
+            page = keyset_paginate(Event.query, sort_keys, 2, after=page.next_cursor, descending=descending)
+        backwards = [event.id for event in pages[-1].items]
+        page = pages[-1]
+        while page.has_prev:
+            page = keyset_paginate(Event.query, sort_keys, 2, before=page.prev_cursor, descending=descending)
+            backwards[:0] = [event.id for event in page.items]
+        return forwards, backwards
+
+    def expected(self, sort_keys, descending=False):
+        order = [key.desc() for key in sort_keys] if descending else sort_keys
+        return [event.id for event in Event.query.order_by(*order)]
+
+    def test_unique_sort_key(self):
+        for descending in (False, True):
+            forwards, backwards = self.walk([Event.id], descending)
+            self.assertEqual(forwards, self.expected([Event.id], descending))
+            self.assertEqual(backwards, forwards)
+
+    def test_nullable_sort_key(self):
+        sort_keys = [Event.time_notify, Event.id]
+        for descending in (False, True):
+            forwards, backwards = self.walk(sort_keys, descending)
+            self.assertEqual(forwards, self.expected(sort_keys, descending))
+            self.assertEqual(backwards, forwards)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            keyset_paginate(Event.query, [Event.id], 2, after='not a cursor')
+        with self.assertRaises(ValueError):
+            keyset_paginate(Event.query, [Event.time_notify, Event.id], 2, after=encode_cursor([1]))
+
+    def test_cursor_keeps_datetime(self):
+        values = [datetime.datetime(2030, 1, 7, 10, 0), None, 5]
+        self.assertEqual(decode_cursor(encode_cursor(values)), values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import io
+import unittest
+from unittest import mock
+
+from tests.base import AppTestCase
+from reminder.models import User
+from reminder.mx_resolver import mx_resolver, MX_FOUND, MX_NO_DOMAIN
+from reminder.user_import import import_users
+
+
+HEADER = 'username,email,password,role,access,pass_reset\n'
+
+
+def csv_stream(*lines):
+    return io.BytesIO((HEADER + ''.join(f'{line}\n' for line in lines)).encode())
+
+
+class UserImportTestCase(AppTestCase):
+    """
+    Bulk import of users from CSV file.
+    """
+    def test_users_are_imported_in_batches(self):
+        lines = [f'user{i},user{i}@example.com,Secret{i}!x,user,True,False' for i in range(5)]
+        result = import_users(csv_stream(*lines), batch_size=2, threads=2)
+        self.assertEqual((result.imported, result.errors), (5, []))
+        user = User.query.filter_by(username='user3').one()
+        self.assertTrue(user.check_password('Secret3!x'))
+        self.assertEqual((user.role.name, user.access_granted, user.pass_change_req), ('user', True, False))
+
+    def test_duplicates_are_reported(self):
+        self.add_user('taken')
+        result = import_users(csv_stream('taken,new@example.com,Secret1!x,user,True,True',
+                                         'fresh,taken@example.com,Secret1!x,user,True,True',
+                                         'first,first@example.com,Secret1!x,user,True,True',
+                                         # Duplicates of the record above - in the next batch
+                                         'first,other@example.com,Secret1!x,user,True,True',
+                                         'second,first@example.com,Secret1!x,user,True,True'),
+                              batch_size=3)
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.errors, [(2, 'Username "taken" already exists'),
+                                         (3, 'Email "taken@example.com" already exists'),
+                                         (5, 'Username "first" already exists'),
+                                         (6, 'Email "first@example.com" already exists')])
+
+    def test_invalid_records_are_reported(self):
+        result = import_users(csv_stream('ab,not-an-email,weak,user,True,True',
+                                         'valid,valid@example.com,Secret1!x,user,True,True'))
+        self.assertEqual(result.imported, 1)
+        self.assertEqual([line for line, _ in result.errors], [2])
+
+    def test_unreadable_file_is_reported(self):
+        result = import_users(io.BytesIO(HEADER.encode() + b'\xff\xfe,x,y\n'))
+        self.assertEqual(result.imported, 0)
+        self.assertEqual(result.errors[0][1], 'The file is not UTF-8 encoded text')
+
+    def test_email_domains_are_checked_once_per_domain(self):
+        results = {'example.com': MX_FOUND, 'nowhere.test': MX_NO_DOMAIN}
+        self.app.config['CHECK_EMAIL_DOMAIN'] = True
+        try:
+            with mock.patch.object(mx_resolver, 'lookup', side_effect=results.get) as lookup:
+                result = import_users(csv_stream('one,one@example.com,Secret1!x,user,True,True',
+                                                 'two,two@nowhere.test,Secret1!x,user,True,True',
+                                                 'three,three@Example.com,Secret1!x,user,True,True'))
+        finally:
+            self.app.config['CHECK_EMAIL_DOMAIN'] = False
+        self.assertEqual(sorted(call.args[0] for call in lookup.call_args_list), ['example.com', 'nowhere.test'])
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(result.errors, [(3, 'The domain "nowhere.test" does not exist')])
+
+
+if __name__ == '__main__':
+    unittest.main()
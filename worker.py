@@ -0,0 +1,42 @@
+import signal
+import threading
+
+from reminder import create_app
+from reminder.extensions import scheduler
+from reminder.admin.views import log_retention_job, schedule_search_reindex, LOG_RETENTION_JOB_ID
+
+
+# Worker process runs scheduled jobs (notification service and maintenance) without serving HTTP.
+# Web processes should be started with 'SCHEDULER_ENABLED=False'.
+app = create_app(worker=True)
+
+
+def register_maintenance_jobs():
+    """
+    Add (or remove) maintenance jobs according to app config.
+    """
+    schedule_search_reindex()
+    if app.config['LOG_RETENTION_DAYS'] > 0:
+        scheduler.add_job(func=log_retention_job, trigger='interval', replace_existing=True, max_instances=1,
+                          days=1, id=LOG_RETENTION_JOB_ID)
+    elif scheduler.get_job(LOG_RETENTION_JOB_ID):
+        scheduler.remove_job(LOG_RETENTION_JOB_ID)
+
+
+def run():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    with app.app_context():
+        register_maintenance_jobs()
+        app.logger_general.info('Reminder worker startup')
+        # Jobs added, changed or removed by web processes are saved in the shared job store only - the scheduler
+        # is woken up periodically to pick them up.
+        while not stop.wait(app.config['SCHEDULER_POLL_INTERVAL']):
+            scheduler.scheduler.wakeup()
+        scheduler.shutdown()
+        app.logger_general.info('Reminder worker shutdown')
+
+
+if __name__ == "__main__":
+    run()